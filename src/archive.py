@@ -0,0 +1,197 @@
+"""
+Модуль холодного архива забаненных пользователей.
+Архив состоит из неизменяемых сегментов: отсортированные ID разбиты на блоки,
+каждый блок хранится в виде сжатых разностей соседних ID, а небольшой индекс
+(первый и последний ID блока) позволяет читать только нужный блок.
+"""
+import bisect
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+SEGMENT_MAGIC = b'SRBA'
+SEGMENT_VERSION = 1
+# Заголовок сегмента: сигнатура, версия, число блоков
+SEGMENT_HEADER_FORMAT = '<4sII'
+# Запись индекса: первый ID, последний ID, смещение блока, длина блока, число ID
+INDEX_ENTRY_FORMAT = '<qqQII'
+BLOCK_SIZE = 4096
+BLOCK_CACHE_SIZE = 64
+
+
+class ArchiveSegment:
+    def __init__(self, path: Path):
+        """
+        Открыть сегмент архива для чтения.
+        
+        Args:
+            path: путь к файлу сегмента
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        header_size = struct.calcsize(SEGMENT_HEADER_FORMAT)
+        magic, version, block_count = struct.unpack_from(SEGMENT_HEADER_FORMAT, self._mmap, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Некорректный сегмент архива: {path}")
+        
+        entry_size = struct.calcsize(INDEX_ENTRY_FORMAT)
+        self.index: List[Tuple[int, int, int, int, int]] = [
+            struct.unpack_from(INDEX_ENTRY_FORMAT, self._mmap, header_size + i * entry_size)
+            for i in range(block_count)
+        ]
+        self._first_ids = [entry[0] for entry in self.index]
+        self.count = sum(entry[4] for entry in self.index)
+    
+    def close(self):
+        """Закрыть файл сегмента."""
+        self._mmap.close()
+    
+    def read_block(self, block_index: int) -> array:
+        """Прочитать и распаковать блок ID."""
+        _, _, offset, length, _ = self.index[block_index]
+        deltas = array('q')
+        deltas.frombytes(zlib.decompress(self._mmap[offset:offset + length]))
+        ids = array('q')
+        current = 0
+        for delta in deltas:
+            current += delta
+            ids.append(current)
+        return ids
+    
+    def find_block(self, user_id: int) -> int:
+        """
+        Найти блок, который может содержать ID.
+        
+        Returns:
+            Номер блока или -1, если ID вне диапазонов блоков
+        """
+        block_index = bisect.bisect_right(self._first_ids, user_id) - 1
+        if block_index < 0 or user_id > self.index[block_index][1]:
+            return -1
+        return block_index
+    
+    def __iter__(self) -> Iterator[int]:
+        """Перебрать все ID сегмента по возрастанию."""
+        for block_index in range(len(self.index)):
+            yield from self.read_block(block_index)
+
+
+def write_segment(path: Path, user_ids: array):
+    """
+    Записать сегмент архива атомарной заменой.
+    
+    Args:
+        path: путь к файлу сегмента
+        user_ids: отсортированные по возрастанию ID без повторов
+    """
+    blocks = []
+    for start in range(0, len(user_ids), BLOCK_SIZE):
+        chunk = user_ids[start:start + BLOCK_SIZE]
+        deltas = array('q', [chunk[0]])
+        deltas.extend(chunk[i] - chunk[i - 1] for i in range(1, len(chunk)))
+        blocks.append((chunk[0], chunk[-1], len(chunk), zlib.compress(deltas.tobytes(), 6)))
+    
+    header_size = struct.calcsize(SEGMENT_HEADER_FORMAT)
+    offset = header_size + struct.calcsize(INDEX_ENTRY_FORMAT) * len(blocks)
+    
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack(SEGMENT_HEADER_FORMAT, SEGMENT_MAGIC, SEGMENT_VERSION, len(blocks)))
+        for first_id, last_id, count, data in blocks:
+            f.write(struct.pack(INDEX_ENTRY_FORMAT, first_id, last_id, offset, len(data), count))
+            offset += len(data)
+        for _, _, _, data in blocks:
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BanArchive:
+    def __init__(self, directory: str):
+        """
+        Инициализация архива.
+        
+        Args:
+            directory: каталог с сегментами архива
+        """
+        self.directory = Path(directory)
+        self.segments: List[ArchiveSegment] = []
+        self._block_cache: 'OrderedDict[Tuple[int, int], array]' = OrderedDict()
+    
+    def load(self):
+        """Открыть все сегменты из каталога архива."""
+        self.close()
+        if not self.directory.is_dir():
+            return
+        for path in sorted(self.directory.glob('segment-*.bin')):
+            self.segments.append(ArchiveSegment(path))
+    
+    def close(self):
+        """Закрыть все сегменты."""
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self._block_cache.clear()
+    
+    @property
+    def count(self) -> int:
+        """Количество ID во всех сегментах (с учетом возможных повторов между сегментами)."""
+        return sum(segment.count for segment in self.segments)
+    
+    def add_segment(self, user_ids: array) -> int:
+        """
+        Записать новый сегмент с указанными ID и подключить его.
+        
+        Args:
+            user_ids: отсортированные по возрастанию ID без повторов
+            
+        Returns:
+            Количество записанных ID
+        """
+        if not user_ids:
+            return 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        number = len(self.segments) + 1
+        path = self.directory / f"segment-{number:06d}.bin"
+        while path.exists():
+            number += 1
+            path = self.directory / f"segment-{number:06d}.bin"
+        write_segment(path, user_ids)
+        self.segments.append(ArchiveSegment(path))
+        return len(user_ids)
+    
+    def __contains__(self, user_id: int) -> bool:
+        """Проверить, есть ли ID в архиве."""
+        for segment_index, segment in enumerate(self.segments):
+            block_index = segment.find_block(user_id)
+            if block_index < 0:
+                continue
+            
+            key = (segment_index, block_index)
+            block = self._block_cache.get(key)
+            if block is None:
+                block = segment.read_block(block_index)
+                self._block_cache[key] = block
+                if len(self._block_cache) > BLOCK_CACHE_SIZE:
+                    self._block_cache.popitem(last=False)
+            else:
+                self._block_cache.move_to_end(key)
+            
+            position = bisect.bisect_left(block, user_id)
+            if position < len(block) and block[position] == user_id:
+                return True
+        return False
+    
+    def __iter__(self) -> Iterator[int]:
+        """Перебрать все ID архива."""
+        for segment in self.segments:
+            yield from segment
@@ -0,0 +1,150 @@
+"""
+Модуль резервного копирования базы данных.
+Копия снимается онлайн через backup API SQLite одним шагом внутри транзакции
+чтения в отдельном потоке и отдельным соединением. В режиме WAL это
+согласованный снимок: обработчики бота продолжают писать, а копирование
+не начинается заново из-за их записей.
+"""
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = 'backup-'
+
+
+def _copy_database(db_path: str, target_path: Path):
+    """
+    Скопировать согласованный снимок базы через backup API SQLite.
+    
+    Копирование по частям начинается заново после каждой записи другого соединения
+    и при постоянной записи бота не завершается. Поэтому копия снимается одним шагом
+    (pages=-1) внутри открытой транзакции чтения: в режиме WAL она видит один снимок
+    и не мешает писателям.
+    """
+    source = sqlite3.connect(f"{Path(db_path).absolute().as_uri()}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    try:
+        source.execute("PRAGMA busy_timeout = 5000")
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=-1)
+        source.rollback()
+    finally:
+        target.close()
+        source.close()
+
+
+def _check_integrity(path: Path):
+    """
+    Проверить целостность копии.
+    
+    Raises:
+        sqlite3.DatabaseError: если копия повреждена
+    """
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f"Резервная копия не прошла проверку целостности: {result}")
+
+
+def _compress(path: Path) -> Path:
+    """Сжать файл в gzip и удалить исходный."""
+    compressed_path = path.with_name(f"{path.name}.gz")
+    with open(path, 'rb') as source, gzip.open(compressed_path, 'wb') as target:
+        shutil.copyfileobj(source, target)
+    path.unlink()
+    return compressed_path
+
+
+def list_backups(backup_dir: str) -> List[Path]:
+    """Получить готовые резервные копии от старых к новым."""
+    directory = Path(backup_dir)
+    if not directory.is_dir():
+        return []
+    return sorted(
+        path for path in directory.glob(f"{BACKUP_PREFIX}*")
+        if path.is_dir() and path.suffix != '.tmp'
+    )
+
+
+def rotate_backups(backup_dir: str, keep: int) -> int:
+    """
+    Удалить старые резервные копии, оставив keep последних.
+    
+    Returns:
+        Количество удаленных копий
+    """
+    backups = list_backups(backup_dir)
+    stale = backups[:-keep] if keep > 0 else []
+    for path in stale:
+        shutil.rmtree(path)
+    return len(stale)
+
+
+def create_backup(
+    db_path: str,
+    backup_dir: str,
+    keep: int = 7,
+    compress: bool = False,
+    archive_dir: Optional[str] = None
+) -> Path:
+    """
+    Создать проверенную резервную копию базы данных.
+    
+    Копия собирается во временном каталоге и переименовывается только после
+    проверки целостности, поэтому в каталоге копий не бывает недописанных копий.
+    Сегменты холодного архива неизменяемы и копируются как есть.
+    
+    Args:
+        db_path: путь к файлу базы данных
+        backup_dir: каталог резервных копий
+        keep: сколько последних копий хранить (0 - не удалять старые)
+        compress: сжимать ли копию базы в gzip
+        archive_dir: каталог холодного архива забаненных (None - не копировать)
+        
+    Returns:
+        Путь к каталогу созданной копии
+        
+    Raises:
+        sqlite3.DatabaseError: если копия не прошла проверку целостности
+    """
+    directory = Path(backup_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    
+    name = f"{BACKUP_PREFIX}{datetime.utcnow():%Y%m%d-%H%M%S}"
+    backup_path = directory / name
+    number = 1
+    while backup_path.exists():
+        number += 1
+        backup_path = directory / f"{name}-{number}"
+    
+    tmp_path = backup_path.with_suffix('.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+    try:
+        target_path = tmp_path / Path(db_path).name
+        _copy_database(db_path, target_path)
+        _check_integrity(target_path)
+        if compress:
+            _compress(target_path)
+        
+        if archive_dir and Path(archive_dir).is_dir():
+            shutil.copytree(archive_dir, tmp_path / 'archive', ignore=shutil.ignore_patterns('*.tmp'))
+        
+        os.replace(tmp_path, backup_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    
+    rotate_backups(backup_dir, keep)
+    return backup_path
@@ -0,0 +1,83 @@
+"""
+Модуль микропакетной обработки запросов.
+Одновременные запросы из разных обработчиков копятся несколько миллисекунд
+и выполняются одним вызовом обработчика пачки, например одним запросом к БД
+на всю волну вступлений вместо запроса на каждого участника.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        delay_ms: float = 5,
+        max_size: int = 100
+    ):
+        """
+        Создать координатор пачек.
+        
+        Args:
+            handler: обработчик пачки; возвращает результаты в порядке элементов
+            delay_ms: сколько ждать остальных запросов после первого в пачке
+            max_size: размер пачки, при котором она выполняется без ожидания
+        """
+        self.handler = handler
+        self.delay_ms = delay_ms
+        self.max_size = max_size
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer_task: Optional[asyncio.Task] = None
+    
+    async def submit(self, item: Any) -> Any:
+        """
+        Добавить элемент в текущую пачку и дождаться его результата.
+        
+        Args:
+            item: элемент запроса
+            
+        Returns:
+            Результат обработчика для этого элемента
+            
+        Raises:
+            Exception: исключение обработчика передается всем запросам пачки
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+        elif self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._delayed_flush())
+        return await future
+    
+    async def _delayed_flush(self):
+        """Выполнить пачку по истечении delay_ms."""
+        await asyncio.sleep(self.delay_ms / 1000)
+        self._timer_task = None
+        await self.flush()
+    
+    async def flush(self):
+        """Выполнить накопленную пачку сразу."""
+        if self._timer_task is not None and self._timer_task is not asyncio.current_task():
+            self._timer_task.cancel()
+        self._timer_task = None
+        
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Ошибка при обработке пачки из {len(batch)} запросов: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,126 @@
+"""
+Модуль фильтра Блума для быстрой проверки ID пользователей.
+Фильтр может ошибиться только в сторону "возможно есть", отрицательный ответ всегда точен.
+"""
+import hashlib
+import math
+import os
+import struct
+from typing import Optional, Tuple
+
+# Заголовок файла: сигнатура, версия, емкость, вероятность ошибки,
+# размер в битах, число хеш-функций, число элементов, отметка времени
+HEADER_FORMAT = '<4sIQdQIQq'
+HEADER_MAGIC = b'SRBF'
+HEADER_VERSION = 1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Создать пустой фильтр Блума.
+        
+        Args:
+            capacity: ожидаемое количество элементов
+            error_rate: допустимая вероятность ложноположительного ответа
+        """
+        if capacity <= 0:
+            raise ValueError("Емкость фильтра Блума должна быть положительной")
+        if not 0 < error_rate < 1:
+            raise ValueError("Вероятность ошибки фильтра Блума должна быть в интервале (0, 1)")
+        
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+    
+    def _positions(self, user_id: int):
+        """Получить номера битов для ID (двойное хеширование)."""
+        digest = hashlib.blake2b(user_id.to_bytes(8, 'little', signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+    
+    def add(self, user_id: int):
+        """Добавить ID в фильтр; повторное добавление не увеличивает число элементов."""
+        changed = False
+        for position in self._positions(user_id):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                changed = True
+        if changed:
+            self.count += 1
+    
+    def __contains__(self, user_id: int) -> bool:
+        """Проверить, может ли ID находиться в фильтре."""
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(user_id))
+    
+    def is_overloaded(self) -> bool:
+        """Превышена ли расчетная емкость (вероятность ошибки выше заданной)."""
+        return self.count > self.capacity
+    
+    def save(self, path: str, watermark: int):
+        """
+        Сохранить фильтр в файл атомарной заменой.
+        
+        Args:
+            path: путь к файлу фильтра
+            watermark: отметка времени, до которой фильтр содержит все ID
+        """
+        header = struct.pack(
+            HEADER_FORMAT,
+            HEADER_MAGIC,
+            HEADER_VERSION,
+            self.capacity,
+            self.error_rate,
+            self.num_bits,
+            self.num_hashes,
+            self.count,
+            watermark
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> Optional[Tuple['BloomFilter', int]]:
+        """
+        Загрузить фильтр из файла.
+        
+        Args:
+            path: путь к файлу фильтра
+            
+        Returns:
+            Пара (фильтр, отметка времени) или None, если файла нет или он поврежден
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        
+        header_size = struct.calcsize(HEADER_FORMAT)
+        if len(data) < header_size:
+            return None
+        
+        magic, version, capacity, error_rate, num_bits, num_hashes, count, watermark = struct.unpack(
+            HEADER_FORMAT, data[:header_size]
+        )
+        if magic != HEADER_MAGIC or version != HEADER_VERSION:
+            return None
+        
+        bloom = cls(capacity, error_rate)
+        if bloom.num_bits != num_bits or bloom.num_hashes != num_hashes:
+            return None
+        if len(data) - header_size != len(bloom.bits):
+            return None
+        
+        bloom.bits = bytearray(data[header_size:])
+        bloom.count = count
+        return bloom, watermark
@@ -4,7 +4,7 @@
 import logging
 import asyncio
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from telegram import Update, ChatMember, ChatPermissions, Chat
 from telegram.ext import (
@@ -15,20 +15,25 @@ from telegram.ext import (
 )
 from telegram.error import TelegramError
 
-from .database import Database
+from .batching import MicroBatcher
+from .records import OutboxAction, RestrictedUser
+from .storage import Storage, utc_timestamp
 from .config import Config
 
 logger = logging.getLogger(__name__)
 
+# Сколько самых медленных методов хранилища показывать в /status
+STATUS_QUERY_METHODS = 5
+
 
 class SpamRestrictorBot:
-    def __init__(self, config: Config, database: Database):
+    def __init__(self, config: Config, database: Storage):
         """
         Инициализация бота.
         
         Args:
             config: объект конфигурации
-            database: объект базы данных
+            database: хранилище данных (Database или MemoryStorage)
         """
         self.config = config
         self.db = database
@@ -36,6 +41,13 @@ class SpamRestrictorBot:
         self.last_check_time: Optional[datetime] = None
         self.next_check_time: Optional[datetime] = None
         
+        # Проверки вступающих по списку забаненных копятся JOIN_BATCH_MS и выполняются одним запросом на группу
+        self.ban_lookups = MicroBatcher(self._lookup_banned, config.join_batch_ms, config.join_batch_size)
+        
+        # Ключи (group_id, user_id, action) действий outbox, которые сейчас выполняются:
+        # доигрывание после перезапуска и плановая проверка не берут одно действие дважды
+        self.claimed_actions: Set[Tuple[int, int, str]] = set()
+        
         # Права для ограниченных пользователей (запрет на отправку сообщений и медиа)
         self.restricted_permissions = ChatPermissions(
             can_send_messages=False,
@@ -71,6 +83,23 @@ class SpamRestrictorBot:
         except TelegramError as e:
             logger.error(f"Ошибка при отправке уведомления администратору: {e}")
     
+    async def log_event(
+        self,
+        event: str,
+        user_id: Optional[int] = None,
+        group_id: Optional[int] = None,
+        details: Optional[str] = None
+    ):
+        """
+        Записать событие в журнал модерации.
+        
+        Ошибка журнала не должна прерывать обработку участника, поэтому она только логируется.
+        """
+        try:
+            await self.db.log_event(event, user_id=user_id, group_id=group_id, details=details)
+        except Exception as e:
+            logger.error(f"Ошибка при записи события {event} в журнал: {e}")
+    
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /status - показать статус бота (только для администратора)."""
         # Проверка прав администратора
@@ -100,15 +129,66 @@ class SpamRestrictorBot:
             f"🤖 <b>Статус бота</b>\n\n"
             f"📍 <b>ID текущего чата:</b> <code>{chat_id}</code>\n"
             f"👥 <b>Активных наблюдаемых:</b> {stats['restricted_users']}\n"
-            f"🚫 <b>Забанено всего:</b> {stats['banned_users']}\n\n"
+            f"🚫 <b>Забанено всего:</b> {stats['banned_users'] + stats['archived_users']}\n"
+            f"🗄️ <b>Из них в архиве:</b> {stats['archived_users']}\n"
+            f"📈 <b>Ограничено за все время:</b> {stats['total_restricted']}\n"
+            f"🗑️ <b>Удалено по истечении срока:</b> {stats['total_expired']}\n"
+            f"🔁 <b>Повторных вступлений заблокировано:</b> {stats['total_rebanned']}\n\n"
             f"🕐 <b>Последняя проверка:</b> {last_check_str}\n"
             f"⏰ <b>Следующая проверка:</b> {next_check_str}\n\n"
             f"⚙️ <b>Период ограничения:</b> {self.config.restriction_period_days} дней\n"
             f"⏱️ <b>Интервал проверок:</b> {self.config.check_interval_seconds // 60} минут"
         )
         
+        if self.db.pragma_profile:
+            profile = ", ".join(f"{name}={value}" for name, value in self.db.pragma_profile.items())
+            status_text += f"\n💾 <b>SQLite:</b> <code>{profile}</code>"
+        
+        query_stats = getattr(self.db, 'query_stats', None)
+        if query_stats is not None:
+            summary = query_stats.summary()
+            # Самые медленные методы по p95
+            slowest = sorted(summary.items(), key=lambda item: item[1]['p95'], reverse=True)[:STATUS_QUERY_METHODS]
+            if slowest:
+                status_text += "\n\n📊 <b>Время запросов к БД</b> (p50/p95/p99/max, мс):"
+                for name, latency in slowest:
+                    status_text += (
+                        f"\n• <code>{name}</code>: {latency['p50']:.1f}/{latency['p95']:.1f}/"
+                        f"{latency['p99']:.1f}/{latency['max']:.1f} ({latency['count']})"
+                    )
+        
+        maintenance = getattr(self.db, 'last_maintenance', None)
+        if maintenance:
+            status_text += (
+                f"\n🧹 <b>Обслуживание БД:</b> файл {maintenance['file_size'] // 1024} КиБ, "
+                f"свободно {maintenance['fragmentation']}% страниц"
+            )
+        
         await update.message.reply_text(status_text, parse_mode="HTML")
     
+    async def _is_user_banned(self, user_id: int, group_id: int) -> bool:
+        """Проверить вступающего по списку забаненных, при JOIN_BATCH_MS > 0 - в общей пачке."""
+        if self.config.join_batch_ms <= 0:
+            return await self.db.is_user_banned(user_id, group_id=group_id)
+        return await self.ban_lookups.submit((group_id, user_id))
+    
+    async def _lookup_banned(self, keys: List[Tuple[int, int]]) -> List[bool]:
+        """
+        Проверить пачку ключей (group_id, user_id) по списку забаненных.
+        
+        Returns:
+            Признаки бана в порядке ключей
+        """
+        by_group: Dict[int, List[int]] = {}
+        for group_id, user_id in keys:
+            by_group.setdefault(group_id, []).append(user_id)
+        
+        banned = set()
+        for group_id, user_ids in by_group.items():
+            banned_ids = await self.db.get_banned_user_ids(user_ids, group_id=group_id)
+            banned.update((group_id, user_id) for user_id in banned_ids)
+        return [key in banned for key in keys]
+    
     async def track_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Обработчик изменений статуса участников чата.
@@ -116,8 +196,9 @@ class SpamRestrictorBot:
         """
         result = update.chat_member
         
-        # Проверяем, что это нужная группа
-        if result.chat.id != self.config.group_id:
+        # Проверяем, что это одна из защищаемых групп
+        group_id = result.chat.id
+        if group_id not in self.config.group_ids:
             return
         
         # Проверяем, что пользователь присоединился к группе
@@ -132,17 +213,20 @@ class SpamRestrictorBot:
         user = result.new_chat_member.user
         user_id = user.id
         
-        logger.info(f"Новый участник: {user_id} ({user.username or user.first_name})")
+        logger.info(f"Новый участник группы {group_id}: {user_id} ({user.username or user.first_name})")
+        await self.log_event('join', user_id, group_id, user.username)
         
         # Если пользователь был ранее удален - сразу баним
-        if await self.db.is_user_banned(user_id):
+        if await self._is_user_banned(user_id, group_id):
             logger.warning(f"Пользователь {user_id} был ранее удален, баним повторно")
             try:
                 await context.bot.ban_chat_member(
-                    chat_id=self.config.group_id,
+                    chat_id=group_id,
                     user_id=user_id
                 )
                 logger.info(f"Пользователь {user_id} успешно забанен")
+                await self.db.increment_counter('total_rebanned')
+                await self.log_event('reban', user_id, group_id, user.username)
                 
                 # Уведомляем администратора
                 await self.notify_admin(
@@ -155,6 +239,7 @@ class SpamRestrictorBot:
                 return
             except TelegramError as e:
                 logger.error(f"Ошибка при бане пользователя {user_id}: {e}")
+                await self.log_event('error', user_id, group_id, f"reban: {e}")
                 await self.notify_admin(
                     context,
                     f"❌ <b>Ошибка при бане пользователя</b>\n\n"
@@ -175,20 +260,23 @@ class SpamRestrictorBot:
         try:
             # Ограничиваем права пользователя
             await context.bot.restrict_chat_member(
-                chat_id=self.config.group_id,
+                chat_id=group_id,
                 user_id=user_id,
                 permissions=self.restricted_permissions
             )
             
-            # Добавляем в базу данных
-            await self.db.add_restricted_user(
+            # Добавляем в базу данных; при повторном вступлении обновляются username и имя
+            if await self.db.add_restricted_user(
                 user_id=user_id,
                 username=user.username,
                 first_name=user.first_name,
-                last_name=user.last_name
-            )
-            
-            logger.info(f"Пользователь {user_id} успешно ограничен и добавлен в БД")
+                last_name=user.last_name,
+                group_id=group_id
+            ):
+                logger.info(f"Пользователь {user_id} успешно ограничен и добавлен в БД")
+            else:
+                logger.info(f"Пользователь {user_id} успешно ограничен, данные в БД обновлены")
+            await self.log_event('restrict', user_id, group_id, user.username)
             
             # Отправляем уведомление администратору
             await self.notify_admin(
@@ -199,9 +287,10 @@ class SpamRestrictorBot:
                 f"Username: @{username if user.username else 'отсутствует'}\n"
                 f"Удаление через: {self.config.restriction_period_days} дней"
             )
-            
+        
         except TelegramError as e:
             logger.error(f"Ошибка при ограничении пользователя {user_id}: {e}")
+            await self.log_event('error', user_id, group_id, f"restrict: {e}")
             await self.notify_admin(
                 context,
                 f"❌ <b>Ошибка при ограничении пользователя</b>\n\n"
@@ -221,11 +310,30 @@ class SpamRestrictorBot:
         logger.info("Запуск проверки просроченных ограничений")
         
         try:
-            expired_users = await self.db.get_expired_restrictions(
-                days=self.config.restriction_period_days
-            )
+            processed_count = 0
+            
+            for group_id in self.config.group_ids:
+                users = []
+                
+                # Пользователи читаются потоком: удаление первых начинается до того,
+                # как прочитаны остальные, а результаты сохраняются пачками
+                async for user in self.db.iter_expired_restrictions(
+                    batch_size=self.config.expiry_batch_size,
+                    group_id=group_id
+                ):
+                    processed_count += 1
+                    users.append(user)
+                    
+                    if len(users) >= self.config.expiry_batch_size:
+                        await self._expire_users(context, users)
+                        users = []
+                
+                await self._expire_users(context, users)
+            
+            # Пользователи уже удалены из группы - результаты проверки должны сохраниться
+            await self.db.flush()
             
-            if not expired_users:
+            if not processed_count:
                 logger.info("Не найдено пользователей с истекшими ограничениями")
                 
                 # Отправляем отладочное уведомление если включено
@@ -235,61 +343,184 @@ class SpamRestrictorBot:
                         "ℹ️ <b>Плановая проверка завершена</b>\n\n"
                         "Новых пользователей для удаления не найдено."
                     )
+        
+        except Exception as e:
+            logger.error(f"Ошибка в задаче проверки просроченных ограничений: {e}")
+    
+    async def _expire_users(self, context: ContextTypes.DEFAULT_TYPE, users: List[RestrictedUser]):
+        """
+        Удалить из группы пачку пользователей с истекшим ограничением через очередь outbox.
+        
+        Args:
+            context: контекст бота
+            users: записи пользователей одной группы
+        """
+        now = utc_timestamp()
+        actions = [
+            OutboxAction(user.group_id, user.user_id, 'expire', user.username, now, False)
+            for user in users
+        ]
+        # Намерения записываются до вызовов API: после сбоя они будут доиграны при запуске
+        await self.db.enqueue_actions(actions)
+        await self._run_expire_actions(context, actions)
+    
+    async def _run_expire_actions(self, context: ContextTypes.DEFAULT_TYPE, actions: List[OutboxAction]):
+        """
+        Выполнить действия удаления из очереди и сохранить результат.
+        
+        Для действий с done=True вызовы API уже выполнены до сбоя и не повторяются,
+        остается только сохранить результат в БД. Неудачные действия снимаются
+        с очереди: пользователь остается ограниченным и попадет в следующую проверку.
+        Действия, которые уже выполняет другая задача, пропускаются.
+        
+        Args:
+            context: контекст бота
+            actions: действия 'expire' из очереди
+        """
+        # Захват без ожидания между проверкой и добавлением атомарен в цикле событий
+        actions = [
+            action for action in actions
+            if (action.group_id, action.user_id, action.action) not in self.claimed_actions
+        ]
+        keys = {(action.group_id, action.user_id, action.action) for action in actions}
+        self.claimed_actions |= keys
+        try:
+            removed: Dict[int, List[int]] = {}
+            completed: List[OutboxAction] = []
+            for action in actions:
+                if not action.done:
+                    if not await self._remove_expired_user(context, action.group_id, action.user_id, action.username):
+                        continue
+                    completed.append(action)
+                removed.setdefault(action.group_id, []).append(action.user_id)
+            await self.db.complete_actions(completed)
+            
+            for group_id, user_ids in removed.items():
+                await self._persist_expired_users(user_ids, group_id)
+            await self.db.finish_actions(actions)
+        finally:
+            self.claimed_actions -= keys
+    
+    async def resume_pending_actions(self, context: ContextTypes.DEFAULT_TYPE):
+        """Доиграть действия из очереди outbox, прерванные остановкой или сбоем бота."""
+        try:
+            actions = await self.db.get_pending_actions()
+            if not actions:
                 return
+            logger.warning(f"Доигрывание незавершенных действий после перезапуска: {len(actions)}")
+            await self._run_expire_actions(context, [action for action in actions if action.action == 'expire'])
+            await self.db.flush()
+        except Exception as e:
+            logger.error(f"Ошибка при доигрывании незавершенных действий: {e}")
+    
+    async def _persist_expired_users(self, user_ids: list, group_id: int):
+        """
+        Переместить удаленных из группы пользователей из restricted в banned одной транзакцией.
+        
+        Args:
+            user_ids: список ID пользователей Telegram
+            group_id: ID группы
+        """
+        if not user_ids:
+            return
+        logger.info(f"Сохранение {len(user_ids)} удаленных пользователей группы {group_id}")
+        await self.db.expire_restricted_users(user_ids, reason="Истек период ограничения", group_id=group_id)
+    
+    async def _remove_expired_user(
+        self,
+        context: ContextTypes.DEFAULT_TYPE,
+        group_id: int,
+        user_id: int,
+        username: Optional[str]
+    ) -> bool:
+        """
+        Удалить из группы пользователя с истекшим ограничением.
+        
+        Args:
+            context: контекст бота
+            group_id: ID группы
+            user_id: ID пользователя Telegram
+            username: username пользователя для журнала и уведомлений
             
-            logger.info(f"Найдено {len(expired_users)} пользователей для удаления")
+        Returns:
+            True если пользователь удален из группы
+        """
+        try:
+            # Удаляем пользователя из группы (ban + unban для удаления из группы)
+            await context.bot.ban_chat_member(
+                chat_id=group_id,
+                user_id=user_id
+            )
             
-            for user in expired_users:
-                user_id = user['user_id']
-                username = user['username']
-                
-                try:
-                    # Удаляем пользователя из группы (ban + unban для удаления из группы)
-                    await context.bot.ban_chat_member(
-                        chat_id=self.config.group_id,
-                        user_id=user_id
-                    )
-                    
-                    # Размбаниваем, чтобы пользователь мог вступить снова
-                    # (но при вступлении он попадет в banned_users и будет сразу забанен)
-                    await context.bot.unban_chat_member(
-                        chat_id=self.config.group_id,
-                        user_id=user_id
-                    )
-                    
-                    # Перемещаем из restricted в banned
-                    await self.db.add_banned_user(
-                        user_id=user_id,
-                        username=username,
-                        first_name=user['first_name'],
-                        last_name=user['last_name'],
-                        reason="Истек период ограничения"
-                    )
-                    await self.db.remove_restricted_user(user_id)
-                    
-                    logger.info(f"Пользователь {user_id} ({username}) удален из группы")
-                    
-                    # Уведомляем администратора
-                    await self.notify_admin(
-                        context,
-                        f"🗑️ <b>Пользователь удален из группы</b>\n\n"
-                        f"ID: <code>{user_id}</code>\n"
-                        f"Username: @{username if username else 'отсутствует'}\n"
-                        f"Причина: истек период ограничения ({self.config.restriction_period_days} дней)"
-                    )
-                    
-                except TelegramError as e:
-                    logger.error(f"Ошибка при удалении пользователя {user_id}: {e}")
-                    await self.notify_admin(
-                        context,
-                        f"❌ <b>Ошибка при удалении пользователя</b>\n\n"
-                        f"ID: <code>{user_id}</code>\n"
-                        f"Username: @{username if username else 'отсутствует'}\n"
-                        f"Ошибка: {e}"
-                    )
-                    
+            # Размбаниваем, чтобы пользователь мог вступить снова
+            # (но при вступлении он попадет в banned_users и будет сразу забанен)
+            await context.bot.unban_chat_member(
+                chat_id=group_id,
+                user_id=user_id
+            )
+            
+            logger.info(f"Пользователь {user_id} ({username}) удален из группы")
+            await self.log_event('expire', user_id, group_id, username)
+            
+            # Уведомляем администратора
+            await self.notify_admin(
+                context,
+                f"🗑️ <b>Пользователь удален из группы</b>\n\n"
+                f"ID: <code>{user_id}</code>\n"
+                f"Username: @{username if username else 'отсутствует'}\n"
+                f"Причина: истек срок ограничения"
+            )
+            return True
+        
+        except TelegramError as e:
+            logger.error(f"Ошибка при удалении пользователя {user_id}: {e}")
+            await self.log_event('error', user_id, group_id, f"expire: {e}")
+            await self.notify_admin(
+                context,
+                f"❌ <b>Ошибка при удалении пользователя</b>\n\n"
+                f"ID: <code>{user_id}</code>\n"
+                f"Username: @{username if username else 'отсутствует'}\n"
+                f"Ошибка: {e}"
+            )
+            return False
+    
+    async def archive_old_bans(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая задача переноса давних банов в холодный архив."""
+        months = self.config.ban_archive_after_months
+        try:
+            archived = await self.db.archive_old_bans(months * 30)
         except Exception as e:
-            logger.error(f"Ошибка в задаче проверки просроченных ограничений: {e}")
+            logger.error(f"Ошибка при переносе банов в архив: {e}")
+            return
+        
+        if archived:
+            logger.info(f"В архив перенесено {archived} банов старше {months} мес.")
+    
+    async def backup_database(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая задача резервного копирования базы данных."""
+        try:
+            await self.db.backup(
+                self.config.backup_dir,
+                keep=self.config.backup_keep,
+                compress=self.config.backup_compress
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при резервном копировании базы данных: {e}")
+            await self.notify_admin(context, f"⚠️ <b>Ошибка резервного копирования:</b> {e}")
+    
+    async def maintain_database(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая задача обслуживания базы данных."""
+        try:
+            await self.db.run_maintenance(vacuum_pages=self.config.db_vacuum_pages)
+        except Exception as e:
+            logger.error(f"Ошибка при обслуживании базы данных: {e}")
+    
+    async def purge_old_events(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая задача удаления событий журнала старше срока хранения."""
+        try:
+            await self.db.purge_events(self.config.event_retention_days)
+        except Exception as e:
+            logger.error(f"Ошибка при очистке журнала событий: {e}")
     
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок."""
@@ -303,7 +534,12 @@ class SpamRestrictorBot:
             Настроенный объект Application
         """
         # Создаем Application
-        application = Application.builder().token(self.config.bot_token).build()
+        builder = Application.builder().token(self.config.bot_token)
+        if self.config.join_batch_ms > 0:
+            # Пачки проверок собираются только из обновлений, обрабатываемых одновременно.
+            # Порядок обработки обновлений при этом не гарантируется, поэтому пачки включаются явно
+            builder = builder.concurrent_updates(self.config.join_batch_size)
+        application = builder.build()
         
         # Регистрируем обработчики команд (только для администратора)
         application.add_handler(CommandHandler("status", self.status_command))
@@ -325,6 +561,41 @@ class SpamRestrictorBot:
             first=10  # Первый запуск через 10 секунд после старта
         )
         
+        # Доигрываем действия в Telegram, прерванные остановкой бота, до первой проверки
+        job_queue.run_once(self.resume_pending_actions, when=0)
+        
+        # Обслуживание БД: статистика планировщика, свободные страницы, контрольная точка WAL
+        if self.config.db_maintenance_interval_hours > 0:
+            job_queue.run_repeating(
+                self.maintain_database,
+                interval=self.config.db_maintenance_interval_hours * 60 * 60,
+                first=600
+            )
+        
+        # Резервное копирование базы данных
+        if self.config.backup_interval_hours > 0:
+            job_queue.run_repeating(
+                self.backup_database,
+                interval=self.config.backup_interval_hours * 60 * 60,
+                first=300
+            )
+        
+        # Раз в сутки удаляем события журнала старше срока хранения
+        if self.config.event_retention_days > 0:
+            job_queue.run_repeating(
+                self.purge_old_events,
+                interval=24 * 60 * 60,
+                first=120
+            )
+        
+        # Раз в сутки переносим давние баны в холодный архив
+        if self.config.ban_archive_after_months > 0:
+            job_queue.run_repeating(
+                self.archive_old_bans,
+                interval=24 * 60 * 60,
+                first=60
+            )
+        
         return application
     
     async def run(self):
@@ -356,9 +627,9 @@ class SpamRestrictorBot:
                         chat_id=self.config.admin_user_id,
                         text=(
                             f"✅ <b>Бот успешно запущен</b>\n\n"
-                            f"🏢 <b>Группа ID:</b> <code>{self.config.group_id}</code>\n"
+                            f"🏢 <b>Группы ID:</b> <code>{', '.join(str(group_id) for group_id in self.config.group_ids)}</code>\n"
                             f"👥 <b>Активных наблюдаемых:</b> {stats['restricted_users']}\n"
-                            f"🚫 <b>Забанено всего:</b> {stats['banned_users']}\n"
+                            f"🚫 <b>Забанено всего:</b> {stats['banned_users'] + stats['archived_users']}\n"
                             f"⏱️ <b>Период ограничения:</b> {self.config.restriction_period_days} дней\n"
                             f"🔄 <b>Интервал проверок:</b> {self.config.check_interval_seconds // 60} минут"
                         ),
@@ -3,7 +3,7 @@
 """
 import os
 import logging
-from typing import Optional
+from typing import Optional, Dict, Any, List
 
 logger = logging.getLogger(__name__)
 
@@ -31,16 +31,41 @@ class Config:
         """Получить токен бота."""
         return os.getenv('BOT_TOKEN')
     
+    @property
+    def group_ids(self) -> List[int]:
+        """Получить ID групп для мониторинга (GROUP_ID может содержать несколько ID через запятую)."""
+        return [int(group_id) for group_id in os.getenv('GROUP_ID').split(',') if group_id.strip()]
+    
     @property
     def group_id(self) -> int:
-        """Получить ID группы для мониторинга."""
-        return int(os.getenv('GROUP_ID'))
+        """Получить ID основной (первой) группы для мониторинга."""
+        return self.group_ids[0]
     
     @property
     def database_path(self) -> str:
         """Получить путь к базе данных."""
         return os.getenv('DATABASE_PATH', '/app/data/spam_restrictor.db')
     
+    @property
+    def storage_backend(self) -> str:
+        """Получить тип хранилища: sqlite или memory."""
+        return os.getenv('STORAGE_BACKEND', 'sqlite').lower()
+    
+    @property
+    def db_shards(self) -> int:
+        """Получить количество файлов-шардов SQLite, между которыми пользователи делятся по user_id (1 - без шардов)."""
+        return int(os.getenv('DB_SHARDS', '1'))
+    
+    @property
+    def memory_snapshot_path(self) -> Optional[str]:
+        """Получить путь к снимку хранилища в памяти (пустое значение - без снимков)."""
+        return os.getenv('MEMORY_SNAPSHOT_PATH', f"{self.database_path}.snapshot.json") or None
+    
+    @property
+    def memory_snapshot_interval_seconds(self) -> int:
+        """Получить интервал сохранения снимка хранилища в памяти в секундах."""
+        return int(os.getenv('MEMORY_SNAPSHOT_INTERVAL_SECONDS', '300'))
+    
     @property
     def restriction_period_days(self) -> int:
         """Получить период ограничения в днях."""
@@ -51,6 +76,155 @@ class Config:
         """Получить интервал проверки в секундах."""
         return int(os.getenv('CHECK_INTERVAL_SECONDS', '3600'))
     
+    @property
+    def expiry_batch_size(self) -> int:
+        """Получить размер пачки при чтении и сохранении истекших ограничений."""
+        return int(os.getenv('EXPIRY_BATCH_SIZE', '500'))
+    
+    @property
+    def sqlite_journal_mode(self) -> str:
+        """Получить режим журнала SQLite (WAL - запись без блокировки чтения)."""
+        return os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    
+    @property
+    def sqlite_synchronous(self) -> str:
+        """Получить режим синхронизации SQLite с диском."""
+        return os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    
+    @property
+    def sqlite_mmap_size(self) -> int:
+        """Получить размер memory-mapped области SQLite в байтах."""
+        return int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))
+    
+    @property
+    def sqlite_cache_size(self) -> int:
+        """Получить размер кэша страниц SQLite (отрицательное значение - в КиБ)."""
+        return int(os.getenv('SQLITE_CACHE_SIZE', '-16000'))
+    
+    @property
+    def sqlite_temp_store(self) -> str:
+        """Получить место хранения временных таблиц SQLite."""
+        return os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+    
+    @property
+    def sqlite_auto_vacuum(self) -> str:
+        """Получить режим auto_vacuum SQLite (применяется к новой базе или после VACUUM)."""
+        return os.getenv('SQLITE_AUTO_VACUUM', 'INCREMENTAL')
+    
+    @property
+    def sqlite_busy_timeout(self) -> int:
+        """Получить время ожидания блокировки SQLite в миллисекундах."""
+        return int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+    
+    @property
+    def sqlite_pragmas(self) -> Dict[str, Any]:
+        """Получить профиль производительности SQLite (PRAGMA) для Database."""
+        return {
+            # auto_vacuum должен быть задан до создания таблиц новой базы
+            'auto_vacuum': self.sqlite_auto_vacuum,
+            'busy_timeout': self.sqlite_busy_timeout,
+            'journal_mode': self.sqlite_journal_mode,
+            'synchronous': self.sqlite_synchronous,
+            'mmap_size': self.sqlite_mmap_size,
+            'cache_size': self.sqlite_cache_size,
+            'temp_store': self.sqlite_temp_store,
+        }
+    
+    @property
+    def db_commit_batch_size(self) -> int:
+        """Получить число изменений БД, фиксируемых одной транзакцией (1 - без группировки)."""
+        return int(os.getenv('DB_COMMIT_BATCH_SIZE', '1'))
+    
+    @property
+    def db_commit_interval_ms(self) -> int:
+        """Получить максимальную задержку групповой фиксации изменений БД в миллисекундах."""
+        return int(os.getenv('DB_COMMIT_INTERVAL_MS', '50'))
+    
+    @property
+    def cache_banned_ids(self) -> bool:
+        """Держать ли ID забаненных пользователей в памяти для быстрой проверки при вступлении."""
+        return os.getenv('CACHE_BANNED_IDS', '0') == '1'
+    
+    @property
+    def bloom_capacity(self) -> int:
+        """Получить емкость фильтра Блума для проверки забаненных (0 - фильтр отключен)."""
+        return int(os.getenv('BLOOM_CAPACITY', '0'))
+    
+    @property
+    def bloom_error_rate(self) -> float:
+        """Получить допустимую вероятность ложноположительного ответа фильтра Блума."""
+        return float(os.getenv('BLOOM_ERROR_RATE', '0.001'))
+    
+    @property
+    def db_read_pool_size(self) -> int:
+        """Получить число соединений БД только для чтения (0 - читать через основное соединение)."""
+        return int(os.getenv('DB_READ_POOL_SIZE', '2'))
+    
+    @property
+    def ban_archive_path(self) -> str:
+        """Получить каталог холодного архива забаненных пользователей."""
+        return os.getenv('BAN_ARCHIVE_PATH') or f"{self.database_path}.archive"
+    
+    @property
+    def ban_archive_after_months(self) -> int:
+        """Получить возраст бана в месяцах, после которого он переносится в холодный архив (0 - архив отключен)."""
+        return int(os.getenv('BAN_ARCHIVE_AFTER_MONTHS', '0'))
+    
+    @property
+    def backup_dir(self) -> str:
+        """Получить каталог резервных копий базы данных."""
+        return os.getenv('BACKUP_DIR') or os.path.join(os.path.dirname(self.database_path), 'backups')
+    
+    @property
+    def backup_interval_hours(self) -> int:
+        """Получить интервал резервного копирования в часах (0 - отключено)."""
+        return int(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+    
+    @property
+    def backup_keep(self) -> int:
+        """Получить количество хранимых резервных копий."""
+        return int(os.getenv('BACKUP_KEEP', '7'))
+    
+    @property
+    def backup_compress(self) -> bool:
+        """Сжимать ли резервные копии в gzip."""
+        return os.getenv('BACKUP_COMPRESS', '0') == '1'
+    
+    @property
+    def event_retention_days(self) -> int:
+        """Получить срок хранения событий журнала модерации в днях (0 - хранить всегда)."""
+        return int(os.getenv('EVENT_RETENTION_DAYS', '90'))
+    
+    @property
+    def event_batch_size(self) -> int:
+        """Получить число событий журнала, записываемых в БД одной вставкой."""
+        return int(os.getenv('EVENT_BATCH_SIZE', '100'))
+    
+    @property
+    def db_maintenance_interval_hours(self) -> int:
+        """Получить интервал обслуживания БД в часах (0 - отключено)."""
+        return int(os.getenv('DB_MAINTENANCE_INTERVAL_HOURS', '6'))
+    
+    @property
+    def db_vacuum_pages(self) -> int:
+        """Получить максимальное число страниц, возвращаемых incremental_vacuum за один запуск."""
+        return int(os.getenv('DB_VACUUM_PAGES', '1000'))
+    
+    @property
+    def slow_query_ms(self) -> float:
+        """Получить порог медленного запроса к БД в миллисекундах (0 - не записывать)."""
+        return float(os.getenv('SLOW_QUERY_MS', '100'))
+    
+    @property
+    def join_batch_ms(self) -> float:
+        """Получить время накопления проверок вступающих в одну пачку в миллисекундах (0 - без пачек)."""
+        return float(os.getenv('JOIN_BATCH_MS', '0'))
+    
+    @property
+    def join_batch_size(self) -> int:
+        """Получить максимальный размер пачки проверок вступающих и число одновременно обрабатываемых обновлений."""
+        return int(os.getenv('JOIN_BATCH_SIZE', '100'))
+    
     @property
     def log_level(self) -> str:
         """Получить уровень логирования."""
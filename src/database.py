@@ -3,69 +3,680 @@
 Хранит информацию о пользователях с ограничениями и удаленных пользователях.
 """
 import aiosqlite
+import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+import os
+import re
+import time
+from array import array
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple, Set, Iterable, AsyncIterator, Any, Callable, Union
+
+from .archive import BanArchive
+from .backup import create_backup
+from .bloom import BloomFilter
+from .metrics import LatencyStats, timed
+from .migrations import run_migrations, run_backfills
+from .records import BannedUser, OutboxAction, RestrictedUser, TABLE_RECORDS, record_factory
+from .storage import (
+    COUNTERS, EVENT_TYPES, FETCH_BATCH_SIZE, LEGACY_GROUP_ID, OUTBOX_ACTIONS, SECONDS_PER_DAY, utc_timestamp
+)
 
 logger = logging.getLogger(__name__)
 
+# Максимальное число параметров в одном запросе с IN (...)
+MAX_QUERY_PARAMS = 500
+
+# Число строк restricted_users в одном многострочном INSERT (по 8 параметров на строку)
+INSERT_ROWS_PER_QUERY = MAX_QUERY_PARAMS // 8
+
+# Столбцы таблиц пользователей для массового импорта и экспорта
+TABLE_COLUMNS = {table: record_type._fields for table, record_type in TABLE_RECORDS.items()}
+
+# Столбцы restricted_users в порядке полей RestrictedUser
+RESTRICTED_COLUMNS = ', '.join(RestrictedUser._fields)
+
+# Максимальная задержка записи буфера событий в миллисекундах
+EVENT_FLUSH_INTERVAL_MS = 1000
+
+# PRAGMA, которые можно задать через профиль производительности
+SUPPORTED_PRAGMAS = (
+    'auto_vacuum',
+    'busy_timeout',
+    'journal_mode',
+    'synchronous',
+    'mmap_size',
+    'cache_size',
+    'temp_store',
+)
+
+
+# PRAGMA, которые относятся к файлу БД или к записи и не применяются к соединениям для чтения
+WRITER_ONLY_PRAGMAS = ('auto_vacuum', 'journal_mode', 'synchronous')
+
+# Значение PRAGMA auto_vacuum, при котором доступна PRAGMA incremental_vacuum
+AUTO_VACUUM_INCREMENTAL = 2
+
 
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, Any]] = None,
+        commit_batch_size: int = 1,
+        commit_interval_ms: int = 50,
+        cache_banned_ids: bool = False,
+        bloom_capacity: int = 0,
+        bloom_error_rate: float = 0.001,
+        read_pool_size: int = 0,
+        archive_path: Optional[str] = None,
+        group_id: int = LEGACY_GROUP_ID,
+        event_batch_size: int = 100,
+        slow_query_ms: float = 100,
+        restriction_period_days: int = 30
+    ):
         """
         Инициализация подключения к базе данных.
         
         Args:
             db_path: путь к файлу базы данных SQLite
+            pragmas: профиль производительности SQLite {имя PRAGMA: значение}
+            commit_batch_size: число изменений в одной транзакции (1 - фиксировать сразу)
+            commit_interval_ms: максимальная задержка фиксации отложенных изменений
+            cache_banned_ids: держать ID забаненных в памяти для проверки без запроса к БД
+            bloom_capacity: емкость фильтра Блума перед проверкой забаненных (0 - без фильтра)
+            bloom_error_rate: допустимая вероятность ложноположительного ответа фильтра
+            read_pool_size: число отдельных соединений только для чтения (работает в режиме WAL)
+            archive_path: каталог холодного архива забаненных (по умолчанию <db_path>.archive)
+            group_id: группа по умолчанию для методов, которым группа не передана явно
+            event_batch_size: число событий журнала, записываемых одной вставкой
+            slow_query_ms: порог записи запроса в журнал медленных запросов (0 - не записывать)
+            restriction_period_days: срок ограничения по умолчанию для новых ограничений
         """
         self.db_path = db_path
+        self.group_id = group_id
+        self.pragmas = pragmas or {}
+        self.commit_batch_size = commit_batch_size
+        self.commit_interval_ms = commit_interval_ms
+        self.pending_writes = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        # Задача, которой основное соединение отдано целиком на время пачки в точке сохранения
+        self._write_lock = asyncio.Lock()
+        self._exclusive_task: Optional[asyncio.Task] = None
+        # Ключи (group_id, user_id), измененные в еще не зафиксированной транзакции:
+        # их видит только основное соединение
+        self._uncommitted_keys: Set[Tuple[int, int]] = set()
+        self.pragma_profile: Dict[str, Any] = {}
         self.connection: Optional[aiosqlite.Connection] = None
+        self.migration_batch_size = 1000
+        self.migration_task: Optional[asyncio.Task] = None
+        self.cache_banned_ids = cache_banned_ids
+        # ID забаненных по группам: {group_id: {user_id, ...}}
+        self.banned_ids: Optional[Dict[int, Set[int]]] = None
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_path = f"{db_path}.bloom"
+        self.banned_filter: Optional[BloomFilter] = None
+        # PRAGMA data_version основного соединения на момент загрузки фильтра
+        self._bloom_data_version: Optional[int] = None
+        self.read_pool_size = read_pool_size
+        self.read_connections: List[aiosqlite.Connection] = []
+        self._idle_read_connections: Optional[asyncio.Queue] = None
+        self.archive_path = Path(archive_path or f"{db_path}.archive")
+        # Холодный архив ведется отдельно для каждой группы: <archive_path>/<group_id>/
+        self.archives: Dict[int, BanArchive] = {}
+        self.event_batch_size = event_batch_size
+        self.event_buffer: List[Tuple] = []
+        self._event_flush_task: Optional[asyncio.Task] = None
+        # Время последней записи (time.monotonic) для выбора режима контрольной точки WAL
+        self.last_write_at = 0.0
+        self.last_maintenance: Optional[Dict[str, Any]] = None
+        # Время выполнения публичных методов: число вызовов, p50/p95/p99, максимум
+        self.query_stats = LatencyStats()
+        self.slow_query_ms = slow_query_ms
+        self.restriction_period_days = restriction_period_days
     
     async def connect(self):
         """Установить соединение с базой данных."""
         self.connection = await aiosqlite.connect(self.db_path)
-        await self._create_tables()
+        await self._apply_pragmas()
+        await run_migrations(self.connection)
+        await self._adopt_legacy_rows()
+        await self._fill_expires_at()
+        await asyncio.to_thread(self._load_archives)
+        
+        if self.cache_banned_ids:
+            await self._load_banned_ids()
+        elif self.bloom_capacity > 0:
+            await self._load_banned_filter()
+        
+        if self.read_pool_size > 0:
+            await self._open_read_pool()
+        
+        # Долгие заполнения данных миграций идут в фоне, не задерживая запуск бота
+        self.migration_task = asyncio.create_task(self._run_backfills())
         logger.info(f"Подключение к базе данных установлено: {self.db_path}")
     
     async def close(self):
         """Закрыть соединение с базой данных."""
+        if self.migration_task and not self.migration_task.done():
+            self.migration_task.cancel()
+            try:
+                await self.migration_task
+            except asyncio.CancelledError:
+                pass
+        
+        for connection in self.read_connections:
+            await connection.close()
+        self.read_connections = []
+        self._idle_read_connections = None
+        
         if self.connection:
+            await self.flush_events()
+            await self.flush()
+            if self.banned_filter is not None:
+                await self._save_banned_filter()
             await self.connection.close()
             logger.info("Соединение с базой данных закрыто")
+        
+        for archive in self.archives.values():
+            archive.close()
+        self.archives = {}
     
-    async def _create_tables(self):
-        """Создать необходимые таблицы, если они не существуют."""
-        await self.connection.execute("""
-            CREATE TABLE IF NOT EXISTS restricted_users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                joined_at TIMESTAMP NOT NULL,
-                restricted_at TIMESTAMP NOT NULL
+    async def _adopt_legacy_rows(self):
+        """
+        Передать группе по умолчанию строки, созданные до появления group_id.
+        
+        Если пользователь уже есть в группе, старая строка без группы удаляется.
+        """
+        if self.group_id == LEGACY_GROUP_ID:
+            return
+        
+        adopted = 0
+        for table in ('restricted_users', 'banned_users'):
+            cursor = await self._execute(
+                self.connection,
+                f"UPDATE OR IGNORE {table} SET group_id = ? WHERE group_id = ?",
+                (self.group_id, LEGACY_GROUP_ID)
             )
-        """)
-        
-        await self.connection.execute("""
-            CREATE TABLE IF NOT EXISTS banned_users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                banned_at TIMESTAMP NOT NULL,
-                reason TEXT
+            adopted += max(cursor.rowcount, 0)
+            await self._execute(self.connection, f"DELETE FROM {table} WHERE group_id = ?", (LEGACY_GROUP_ID,))
+        await self._commit()
+        if adopted:
+            logger.info(f"Записи без группы переданы группе {self.group_id}: {adopted}")
+    
+    async def _run_backfills(self):
+        """Выполнить фоновые заполнения миграций и проставить сроки строкам, даты которых они конвертировали."""
+        await run_backfills(self.connection, self.migration_batch_size, transaction=self._backfill_transaction)
+        await self._fill_expires_at()
+    
+    @asynccontextmanager
+    async def _backfill_transaction(self):
+        """
+        Выполнить пачку фонового заполнения, заняв основное соединение, и зафиксировать ее.
+        
+        Записи обработчиков бота не вклиниваются в пачку; изменения, отложенные
+        групповой фиксацией, фиксируются вместе с ней.
+        """
+        async with self._exclusive():
+            yield
+            await self._commit()
+            self.pending_writes = 0
+    
+    async def _fill_expires_at(self):
+        """
+        Проставить срок окончания строкам, ограниченным до появления expires_at.
+        
+        Срок считается от restricted_at по текущему периоду ограничения; после этого
+        смена RESTRICTION_PERIOD_DAYS влияет только на новые ограничения. Строки
+        со строковыми датами ждут фоновой конвертации и получают срок после нее.
+        """
+        cursor = await self._execute(
+            self.connection,
+            "UPDATE restricted_users SET expires_at = restricted_at + ? "
+            "WHERE expires_at IS NULL AND typeof(restricted_at) = 'integer'",
+            (self.restriction_period_days * SECONDS_PER_DAY,)
+        )
+        await self._commit()
+        if cursor.rowcount > 0:
+            logger.info(f"Срок окончания ограничения проставлен {cursor.rowcount} пользователям")
+    
+    def _load_archives(self):
+        """Открыть архивы всех групп; сегменты без группы передаются группе по умолчанию."""
+        legacy_segments = sorted(self.archive_path.glob('segment-*.bin')) if self.archive_path.is_dir() else []
+        if legacy_segments:
+            directory = self.archive_path / str(self.group_id)
+            directory.mkdir(exist_ok=True)
+            for path in legacy_segments:
+                target = directory / path.name.replace('segment-', 'segment-legacy-', 1)
+                os.replace(path, target)
+        
+        self.archives = {}
+        if not self.archive_path.is_dir():
+            return
+        for directory in self.archive_path.iterdir():
+            if directory.is_dir() and re.fullmatch(r'-?\d+', directory.name):
+                archive = BanArchive(str(directory))
+                archive.load()
+                self.archives[int(directory.name)] = archive
+    
+    def _archive(self, group_id: int) -> BanArchive:
+        """Получить (или создать пустой) архив группы."""
+        archive = self.archives.get(group_id)
+        if archive is None:
+            archive = BanArchive(str(self.archive_path / str(group_id)))
+            self.archives[group_id] = archive
+        return archive
+    
+    def _iter_archived_keys(self) -> Iterable[Tuple[int, int]]:
+        """Перебрать ключи (group_id, user_id) всех архивных банов."""
+        for group_id, archive in self.archives.items():
+            for user_id in archive:
+                yield group_id, user_id
+    
+    async def _apply_pragmas(self):
+        """
+        Применить профиль производительности SQLite и запомнить фактические значения.
+        
+        Raises:
+            ValueError: если указана неподдерживаемая PRAGMA или некорректное значение
+        """
+        for name, value in self.pragmas.items():
+            if name not in SUPPORTED_PRAGMAS:
+                raise ValueError(f"Неподдерживаемая PRAGMA: {name}")
+            if not re.fullmatch(r'-?\w+', str(value)):
+                raise ValueError(f"Некорректное значение PRAGMA {name}: {value}")
+            await self.connection.execute(f"PRAGMA {name} = {value}")
+        
+        # SQLite может отклонить значение (например, WAL недоступен для :memory:),
+        # поэтому сохраняем то, что реально действует
+        self.pragma_profile = {}
+        for name in self.pragmas:
+            cursor = await self.connection.execute(f"PRAGMA {name}")
+            row = await cursor.fetchone()
+            self.pragma_profile[name] = row[0] if row else None
+        
+        if self.pragma_profile:
+            profile = ", ".join(f"{name}={value}" for name, value in self.pragma_profile.items())
+            logger.info(f"Профиль SQLite: {profile}")
+    
+    async def _open_read_pool(self):
+        """
+        Открыть пул соединений только для чтения.
+        
+        Читатели не ждут в очереди за записью и фиксацией единственного пишущего
+        соединения. Без WAL чтение блокируется записью, поэтому пул не создается.
+        """
+        cursor = await self.connection.execute("PRAGMA journal_mode")
+        journal_mode = (await cursor.fetchone())[0]
+        if journal_mode != 'wal':
+            logger.warning(f"Пул соединений для чтения требует режима WAL (сейчас {journal_mode}), чтение идет через основное соединение")
+            return
+        
+        self._idle_read_connections = asyncio.Queue()
+        for _ in range(self.read_pool_size):
+            connection = await aiosqlite.connect(f"{Path(self.db_path).absolute().as_uri()}?mode=ro", uri=True)
+            for name, value in self.pragmas.items():
+                if name not in WRITER_ONLY_PRAGMAS:
+                    await connection.execute(f"PRAGMA {name} = {value}")
+            self.read_connections.append(connection)
+            self._idle_read_connections.put_nowait(connection)
+        
+        logger.info(f"Открыт пул соединений для чтения: {self.read_pool_size}")
+    
+    @asynccontextmanager
+    async def _read_connection(self, keys: Iterable[Tuple[int, int]] = ()):
+        """
+        Получить соединение для чтения из пула.
+        
+        Отложенные групповой фиксацией изменения видны только основному соединению,
+        поэтому чтение пользователей, измененных в незафиксированной транзакции,
+        идет через него. Остальные чтения, в том числе сводные, обслуживает пул:
+        они видят данные не позже последней фиксации.
+        
+        Args:
+            keys: ключи (group_id, user_id), которые читает запрос
+        """
+        if self._idle_read_connections is None or not self._uncommitted_keys.isdisjoint(keys):
+            yield self.connection
+            return
+        
+        connection = await self._idle_read_connections.get()
+        try:
+            yield connection
+        finally:
+            self._idle_read_connections.put_nowait(connection)
+    
+    async def _load_banned_ids(self):
+        """Загрузить ID всех забаненных пользователей в память, по множеству на группу."""
+        banned_ids: Dict[int, Set[int]] = {}
+        async for rows in self._iter_pages(self.connection, "SELECT group_id, user_id FROM banned_users"):
+            for group_id, user_id in rows:
+                group_ids = banned_ids.get(group_id)
+                if group_ids is None:
+                    group_ids = banned_ids[group_id] = set()
+                group_ids.add(user_id)
+        
+        # Архивные ID тоже должны отвечать без запроса к БД
+        await asyncio.to_thread(self._add_archive_to_ids, banned_ids)
+        
+        self.banned_ids = banned_ids
+        total = sum(len(group_ids) for group_ids in banned_ids.values())
+        logger.info(f"Загружено в память {total} ID забаненных пользователей")
+    
+    def _add_archive_to_ids(self, banned_ids: Dict[int, Set[int]]):
+        """Добавить все ID архива в множества забаненных по группам."""
+        for group_id, archive in self.archives.items():
+            banned_ids.setdefault(group_id, set()).update(archive)
+    
+    async def _load_banned_filter(self):
+        """
+        Загрузить фильтр Блума забаненных из файла рядом с БД или построить его заново.
+        
+        Сохраненный фильтр догружается только записями с banned_at не раньше
+        отметки времени его сохранения, поэтому перезапуск не сканирует всю таблицу.
+        Фильтр хранит только user_id: отрицательный ответ значит, что пользователь
+        не забанен ни в одной группе.
+        """
+        loaded = await asyncio.to_thread(BloomFilter.load, self.bloom_path)
+        watermark = None
+        
+        if loaded is not None:
+            bloom, watermark = loaded
+            if (bloom.error_rate != self.bloom_error_rate
+                    or bloom.capacity < self.bloom_capacity
+                    or bloom.is_overloaded()):
+                loaded = None
+        
+        if loaded is None:
+            banned_count = (await self.get_stats())['banned_users'] + sum(
+                archive.count for archive in self.archives.values()
             )
-        """)
+            bloom = BloomFilter(max(self.bloom_capacity, banned_count * 2), self.bloom_error_rate)
+            query, params = "SELECT user_id FROM banned_users", ()
+            # Архивных ID нет в таблице, но отрицательный ответ фильтра должен оставаться точным
+            await asyncio.to_thread(self._add_archive_to_filter, bloom)
+        else:
+            query, params = "SELECT user_id FROM banned_users WHERE banned_at >= ?", (watermark,)
+        
+        # Записи, зафиксированные другими соединениями после этой точки, фильтр может пропустить
+        self._bloom_data_version = await self._pragma_value('data_version')
+        added = 0
+        async for rows in self._iter_pages(self.connection, query, params):
+            for row in rows:
+                bloom.add(row[0])
+            added += len(rows)
+        
+        self.banned_filter = bloom
+        await self._save_banned_filter()
+        
+        if loaded is None:
+            logger.info(f"Фильтр Блума забаненных построен заново: {added} ID, емкость {bloom.capacity}")
+        else:
+            logger.info(f"Фильтр Блума забаненных загружен из {self.bloom_path}, догружено {added} ID")
+    
+    def _add_archive_to_filter(self, bloom: BloomFilter):
+        """Добавить все ID архива в фильтр Блума."""
+        for _, user_id in self._iter_archived_keys():
+            bloom.add(user_id)
+    
+    async def _save_banned_filter(self):
+        """
+        Сохранить фильтр Блума забаненных рядом с файлом БД.
+        
+        Если после загрузки фильтра изменения в БД фиксировало другое соединение
+        (например, импорт python -m src.transfer при работающем боте), фильтр может
+        не содержать его записей с ранним banned_at. Такой фильтр не сохраняется,
+        а файл удаляется, чтобы следующий запуск построил фильтр заново.
+        """
+        if self.db_path == ':memory:':
+            return
+        if await self._pragma_value('data_version') != self._bloom_data_version:
+            logger.warning(f"БД изменена другим процессом, фильтр Блума будет перестроен: {self.bloom_path}")
+            try:
+                await asyncio.to_thread(os.remove, self.bloom_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Ошибка при удалении фильтра Блума: {e}")
+            return
+        try:
+            await asyncio.to_thread(self.banned_filter.save, self.bloom_path, utc_timestamp())
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении фильтра Блума: {e}")
+    
+    def _remember_banned(self, keys: Iterable[Tuple[int, int]]):
+        """Добавить ключи (group_id, user_id) забаненных в индекс в памяти и фильтр Блума."""
+        for group_id, user_id in keys:
+            if self.banned_ids is not None:
+                self.banned_ids.setdefault(group_id, set()).add(user_id)
+            if self.banned_filter is not None:
+                self.banned_filter.add(user_id)
+    
+    async def _execute(self, connection: aiosqlite.Connection, sql: str, params: Iterable = ()) -> aiosqlite.Cursor:
+        """
+        Выполнить запрос и записать его в журнал, если он дольше slow_query_ms.
+        
+        Args:
+            connection: соединение, на котором выполняется запрос
+            sql: текст запроса
+            params: параметры запроса
+            
+        Returns:
+            Курсор выполненного запроса
+        """
+        if connection is self.connection:
+            await self._wait_exclusive()
+        started = time.perf_counter()
+        cursor = await connection.execute(sql, params)
+        await self._check_slow_query(connection, sql, params, started)
+        return cursor
+    
+    async def _execute_fetchall(self, connection: aiosqlite.Connection, sql: str, params: Iterable = ()) -> List:
+        """
+        Выполнить запрос и прочитать все его строки одним обращением к потоку соединения.
+        
+        Между выполнением и чтением не вклинится фиксация другой задачи: с незавершенным
+        оператором записи (INSERT ... RETURNING) SQLite отказался бы фиксировать транзакцию.
+        
+        Returns:
+            Список строк результата
+        """
+        if connection is self.connection:
+            await self._wait_exclusive()
+        started = time.perf_counter()
+        rows = await connection.execute_fetchall(sql, params)
+        await self._check_slow_query(connection, sql, params, started)
+        return list(rows)
+    
+    async def _executemany(
+        self,
+        connection: aiosqlite.Connection,
+        sql: str,
+        params_seq: Iterable[Iterable]
+    ) -> aiosqlite.Cursor:
+        """
+        Выполнить запрос для каждого набора параметров и записать его в журнал,
+        если вся пачка дольше slow_query_ms.
+        
+        Args:
+            connection: соединение, на котором выполняется запрос
+            sql: текст запроса
+            params_seq: наборы параметров запроса
+            
+        Returns:
+            Курсор выполненного запроса
+        """
+        params_seq = list(params_seq)
+        if connection is self.connection:
+            await self._wait_exclusive()
+        started = time.perf_counter()
+        cursor = await connection.executemany(sql, params_seq)
+        # План запроса одинаков для всех наборов, для EXPLAIN достаточно первого
+        await self._check_slow_query(connection, sql, params_seq[0] if params_seq else (), started)
+        return cursor
+    
+    async def _iter_pages(
+        self,
+        connection: aiosqlite.Connection,
+        sql: str,
+        params: Iterable = (),
+        batch_size: int = FETCH_BATCH_SIZE,
+        row_factory: Optional[Callable] = None
+    ) -> AsyncIterator[List]:
+        """
+        Выполнить запрос и читать его строки страницами, не загружая результат целиком.
+        
+        Выполнение запроса и чтение каждой страницы проверяются на slow_query_ms
+        отдельно: долгий перебор из быстрых страниц медленным не считается.
+        
+        Args:
+            connection: соединение, на котором выполняется запрос
+            sql: текст запроса
+            params: параметры запроса
+            batch_size: количество строк в странице
+            row_factory: фабрика строк курсора
+            
+        Yields:
+            Списки строк длиной не больше batch_size
+        """
+        cursor = await self._execute(connection, sql, params)
+        if row_factory is not None:
+            cursor.row_factory = row_factory
+        try:
+            while True:
+                started = time.perf_counter()
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                await self._check_slow_query(connection, sql, params, started)
+                yield rows
+        finally:
+            await cursor.close()
+    
+    async def _check_slow_query(self, connection: aiosqlite.Connection, sql: str, params: Iterable, started: float):
+        """Записать запрос, начатый в момент started (time.perf_counter), в журнал медленных запросов."""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            await self._log_slow_query(connection, sql, params, elapsed_ms)
+    
+    async def _log_slow_query(self, connection: aiosqlite.Connection, sql: str, params: Iterable, elapsed_ms: float):
+        """
+        Записать медленный запрос в журнал вместе с его EXPLAIN QUERY PLAN.
+        
+        План читается одним обращением к потоку соединения: незавершенный EXPLAIN
+        для UPDATE или DELETE помешал бы фиксации транзакции другой задачей.
+        """
+        try:
+            rows = await connection.execute_fetchall(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = "; ".join(row[3] for row in rows) or "-"
+        except Exception as e:
+            plan = f"недоступен ({e})"
+        statement = " ".join(sql.split())
+        logger.warning(f"Медленный запрос ({elapsed_ms:.1f} мс): {statement} | план: {plan}")
+    
+    @asynccontextmanager
+    async def _exclusive(self):
+        """
+        Занять основное соединение: запросы и фиксации других задач ждут выхода.
+        
+        Нужно пачкам в точке сохранения: чужая фиксация закрыла бы точку сохранения
+        на середине пачки, а чужие изменения откатились бы вместе с ней.
+        """
+        async with self._write_lock:
+            self._exclusive_task = asyncio.current_task()
+            try:
+                # Запросы, поставленные в очередь потока соединения до захвата, должны
+                # выполниться раньше, иначе проверка in_transaction увидит устаревшее состояние
+                await self.connection.execute_fetchall("SELECT 1")
+                yield
+            finally:
+                self._exclusive_task = None
+    
+    async def _wait_exclusive(self):
+        """Дождаться, пока основное соединение освободит занявшая его задача."""
+        while self._exclusive_task is not None and self._exclusive_task is not asyncio.current_task():
+            async with self._write_lock:
+                pass
+    
+    async def _commit(self):
+        """Зафиксировать транзакцию основного соединения, не разрывая чужую пачку."""
+        await self._wait_exclusive()
+        # Ключи, записанные во время фиксации, уже попадут в следующую транзакцию
+        committed_keys, self._uncommitted_keys = self._uncommitted_keys, set()
+        try:
+            await self.connection.commit()
+        except Exception:
+            self._uncommitted_keys |= committed_keys
+            raise
+    
+    def _mark_uncommitted(self, group_id: int, user_ids: Iterable[int]):
+        """Запомнить пользователей, измененных в текущей транзакции; вызывается после выполнения записи."""
+        self._uncommitted_keys.update((group_id, user_id) for user_id in user_ids)
+    
+    async def _commit_write(self):
+        """
+        Зафиксировать изменение сразу или отложить его до групповой фиксации.
         
-        await self.connection.commit()
-        logger.info("Таблицы базы данных созданы или уже существуют")
+        При commit_batch_size > 1 изменения накапливаются в открытой транзакции
+        и фиксируются одним коммитом после commit_batch_size изменений
+        или через commit_interval_ms, смотря что наступит раньше.
+        """
+        self.last_write_at = time.monotonic()
+        if self.commit_batch_size <= 1:
+            await self._commit()
+            return
+        
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_batch_size:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+    
+    async def _commit_now(self):
+        """Зафиксировать изменение сразу вместе со всеми отложенными групповой фиксацией."""
+        self.last_write_at = time.monotonic()
+        self.pending_writes += 1
+        await self.flush()
     
+    async def _delayed_flush(self):
+        """Зафиксировать отложенные изменения по истечении commit_interval_ms."""
+        await asyncio.sleep(self.commit_interval_ms / 1000)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка при групповой фиксации изменений: {e}")
+    
+    @timed
+    async def flush(self):
+        """
+        Зафиксировать на диске все отложенные изменения.
+        
+        Вызывающий код может дождаться этого метода, когда ему нужна гарантия сохранности.
+        """
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+        self._flush_task = None
+        
+        if not self.pending_writes:
+            return
+        
+        pending_writes = self.pending_writes
+        self.pending_writes = 0
+        await self._commit()
+        logger.debug(f"Зафиксировано отложенных изменений: {pending_writes}")
+    
+    @timed
     async def add_restricted_user(
         self,
         user_id: int,
         username: Optional[str] = None,
         first_name: Optional[str] = None,
-        last_name: Optional[str] = None
+        last_name: Optional[str] = None,
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
     ) -> bool:
         """
         Добавить пользователя с ограничениями.
@@ -75,47 +686,116 @@ class Database:
             username: имя пользователя (без @)
             first_name: имя
             last_name: фамилия
+            group_id: ID группы (None - группа по умолчанию)
+            period_days: срок ограничения в днях (None - период по умолчанию)
             
         Returns:
-            True если пользователь успешно добавлен, False если уже существует
+            True если пользователь добавлен, False если он уже был ограничен
+            (его username и имя при этом обновляются, даты ограничения сохраняются)
         """
-        try:
-            now = datetime.utcnow()
-            await self.connection.execute("""
-                INSERT INTO restricted_users (user_id, username, first_name, last_name, joined_at, restricted_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, username, first_name, last_name, now, now))
-            await self.connection.commit()
+        new_user_ids = await self.add_restricted_users(
+            [(user_id, username, first_name, last_name)], group_id, period_days
+        )
+        if new_user_ids:
             logger.info(f"Пользователь {user_id} ({username}) добавлен в ограниченные")
             return True
-        except aiosqlite.IntegrityError:
-            logger.warning(f"Пользователь {user_id} уже существует в ограниченных")
-            return False
+        logger.info(f"Пользователь {user_id} уже ограничен, данные обновлены")
+        return False
+    
+    @timed
+    async def add_restricted_users(
+        self,
+        users: List[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> List[int]:
+        """
+        Добавить пачку пользователей с ограничениями.
+        
+        Вставка идет многострочными INSERT ... ON CONFLICT DO NOTHING RETURNING,
+        которые возвращают только действительно добавленные строки; у уже
+        ограниченных пользователей затем обновляются username и имя.
+        Исключения и откаты операторов для повторных вступлений не используются.
+        Срок окончания ограничения expires_at вычисляется при вставке.
+        
+        Args:
+            users: кортежи (user_id, username, first_name, last_name)
+            group_id: ID группы (None - группа по умолчанию)
+            period_days: срок ограничения в днях (None - период по умолчанию)
+            
+        Returns:
+            ID добавленных пользователей (без уже ограниченных)
+        """
+        if not users:
+            return []
+        group_id = self.group_id if group_id is None else group_id
+        period_days = self.restriction_period_days if period_days is None else period_days
+        now = utc_timestamp()
+        expires_at = now + period_days * SECONDS_PER_DAY
+        
+        new_user_ids: Set[int] = set()
+        for start in range(0, len(users), INSERT_ROWS_PER_QUERY):
+            chunk = users[start:start + INSERT_ROWS_PER_QUERY]
+            values = ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?)"] * len(chunk))
+            params = [
+                value
+                for user_id, username, first_name, last_name in chunk
+                for value in (group_id, user_id, username, first_name, last_name, now, now, expires_at)
+            ]
+            rows = await self._execute_fetchall(self.connection, f"""
+                INSERT INTO restricted_users ({RESTRICTED_COLUMNS})
+                VALUES {values}
+                ON CONFLICT (group_id, user_id) DO NOTHING
+                RETURNING user_id
+            """, params)
+            new_user_ids.update(row[0] for row in rows)
+        
+        existing = [
+            (username, first_name, last_name, group_id, user_id)
+            for user_id, username, first_name, last_name in users
+            if user_id not in new_user_ids
+        ]
+        if existing:
+            await self._executemany(self.connection, """
+                UPDATE restricted_users SET username = ?, first_name = ?, last_name = ?
+                WHERE group_id = ? AND user_id = ?
+            """, existing)
+        
+        self._mark_uncommitted(group_id, (user[0] for user in users))
+        await self._commit_write()
+        return [user_id for user_id in dict.fromkeys(user_id for user_id, *_ in users) if user_id in new_user_ids]
     
-    async def is_user_restricted(self, user_id: int) -> bool:
+    @timed
+    async def is_user_restricted(self, user_id: int, group_id: Optional[int] = None) -> bool:
         """
         Проверить, находится ли пользователь в списке ограниченных.
         
         Args:
             user_id: ID пользователя Telegram
+            group_id: ID группы (None - группа по умолчанию)
             
         Returns:
             True если пользователь ограничен
         """
-        cursor = await self.connection.execute(
-            "SELECT 1 FROM restricted_users WHERE user_id = ?",
-            (user_id,)
-        )
-        result = await cursor.fetchone()
+        group_id = self.group_id if group_id is None else group_id
+        async with self._read_connection([(group_id, user_id)]) as connection:
+            cursor = await self._execute(
+                connection,
+                "SELECT 1 FROM restricted_users WHERE group_id = ? AND user_id = ?",
+                (group_id, user_id)
+            )
+            result = await cursor.fetchone()
         return result is not None
     
+    @timed
     async def add_banned_user(
         self,
         user_id: int,
         username: Optional[str] = None,
         first_name: Optional[str] = None,
         last_name: Optional[str] = None,
-        reason: str = "Expired restriction period"
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
     ) -> bool:
         """
         Добавить пользователя в список забаненных (удаленных).
@@ -126,105 +806,828 @@ class Database:
             first_name: имя
             last_name: фамилия
             reason: причина бана
+            group_id: ID группы (None - группа по умолчанию)
             
         Returns:
             True если пользователь успешно добавлен
         """
+        group_id = self.group_id if group_id is None else group_id
         try:
-            now = datetime.utcnow()
-            await self.connection.execute("""
-                INSERT OR REPLACE INTO banned_users (user_id, username, first_name, last_name, banned_at, reason)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, username, first_name, last_name, now, reason))
-            await self.connection.commit()
+            now = utc_timestamp()
+            await self._execute(self.connection, """
+                INSERT INTO banned_users (group_id, user_id, username, first_name, last_name, banned_at, reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (group_id, user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    banned_at = excluded.banned_at,
+                    reason = excluded.reason
+            """, (group_id, user_id, username, first_name, last_name, now, reason))
+            self._mark_uncommitted(group_id, [user_id])
+            await self._commit_write()
+            self._remember_banned([(group_id, user_id)])
             logger.info(f"Пользователь {user_id} ({username}) добавлен в забаненные: {reason}")
             return True
         except Exception as e:
             logger.error(f"Ошибка при добавлении пользователя в banned: {e}")
             return False
     
-    async def is_user_banned(self, user_id: int) -> bool:
+    @timed
+    async def is_user_banned(self, user_id: int, group_id: Optional[int] = None) -> bool:
         """
         Проверить, находится ли пользователь в списке забаненных.
         
         Args:
             user_id: ID пользователя Telegram
+            group_id: ID группы (None - группа по умолчанию)
             
         Returns:
             True если пользователь забанен
         """
-        cursor = await self.connection.execute(
-            "SELECT 1 FROM banned_users WHERE user_id = ?",
-            (user_id,)
-        )
-        result = await cursor.fetchone()
-        return result is not None
+        group_id = self.group_id if group_id is None else group_id
+        if self.banned_ids is not None:
+            return user_id in self.banned_ids.get(group_id, ())
+        
+        # Отрицательный ответ фильтра Блума точен - запрос к БД не нужен
+        if self.banned_filter is not None and user_id not in self.banned_filter:
+            return False
+        
+        async with self._read_connection([(group_id, user_id)]) as connection:
+            cursor = await self._execute(
+                connection,
+                "SELECT 1 FROM banned_users WHERE group_id = ? AND user_id = ?",
+                (group_id, user_id)
+            )
+            result = await cursor.fetchone()
+        if result is not None:
+            return True
+        
+        # Старые баны перенесены в холодный архив
+        archive = self.archives.get(group_id)
+        return archive is not None and user_id in archive
+    
+    @timed
+    async def get_banned_user_ids(self, user_ids: List[int], group_id: Optional[int] = None) -> Set[int]:
+        """
+        Проверить пачку пользователей по списку забаненных.
+        
+        Кэш ID и фильтр Блума отсеивают пользователей без запроса к БД, остальные
+        проверяются запросами с IN (...) по MAX_QUERY_PARAMS ID и холодным архивом.
+        
+        Args:
+            user_ids: список ID пользователей Telegram
+            group_id: ID группы (None - группа по умолчанию)
+            
+        Returns:
+            Множество ID забаненных пользователей из user_ids
+        """
+        group_id = self.group_id if group_id is None else group_id
+        candidates = list(dict.fromkeys(user_ids))
+        if self.banned_ids is not None:
+            return self.banned_ids.get(group_id, set()).intersection(candidates)
+        
+        if self.banned_filter is not None:
+            candidates = [user_id for user_id in candidates if user_id in self.banned_filter]
+        
+        banned: Set[int] = set()
+        if candidates:
+            async with self._read_connection((group_id, user_id) for user_id in candidates) as connection:
+                for start in range(0, len(candidates), MAX_QUERY_PARAMS):
+                    chunk = candidates[start:start + MAX_QUERY_PARAMS]
+                    cursor = await self._execute(
+                        connection,
+                        f"SELECT user_id FROM banned_users WHERE group_id = ? AND user_id IN ({', '.join('?' * len(chunk))})",
+                        (group_id, *chunk)
+                    )
+                    banned.update(row[0] for row in await cursor.fetchall())
+        
+        archive = self.archives.get(group_id)
+        if archive is not None:
+            banned.update(user_id for user_id in candidates if user_id not in banned and user_id in archive)
+        return banned
     
-    async def remove_restricted_user(self, user_id: int) -> bool:
+    @timed
+    async def remove_restricted_user(self, user_id: int, group_id: Optional[int] = None) -> bool:
         """
         Удалить пользователя из списка ограниченных.
         
         Args:
             user_id: ID пользователя Telegram
+            group_id: ID группы (None - группа по умолчанию)
             
         Returns:
             True если пользователь был удален
         """
-        cursor = await self.connection.execute(
-            "DELETE FROM restricted_users WHERE user_id = ?",
-            (user_id,)
+        group_id = self.group_id if group_id is None else group_id
+        cursor = await self._execute(
+            self.connection,
+            "DELETE FROM restricted_users WHERE group_id = ? AND user_id = ?",
+            (group_id, user_id)
         )
-        await self.connection.commit()
+        self._mark_uncommitted(group_id, [user_id])
+        await self._commit_write()
         deleted = cursor.rowcount > 0
         if deleted:
             logger.info(f"Пользователь {user_id} удален из ограниченных")
         return deleted
     
-    async def get_expired_restrictions(self, days: int) -> List[Dict]:
+    @timed
+    async def expire_restricted_users(
+        self,
+        user_ids: List[int],
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> int:
+        """
+        Перенести пачку пользователей группы из ограниченных в забаненные одной транзакцией.
+        
+        Записи копируются через INSERT ... SELECT, поэтому имя и username берутся
+        из restricted_users. Либо переносятся все пользователи пачки, либо никто.
+        Пачка выполняется в точке сохранения: при ошибке откатываются только ее
+        операторы, а отложенные групповой фиксацией изменения других вызовов остаются.
+        
+        Args:
+            user_ids: список ID пользователей Telegram
+            reason: причина бана
+            group_id: ID группы (None - группа по умолчанию)
+            
+        Returns:
+            Количество перенесенных пользователей
+        """
+        if not user_ids:
+            return 0
+        
+        group_id = self.group_id if group_id is None else group_id
+        now = utc_timestamp()
+        moved_ids = []
+        async with self._exclusive():
+            if not self.connection.in_transaction:
+                await self.connection.execute("BEGIN")
+            await self.connection.execute("SAVEPOINT expire")
+            try:
+                for start in range(0, len(user_ids), MAX_QUERY_PARAMS):
+                    chunk = user_ids[start:start + MAX_QUERY_PARAMS]
+                    placeholders = ", ".join("?" * len(chunk))
+                    cursor = await self._execute(
+                        self.connection,
+                        f"SELECT user_id FROM restricted_users WHERE group_id = ? AND user_id IN ({placeholders})",
+                        (group_id, *chunk)
+                    )
+                    moved_ids.extend(row[0] for row in await cursor.fetchall())
+                    await self._execute(self.connection, f"""
+                        INSERT INTO banned_users (group_id, user_id, username, first_name, last_name, banned_at, reason)
+                        SELECT group_id, user_id, username, first_name, last_name, ?, ?
+                        FROM restricted_users
+                        WHERE group_id = ? AND user_id IN ({placeholders})
+                        ON CONFLICT (group_id, user_id) DO UPDATE SET
+                            username = excluded.username,
+                            first_name = excluded.first_name,
+                            last_name = excluded.last_name,
+                            banned_at = excluded.banned_at,
+                            reason = excluded.reason
+                    """, (now, reason, group_id, *chunk))
+                    await self._execute(
+                        self.connection,
+                        f"DELETE FROM restricted_users WHERE group_id = ? AND user_id IN ({placeholders})",
+                        (group_id, *chunk)
+                    )
+                await self._execute(
+                    self.connection,
+                    "UPDATE counters SET value = value + ? WHERE name = 'total_expired'",
+                    (len(moved_ids),)
+                )
+            except Exception:
+                await self.connection.execute("ROLLBACK TO expire")
+                await self.connection.execute("RELEASE expire")
+                # Без отложенных изменений транзакцию незачем держать открытой до следующей записи
+                if not self.pending_writes:
+                    await self._commit()
+                raise
+            await self.connection.execute("RELEASE expire")
+        
+        self._mark_uncommitted(group_id, moved_ids)
+        await self._commit_write()
+        self._remember_banned((group_id, user_id) for user_id in moved_ids)
+        logger.info(f"Перенесено в забаненные {len(moved_ids)} пользователей: {reason}")
+        return len(moved_ids)
+    
+    @timed
+    async def archive_old_bans(self, older_than_days: int) -> int:
+        """
+        Перенести давние баны из banned_users в холодный архив.
+        
+        ID записываются новым сжатым сегментом архива, после чего строки
+        удаляются из таблицы пачками, чтобы не блокировать обработчики бота.
+        Если процесс прервется после записи сегмента, оставшиеся строки будут
+        и в таблице, и в архиве - это не нарушает проверку is_user_banned.
+        
+        Args:
+            older_than_days: возраст бана в днях, после которого он переносится в архив
+            
+        Returns:
+            Количество перенесенных в архив пользователей
+        """
+        cutoff_date = utc_timestamp() - older_than_days * SECONDS_PER_DAY
+        group_user_ids: Dict[int, array] = {}
+        async for rows in self._iter_pages(
+            self.connection,
+            "SELECT group_id, user_id FROM banned_users WHERE banned_at < ? ORDER BY group_id, user_id",
+            (cutoff_date,)
+        ):
+            for group_id, user_id in rows:
+                group_user_ids.setdefault(group_id, array('q')).append(user_id)
+        if not group_user_ids:
+            return 0
+        
+        total = 0
+        for group_id, user_ids in group_user_ids.items():
+            await asyncio.to_thread(self._archive(group_id).add_segment, user_ids)
+            
+            for start in range(0, len(user_ids), MAX_QUERY_PARAMS):
+                chunk = user_ids[start:start + MAX_QUERY_PARAMS].tolist()
+                placeholders = ", ".join("?" * len(chunk))
+                # Повторно забаненные за это время пользователи остаются в таблице
+                cursor = await self._execute(
+                    self.connection,
+                    f"DELETE FROM banned_users WHERE group_id = ? AND user_id IN ({placeholders}) AND banned_at < ?",
+                    (group_id, *chunk, cutoff_date)
+                )
+                await self._execute(
+                    self.connection,
+                    "UPDATE counters SET value = value + ? WHERE name = 'archived_users'",
+                    (cursor.rowcount,)
+                )
+                await self._commit_write()
+                total += cursor.rowcount
+                await asyncio.sleep(0)
+        
+        await self.flush()
+        logger.info(f"Перенесено в архив {total} забаненных пользователей старше {older_than_days} дней")
+        return total
+    
+    @timed
+    async def backup(self, backup_dir: str, keep: int = 7, compress: bool = False) -> Optional[str]:
+        """
+        Создать резервную копию базы данных, не останавливая работу бота.
+        
+        Args:
+            backup_dir: каталог резервных копий
+            keep: сколько последних копий хранить
+            compress: сжимать ли копию в gzip
+            
+        Returns:
+            Путь к созданной копии или None для базы в памяти
+        """
+        if self.db_path == ':memory:':
+            logger.warning("Резервное копирование базы в памяти не поддерживается")
+            return None
+        
+        # Отложенные изменения должны попасть в копию
+        await self.flush()
+        
+        started = time.perf_counter()
+        backup_path = await asyncio.to_thread(
+            create_backup,
+            self.db_path,
+            backup_dir,
+            keep,
+            compress,
+            str(self.archive_path)
+        )
+        elapsed = time.perf_counter() - started
+        logger.info(f"Резервная копия базы данных создана за {elapsed:.1f} с: {backup_path}")
+        return str(backup_path)
+    
+    @timed
+    async def get_expired_restrictions(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        group_id: Optional[int] = None
+    ) -> List[RestrictedUser]:
         """
-        Получить список пользователей, у которых истек срок ограничений.
+        Получить список пользователей группы, у которых истек срок ограничений.
+        
+        Выборка - диапазон индекса по expires_at <= текущее время. Пользователи
+        возвращаются в порядке (expires_at, user_id), начиная с самых давно истекших;
+        expires_at - секунды эпохи Unix (UTC).
+        Для постраничного обхода передайте в after пару (expires_at, user_id)
+        последней записи предыдущей страницы.
         
         Args:
-            days: количество дней для проверки истечения ограничений
+            limit: максимальное количество записей (None - без ограничения)
+            after: ключ (expires_at, user_id), после которого продолжить выборку
+            group_id: ID группы (None - группа по умолчанию)
             
         Returns:
-            Список словарей с информацией о пользователях
+            Список записей RestrictedUser
         """
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        cursor = await self.connection.execute("""
-            SELECT user_id, username, first_name, last_name, restricted_at
+        group_id = self.group_id if group_id is None else group_id
+        query = f"""
+            SELECT {RESTRICTED_COLUMNS}
             FROM restricted_users
-            WHERE restricted_at <= ?
-        """, (cutoff_date,))
-        
-        rows = await cursor.fetchall()
-        results = []
-        for row in rows:
-            results.append({
-                'user_id': row[0],
-                'username': row[1],
-                'first_name': row[2],
-                'last_name': row[3],
-                'restricted_at': row[4]
-            })
+            WHERE group_id = ? AND expires_at <= ?
+        """
+        params: List[Any] = [group_id, utc_timestamp()]
+        
+        if after is not None:
+            query += " AND (expires_at, user_id) > (?, ?)"
+            params.extend(after)
+        
+        query += " ORDER BY expires_at, user_id"
+        
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        async with self._read_connection() as connection:
+            cursor = await self._execute(connection, query, params)
+            cursor.row_factory = record_factory(RestrictedUser)
+            results = await cursor.fetchall()
         
         logger.info(f"Найдено {len(results)} пользователей с истекшими ограничениями")
         return results
     
+    async def iter_expired_restrictions(
+        self,
+        batch_size: int = FETCH_BATCH_SIZE,
+        group_id: Optional[int] = None
+    ) -> AsyncIterator[RestrictedUser]:
+        """
+        Перебрать пользователей группы с истекшим сроком ограничений, не загружая их все в память.
+        
+        Строки читаются из одного курсора пачками по batch_size, поэтому обработку
+        первых пользователей можно начинать, пока остальные еще не прочитаны.
+        Удаление уже полученных пользователей во время перебора допустимо.
+        Перебор идет через основное соединение, чтобы не занимать пул читателей
+        на все время проверки.
+        
+        Args:
+            batch_size: количество строк, читаемых за один раз
+            group_id: ID группы (None - группа по умолчанию)
+            
+        Yields:
+            Записи RestrictedUser в порядке (expires_at, user_id)
+        """
+        group_id = self.group_id if group_id is None else group_id
+        found = 0
+        async for rows in self._iter_pages(self.connection, f"""
+            SELECT {RESTRICTED_COLUMNS}
+            FROM restricted_users
+            WHERE group_id = ? AND expires_at <= ?
+            ORDER BY expires_at, user_id
+        """, (group_id, utc_timestamp()), batch_size, record_factory(RestrictedUser)):
+            for row in rows:
+                found += 1
+                yield row
+        
+        logger.info(f"Перебрано {found} пользователей с истекшими ограничениями")
+    
+    @timed
+    async def increment_counter(self, name: str, delta: int = 1):
+        """
+        Увеличить накопительный счетчик статистики.
+        
+        Args:
+            name: имя счетчика из COUNTERS
+            delta: величина увеличения
+            
+        Raises:
+            ValueError: если счетчик неизвестен
+        """
+        if name not in COUNTERS:
+            raise ValueError(f"Неизвестный счетчик: {name}")
+        
+        await self._execute(
+            self.connection,
+            "UPDATE counters SET value = value + ? WHERE name = ?",
+            (delta, name)
+        )
+        await self._commit_write()
+    
+    @timed
+    async def log_event(
+        self,
+        event: str,
+        user_id: Optional[int] = None,
+        group_id: Optional[int] = None,
+        details: Optional[str] = None
+    ):
+        """
+        Добавить событие в журнал модерации.
+        
+        События копятся в буфере и записываются одной вставкой, когда набирается
+        event_batch_size событий или проходит EVENT_FLUSH_INTERVAL_MS.
+        
+        Args:
+            event: тип события из EVENT_TYPES
+            user_id: ID пользователя Telegram
+            group_id: ID группы (None - группа по умолчанию)
+            details: подробности (username, текст ошибки и т.п.)
+            
+        Raises:
+            ValueError: если тип события неизвестен
+        """
+        if event not in EVENT_TYPES:
+            raise ValueError(f"Неизвестный тип события: {event}")
+        
+        group_id = self.group_id if group_id is None else group_id
+        self.event_buffer.append((utc_timestamp(), group_id, user_id, event, details))
+        
+        if len(self.event_buffer) >= self.event_batch_size:
+            await self.flush_events()
+        elif self._event_flush_task is None:
+            self._event_flush_task = asyncio.create_task(self._delayed_flush_events())
+    
+    async def _delayed_flush_events(self):
+        """Записать буфер событий по истечении EVENT_FLUSH_INTERVAL_MS."""
+        await asyncio.sleep(EVENT_FLUSH_INTERVAL_MS / 1000)
+        self._event_flush_task = None
+        try:
+            await self.flush_events()
+        except Exception as e:
+            logger.error(f"Ошибка при записи журнала событий: {e}")
+    
+    @timed
+    async def flush_events(self):
+        """Записать буфер событий в таблицу events."""
+        if self._event_flush_task is not None and self._event_flush_task is not asyncio.current_task():
+            self._event_flush_task.cancel()
+        self._event_flush_task = None
+        
+        if not self.event_buffer:
+            return
+        
+        events, self.event_buffer = self.event_buffer, []
+        await self._executemany(
+            self.connection,
+            "INSERT INTO events (created_at, group_id, user_id, event, details) VALUES (?, ?, ?, ?, ?)",
+            events
+        )
+        await self._commit_write()
+    
+    @timed
+    async def get_events(
+        self,
+        user_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """
+        Получить последние события журнала, начиная с самых новых.
+        
+        Args:
+            user_id: только события пользователя (None - все)
+            since: только события не раньше этого времени (секунды эпохи Unix)
+            limit: максимальное количество событий
+            
+        Returns:
+            Список словарей с событиями
+        """
+        await self.flush_events()
+        
+        conditions = []
+        params: List[Any] = []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        
+        async with self._read_connection() as connection:
+            cursor = await self._execute(connection, f"""
+                SELECT created_at, group_id, user_id, event, details
+                FROM events {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            """, params)
+            rows = await cursor.fetchall()
+        
+        return [
+            {'created_at': row[0], 'group_id': row[1], 'user_id': row[2], 'event': row[3], 'details': row[4]}
+            for row in rows
+        ]
+    
+    @timed
+    async def count_events(self, since: int) -> Dict[str, int]:
+        """
+        Посчитать события каждого типа не раньше указанного времени.
+        
+        Args:
+            since: начало периода (секунды эпохи Unix)
+            
+        Returns:
+            Словарь {тип события: количество}
+        """
+        await self.flush_events()
+        
+        async with self._read_connection() as connection:
+            cursor = await self._execute(
+                connection,
+                "SELECT event, COUNT(*) FROM events WHERE created_at >= ? GROUP BY event",
+                (since,)
+            )
+            rows = await cursor.fetchall()
+        
+        counts = {event: 0 for event in EVENT_TYPES}
+        counts.update({event: count for event, count in rows})
+        return counts
+    
+    @timed
+    async def purge_events(self, older_than_days: int, batch_size: int = 1000) -> int:
+        """
+        Удалить события старше срока хранения небольшими пачками.
+        
+        Args:
+            older_than_days: срок хранения событий в днях
+            batch_size: количество событий, удаляемых одной транзакцией
+            
+        Returns:
+            Количество удаленных событий
+        """
+        cutoff_date = utc_timestamp() - older_than_days * SECONDS_PER_DAY
+        deleted = 0
+        while True:
+            cursor = await self._execute(self.connection, """
+                DELETE FROM events WHERE id IN (
+                    SELECT id FROM events WHERE created_at < ? LIMIT ?
+                )
+            """, (cutoff_date, batch_size))
+            await self._commit_write()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+            await asyncio.sleep(0)
+        
+        await self.flush()
+        if deleted:
+            logger.info(f"Удалено {deleted} событий журнала старше {older_than_days} дней")
+        return deleted
+    
+    @timed
+    async def enqueue_actions(self, actions: List[OutboxAction]) -> int:
+        """
+        Записать действия в Telegram в очередь outbox до их выполнения.
+        
+        Запись фиксируется сразу, минуя групповую фиксацию: намерение должно
+        оказаться на диске раньше вызова API. Действия, уже стоящие в очереди
+        (например, оставшиеся после сбоя), не перезаписываются.
+        
+        Args:
+            actions: действия с done=False
+            
+        Returns:
+            Количество новых действий в очереди
+            
+        Raises:
+            ValueError: если тип действия неизвестен
+        """
+        if not actions:
+            return 0
+        for action in actions:
+            if action.action not in OUTBOX_ACTIONS:
+                raise ValueError(f"Неизвестный тип действия: {action.action}")
+        
+        cursor = await self._executemany(self.connection, """
+            INSERT OR IGNORE INTO outbox (group_id, user_id, action, username, created_at, done)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, actions)
+        await self._commit_now()
+        return max(cursor.rowcount, 0)
+    
+    @timed
+    async def complete_actions(self, actions: List[OutboxAction]):
+        """
+        Отметить, что вызовы API действий выполнены.
+        
+        Отметка всей пачки фиксируется сразу одним коммитом: после сбоя
+        выполненные действия не повторяются. Если сбой случится до отметки,
+        повтор безопасен, так как удаление и бан идемпотентны.
+        
+        Args:
+            actions: действия из очереди
+        """
+        if not actions:
+            return
+        await self._executemany(
+            self.connection,
+            "UPDATE outbox SET done = 1 WHERE group_id = ? AND user_id = ? AND action = ?",
+            [(action.group_id, action.user_id, action.action) for action in actions]
+        )
+        await self._commit_now()
+    
+    @timed
+    async def finish_actions(self, actions: List[OutboxAction]):
+        """
+        Убрать из очереди действия, результат которых сохранен в БД или которые отменены.
+        
+        Args:
+            actions: действия из очереди
+        """
+        if not actions:
+            return
+        await self._executemany(
+            self.connection,
+            "DELETE FROM outbox WHERE group_id = ? AND user_id = ? AND action = ?",
+            [(action.group_id, action.user_id, action.action) for action in actions]
+        )
+        await self._commit_write()
+    
+    @timed
+    async def get_pending_actions(self) -> List[OutboxAction]:
+        """
+        Получить действия, оставшиеся в очереди после прерванной проверки.
+        
+        Returns:
+            Записи OutboxAction в порядке постановки в очередь
+        """
+        async with self._read_connection() as connection:
+            cursor = await self._execute(connection, """
+                SELECT group_id, user_id, action, username, created_at, done
+                FROM outbox
+                ORDER BY created_at, group_id, user_id
+            """)
+            cursor.row_factory = record_factory(OutboxAction)
+            return await cursor.fetchall()
+    
+    async def _pragma_value(self, name: str) -> Any:
+        """Прочитать значение PRAGMA через основное соединение."""
+        cursor = await self.connection.execute(f"PRAGMA {name}")
+        row = await cursor.fetchone()
+        return row[0] if row else None
+    
+    @timed
+    async def run_maintenance(self, vacuum_pages: int = 1000, quiet_seconds: int = 60) -> Dict[str, Any]:
+        """
+        Обслуживание базы: статистика планировщика, возврат свободных страниц и контрольная точка WAL.
+        
+        Выполняет PRAGMA optimize (и ANALYZE, если статистики еще нет), затем
+        incremental_vacuum не больше vacuum_pages страниц (если база создана
+        с auto_vacuum=INCREMENTAL) и контрольную точку WAL. Если за последние
+        quiet_seconds были записи, контрольная точка пассивная и не ждет читателей,
+        иначе журнал WAL усекается.
+        
+        Args:
+            vacuum_pages: максимальное количество страниц, возвращаемых за один запуск
+            quiet_seconds: сколько секунд без записей считается затишьем
+            
+        Returns:
+            Отчет: размер страницы, число страниц и свободных страниц, доля свободных
+            страниц в процентах, освобождено страниц, размер файлов БД и WAL в байтах
+        """
+        # Обслуживание занимает соединение целиком: executescript или фиксация
+        # посреди чужой пачки в точке сохранения зафиксировали бы ее половину
+        async with self._exclusive():
+            await self.flush_events()
+            await self.flush()
+            started = time.perf_counter()
+            
+            cursor = await self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            )
+            if await cursor.fetchone() is None:
+                await self.connection.execute("ANALYZE")
+            await self.connection.execute("PRAGMA optimize")
+            await self._commit()
+            
+            freelist_before = await self._pragma_value("freelist_count")
+            if await self._pragma_value("auto_vacuum") == AUTO_VACUUM_INCREMENTAL and vacuum_pages > 0:
+                # incremental_vacuum освобождает по странице за шаг, а execute делает
+                # один шаг оператора без столбцов, поэтому страницы возвращаются
+                # по одной в общей транзакции (executescript зафиксировал бы чужую)
+                await self.connection.execute("BEGIN")
+                for _ in range(min(int(vacuum_pages), freelist_before)):
+                    await self.connection.execute_fetchall("PRAGMA incremental_vacuum(1)")
+                await self._commit()
+            
+            checkpoint = None
+            if await self._pragma_value("journal_mode") == 'wal':
+                quiet = time.monotonic() - self.last_write_at >= quiet_seconds
+                mode = 'TRUNCATE' if quiet else 'PASSIVE'
+                rows = await self.connection.execute_fetchall(f"PRAGMA wal_checkpoint({mode})")
+                busy, log_frames, checkpointed = rows[0]
+                checkpoint = {'mode': mode, 'busy': busy, 'log_frames': log_frames, 'checkpointed': checkpointed}
+            
+            page_size = await self._pragma_value("page_size")
+            page_count = await self._pragma_value("page_count")
+            freelist_count = await self._pragma_value("freelist_count")
+        
+        file_size = wal_size = 0
+        if self.db_path != ':memory:':
+            file_size = os.path.getsize(self.db_path)
+            wal_path = f"{self.db_path}-wal"
+            wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        
+        report = {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'fragmentation': round(100 * freelist_count / page_count, 1) if page_count else 0.0,
+            'freed_pages': max(freelist_before - freelist_count, 0),
+            'file_size': file_size,
+            'wal_size': wal_size,
+            'checkpoint': checkpoint,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        self.last_maintenance = report
+        logger.info(
+            f"Обслуживание БД за {report['elapsed_ms']} мс: освобождено {report['freed_pages']} страниц, "
+            f"свободно {freelist_count} из {page_count} ({report['fragmentation']}%), "
+            f"файл {file_size} байт, WAL {wal_size} байт"
+        )
+        return report
+    
+    @timed
     async def get_stats(self) -> Dict:
         """
         Получить статистику по базе данных.
         
+        Значения читаются из таблицы счетчиков за константное время.
+        
         Returns:
-            Словарь со статистикой
+            Словарь со статистикой: текущие размеры таблиц restricted_users и banned_users,
+            а также накопительные total_restricted, total_expired и total_rebanned
         """
-        cursor = await self.connection.execute("SELECT COUNT(*) FROM restricted_users")
-        restricted_count = (await cursor.fetchone())[0]
+        async with self._read_connection() as connection:
+            cursor = await self._execute(connection, "SELECT name, value FROM counters")
+            rows = await cursor.fetchall()
         
-        cursor = await self.connection.execute("SELECT COUNT(*) FROM banned_users")
-        banned_count = (await cursor.fetchone())[0]
+        stats = {name: 0 for name in COUNTERS}
+        stats.update({name: value for name, value in rows})
+        return stats
+    
+    @timed
+    async def upsert_rows(self, table: str, rows: List[Dict]) -> int:
+        """
+        Массово вставить или обновить строки таблицы пользователей одной транзакцией.
         
-        return {
-            'restricted_users': restricted_count,
-            'banned_users': banned_count
-        }
+        Args:
+            table: restricted_users или banned_users
+            rows: словари со значениями столбцов TABLE_COLUMNS[table]
+            
+        Returns:
+            Количество обработанных строк
+            
+        Raises:
+            ValueError: если таблица не поддерживается
+        """
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Неподдерживаемая таблица: {table}")
+        
+        columns = TABLE_COLUMNS[table]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[2:])
+        if table == 'restricted_users':
+            # Строкам без срока окончания срок считается от даты ограничения по периоду по умолчанию
+            period = self.restriction_period_days * SECONDS_PER_DAY
+            rows = [
+                row if row.get('expires_at') is not None else {**row, 'expires_at': row['restricted_at'] + period}
+                for row in rows
+            ]
+        # Отложенные изменения фиксируются отдельно, чтобы не смешивать их с пачкой импорта
+        await self.flush()
+        await self._executemany(
+            self.connection,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(group_id, user_id) DO UPDATE SET {updates}",
+            [tuple(row.get(column) for column in columns) for row in rows]
+        )
+        await self._commit()
+        
+        if table == 'banned_users':
+            self._remember_banned((row['group_id'], row['user_id']) for row in rows)
+        return len(rows)
+    
+    async def iter_rows(
+        self,
+        table: str,
+        batch_size: int = FETCH_BATCH_SIZE
+    ) -> AsyncIterator[Union[RestrictedUser, BannedUser]]:
+        """
+        Перебрать строки таблицы пользователей в порядке (group_id, user_id), читая пачками.
+        
+        Args:
+            table: restricted_users или banned_users
+            batch_size: количество строк, читаемых за раз
+            
+        Yields:
+            Записи RestrictedUser или BannedUser (по таблице)
+            
+        Raises:
+            ValueError: если таблица не поддерживается
+        """
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Неподдерживаемая таблица: {table}")
+        
+        columns = TABLE_COLUMNS[table]
+        async for rows in self._iter_pages(
+            self.connection,
+            f"SELECT {', '.join(columns)} FROM {table} ORDER BY group_id, user_id",
+            batch_size=batch_size,
+            row_factory=record_factory(TABLE_RECORDS[table])
+        ):
+            for row in rows:
+                yield row
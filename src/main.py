@@ -8,6 +8,8 @@ from pathlib import Path
 
 from .config import Config
 from .database import Database
+from .sharding import ShardedDatabase
+from .memory_storage import MemoryStorage
 from .bot import SpamRestrictorBot
 
 
@@ -49,8 +51,11 @@ async def main():
     logger.info("=" * 50)
     logger.info("Запуск Spam Restrictor Bot")
     logger.info("=" * 50)
-    logger.info(f"Группа ID: {config.group_id}")
+    logger.info(f"Группы ID: {', '.join(str(group_id) for group_id in config.group_ids)}")
+    logger.info(f"Хранилище: {config.storage_backend}")
     logger.info(f"База данных: {config.database_path}")
+    if config.storage_backend == 'sqlite' and config.db_shards > 1:
+        logger.info(f"Шардов базы данных: {config.db_shards}")
     logger.info(f"Период ограничения: {config.restriction_period_days} дней")
     logger.info(f"Интервал проверки: {config.check_interval_seconds} сек")
     
@@ -58,8 +63,38 @@ async def main():
     db_path = Path(config.database_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # Создаем объекты базы данных и бота
-    database = Database(config.database_path)
+    # Создаем объекты хранилища и бота
+    if config.storage_backend == 'memory':
+        database = MemoryStorage(
+            snapshot_path=config.memory_snapshot_path,
+            snapshot_interval_seconds=config.memory_snapshot_interval_seconds,
+            group_id=config.group_id,
+            restriction_period_days=config.restriction_period_days
+        )
+    elif config.storage_backend == 'sqlite':
+        # Шарды получают те же параметры, что и единственный файл БД
+        options = dict(
+            pragmas=config.sqlite_pragmas,
+            commit_batch_size=config.db_commit_batch_size,
+            commit_interval_ms=config.db_commit_interval_ms,
+            cache_banned_ids=config.cache_banned_ids,
+            bloom_capacity=config.bloom_capacity,
+            bloom_error_rate=config.bloom_error_rate,
+            read_pool_size=config.db_read_pool_size,
+            archive_path=config.ban_archive_path,
+            group_id=config.group_id,
+            event_batch_size=config.event_batch_size,
+            slow_query_ms=config.slow_query_ms,
+            restriction_period_days=config.restriction_period_days
+        )
+        if config.db_shards > 1:
+            database = ShardedDatabase(config.database_path, config.db_shards, **options)
+        else:
+            database = Database(config.database_path, **options)
+    else:
+        logger.error(f"Неизвестный тип хранилища: {config.storage_backend}")
+        sys.exit(1)
+    
     bot = SpamRestrictorBot(config, database)
     
     # Запускаем бота
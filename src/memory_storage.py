@@ -0,0 +1,487 @@
+"""
+Хранилище данных бота в памяти.
+Не обращается к диску на каждом изменении: подходит для нагрузочных тестов,
+бенчмарков и временных развертываний. Может периодически сохранять снимок в файл.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+from typing import Optional, List, Dict, Set, Tuple, AsyncIterator, Any
+
+from .records import BannedUser, OutboxAction, RestrictedUser
+from .storage import (
+    COUNTERS, EVENT_TYPES, FETCH_BATCH_SIZE, LEGACY_GROUP_ID, OUTBOX_ACTIONS, SECONDS_PER_DAY, utc_timestamp
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage:
+    def __init__(
+        self,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval_seconds: int = 300,
+        group_id: int = LEGACY_GROUP_ID,
+        restriction_period_days: int = 30
+    ):
+        """
+        Инициализация хранилища в памяти.
+        
+        Args:
+            snapshot_path: путь к файлу снимка (None - без сохранения на диск)
+            snapshot_interval_seconds: интервал периодического сохранения снимка
+            group_id: группа по умолчанию для методов, которым группа не передана явно
+            restriction_period_days: срок ограничения по умолчанию для новых ограничений
+        """
+        self.group_id = group_id
+        self.restriction_period_days = restriction_period_days
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        self.pragma_profile: Dict[str, Any] = {}
+        # Записи по ключу (group_id, user_id)
+        self.restricted_users: Dict[Tuple[int, int], RestrictedUser] = {}
+        self.banned_users: Dict[Tuple[int, int], BannedUser] = {}
+        self.counters: Dict[str, int] = {name: 0 for name in COUNTERS}
+        # Кучи (expires_at, user_id) по группам; записи удаленных пользователей вычищаются лениво
+        self._expiry_heaps: Dict[int, List[Tuple[int, int]]] = {}
+        # Журнал событий в порядке записи
+        self.events: List[Dict] = []
+        # Очередь действий в Telegram по ключу (group_id, user_id, action)
+        self.outbox: Dict[Tuple[int, int, str], OutboxAction] = {}
+        self._snapshot_task: Optional[asyncio.Task] = None
+    
+    async def connect(self):
+        """Загрузить снимок, если он есть, и запустить периодическое сохранение."""
+        if self.snapshot_path:
+            await asyncio.to_thread(self._load_snapshot)
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        logger.info(f"Хранилище в памяти готово: {len(self.restricted_users)} ограниченных, "
+                    f"{len(self.banned_users)} забаненных")
+    
+    async def close(self):
+        """Остановить периодическое сохранение и сохранить финальный снимок."""
+        if self._snapshot_task and not self._snapshot_task.done():
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        logger.info("Хранилище в памяти закрыто")
+    
+    async def flush(self):
+        """Сохранить снимок на диск (если он включен)."""
+        if not self.snapshot_path:
+            return
+        
+        # Копия снимается в потоке событийного цикла, чтобы запись в файл
+        # в отдельном потоке не видела изменений словарей на полпути
+        snapshot = {
+            'restricted_users': [user._asdict() for user in self.restricted_users.values()],
+            'banned_users': [user._asdict() for user in self.banned_users.values()],
+            'counters': dict(self.counters),
+            'events': list(self.events),
+            'outbox': [action._asdict() for action in self.outbox.values()],
+        }
+        await asyncio.to_thread(self._save_snapshot, snapshot)
+    
+    async def _snapshot_loop(self):
+        """Периодически сохранять снимок."""
+        while True:
+            await asyncio.sleep(self.snapshot_interval_seconds)
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.error(f"Ошибка при сохранении снимка хранилища: {e}")
+    
+    def _save_snapshot(self, snapshot: Dict):
+        """Записать снимок в файл атомарной заменой."""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+        logger.debug(f"Снимок хранилища сохранен: {self.snapshot_path}")
+    
+    def _load_snapshot(self):
+        """Прочитать снимок из файла."""
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        
+        # Снимки до появления групп не содержат group_id, а до появления expires_at - срока окончания
+        for user in snapshot['restricted_users'] + snapshot['banned_users']:
+            user.setdefault('group_id', self.group_id)
+        period = self.restriction_period_days * SECONDS_PER_DAY
+        for user in snapshot['restricted_users']:
+            user.setdefault('expires_at', user['restricted_at'] + period)
+        self.restricted_users = {
+            (user['group_id'], user['user_id']): RestrictedUser(**user) for user in snapshot['restricted_users']
+        }
+        self.banned_users = {
+            (user['group_id'], user['user_id']): BannedUser(**user) for user in snapshot['banned_users']
+        }
+        self.counters.update(snapshot.get('counters', {}))
+        # Снимки до появления журнала событий и outbox не содержат их
+        self.events = snapshot.get('events', [])
+        self.outbox = {
+            (action['group_id'], action['user_id'], action['action']): OutboxAction(**action)
+            for action in snapshot.get('outbox', [])
+        }
+        self._rebuild_expiry_heaps()
+        logger.info(f"Снимок хранилища загружен: {self.snapshot_path}")
+    
+    async def add_restricted_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> bool:
+        """
+        Добавить пользователя с ограничениями.
+        
+        Returns:
+            True если пользователь добавлен, False если он уже был ограничен (данные обновляются)
+        """
+        if await self.add_restricted_users([(user_id, username, first_name, last_name)], group_id, period_days):
+            logger.info(f"Пользователь {user_id} ({username}) добавлен в ограниченные")
+            return True
+        logger.info(f"Пользователь {user_id} уже ограничен, данные обновлены")
+        return False
+    
+    async def add_restricted_users(
+        self,
+        users: List[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> List[int]:
+        """
+        Добавить пачку пользователей с ограничениями; у уже ограниченных обновить username и имя.
+        
+        Returns:
+            ID добавленных пользователей (без уже ограниченных)
+        """
+        group_id = self.group_id if group_id is None else group_id
+        period_days = self.restriction_period_days if period_days is None else period_days
+        now = utc_timestamp()
+        expires_at = now + period_days * SECONDS_PER_DAY
+        new_user_ids = []
+        for user_id, username, first_name, last_name in users:
+            key = (group_id, user_id)
+            user = self.restricted_users.get(key)
+            if user is not None:
+                self.restricted_users[key] = user._replace(username=username, first_name=first_name, last_name=last_name)
+                continue
+            self.restricted_users[key] = RestrictedUser(
+                group_id, user_id, username, first_name, last_name,
+                joined_at=now, restricted_at=now, expires_at=expires_at
+            )
+            heapq.heappush(self._expiry_heaps.setdefault(group_id, []), (expires_at, user_id))
+            new_user_ids.append(user_id)
+        
+        self.counters['total_restricted'] += len(new_user_ids)
+        return new_user_ids
+    
+    async def is_user_restricted(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Проверить, находится ли пользователь в списке ограниченных."""
+        group_id = self.group_id if group_id is None else group_id
+        return (group_id, user_id) in self.restricted_users
+    
+    async def add_banned_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> bool:
+        """
+        Добавить пользователя в список забаненных.
+        
+        Returns:
+            True если пользователь успешно добавлен
+        """
+        group_id = self.group_id if group_id is None else group_id
+        self.banned_users[(group_id, user_id)] = BannedUser(
+            group_id, user_id, username, first_name, last_name, banned_at=utc_timestamp(), reason=reason
+        )
+        logger.info(f"Пользователь {user_id} ({username}) добавлен в забаненные: {reason}")
+        return True
+    
+    async def is_user_banned(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Проверить, находится ли пользователь в списке забаненных."""
+        group_id = self.group_id if group_id is None else group_id
+        return (group_id, user_id) in self.banned_users
+    
+    async def get_banned_user_ids(self, user_ids: List[int], group_id: Optional[int] = None) -> Set[int]:
+        """Проверить пачку пользователей по списку забаненных и вернуть ID забаненных."""
+        group_id = self.group_id if group_id is None else group_id
+        return {user_id for user_id in user_ids if (group_id, user_id) in self.banned_users}
+    
+    async def remove_restricted_user(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """
+        Удалить пользователя из списка ограниченных.
+        
+        Returns:
+            True если пользователь был удален
+        """
+        group_id = self.group_id if group_id is None else group_id
+        deleted = self.restricted_users.pop((group_id, user_id), None) is not None
+        if deleted:
+            self._compact_expiry_heaps()
+            logger.info(f"Пользователь {user_id} удален из ограниченных")
+        return deleted
+    
+    async def expire_restricted_users(
+        self,
+        user_ids: List[int],
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> int:
+        """
+        Перенести пачку пользователей группы из ограниченных в забаненные.
+        
+        Returns:
+            Количество перенесенных пользователей
+        """
+        group_id = self.group_id if group_id is None else group_id
+        now = utc_timestamp()
+        moved = 0
+        for user_id in user_ids:
+            user = self.restricted_users.pop((group_id, user_id), None)
+            if user is None:
+                continue
+            self.banned_users[(group_id, user_id)] = BannedUser(
+                group_id, user_id, user.username, user.first_name, user.last_name, banned_at=now, reason=reason
+            )
+            moved += 1
+        
+        self.counters['total_expired'] += moved
+        self._compact_expiry_heaps()
+        if user_ids:
+            logger.info(f"Перенесено в забаненные {moved} пользователей: {reason}")
+        return moved
+    
+    async def archive_old_bans(self, older_than_days: int) -> int:
+        """Холодный архив нужен только для SQLite: в памяти все баны и так в словаре."""
+        return 0
+    
+    async def backup(self, backup_dir: str, keep: int = 7, compress: bool = False) -> Optional[str]:
+        """Резервные копии делаются только для SQLite: хранилище в памяти сохраняет снимки."""
+        return None
+    
+    def _rebuild_expiry_heaps(self):
+        """Построить кучи истечения ограничений по текущим записям."""
+        self._expiry_heaps = {}
+        for user in self.restricted_users.values():
+            self._expiry_heaps.setdefault(user.group_id, []).append((user.expires_at, user.user_id))
+        for heap in self._expiry_heaps.values():
+            heapq.heapify(heap)
+    
+    def _compact_expiry_heaps(self):
+        """Перестроить кучи, когда в них накопилось больше половины устаревших записей."""
+        heap_size = sum(len(heap) for heap in self._expiry_heaps.values())
+        if heap_size > 2 * len(self.restricted_users) + 64:
+            self._rebuild_expiry_heaps()
+    
+    def _expired_keys(self, group_id: int, now: int) -> List[Tuple[int, int]]:
+        """
+        Получить отсортированные ключи (expires_at, user_id) группы с expires_at <= now.
+        
+        Обходятся только узлы кучи не позже now: поддерево узла с более
+        поздней датой целиком пропускается.
+        """
+        heap = self._expiry_heaps.get(group_id, [])
+        keys = []
+        stack = [0] if heap else []
+        while stack:
+            index = stack.pop()
+            key = heap[index]
+            if key[0] > now:
+                continue
+            user = self.restricted_users.get((group_id, key[1]))
+            if user is not None and user.expires_at == key[0]:
+                keys.append(key)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    stack.append(child)
+        # Пользователь, повторно ограниченный в ту же секунду, может встретиться в куче дважды
+        return sorted(set(keys))
+    
+    async def get_expired_restrictions(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        group_id: Optional[int] = None
+    ) -> List[RestrictedUser]:
+        """
+        Получить список пользователей, у которых истек срок ограничений.
+        
+        Args:
+            limit: максимальное количество записей (None - без ограничения)
+            after: ключ (expires_at, user_id), после которого продолжить выборку
+            group_id: ID группы (None - группа по умолчанию)
+            
+        Returns:
+            Список записей RestrictedUser
+        """
+        group_id = self.group_id if group_id is None else group_id
+        keys = self._expired_keys(group_id, utc_timestamp())
+        if after is not None:
+            keys = [key for key in keys if key > tuple(after)]
+        if limit is not None:
+            keys = keys[:limit]
+        
+        # Записи неизменяемы, поэтому возвращаются без копирования
+        results = [self.restricted_users[(group_id, user_id)] for _, user_id in keys]
+        logger.info(f"Найдено {len(results)} пользователей с истекшими ограничениями")
+        return results
+    
+    async def iter_expired_restrictions(
+        self,
+        batch_size: int = FETCH_BATCH_SIZE,
+        group_id: Optional[int] = None
+    ) -> AsyncIterator[RestrictedUser]:
+        """Перебрать пользователей группы с истекшим сроком ограничений в порядке (expires_at, user_id)."""
+        group_id = self.group_id if group_id is None else group_id
+        keys = self._expired_keys(group_id, utc_timestamp())
+        for index, (_, user_id) in enumerate(keys, start=1):
+            user = self.restricted_users.get((group_id, user_id))
+            if user is not None:
+                yield user
+            # Даем поработать другим задачам между пачками
+            if index % batch_size == 0:
+                await asyncio.sleep(0)
+        
+        logger.info(f"Перебрано {len(keys)} пользователей с истекшими ограничениями")
+    
+    async def increment_counter(self, name: str, delta: int = 1):
+        """
+        Увеличить накопительный счетчик статистики.
+        
+        Raises:
+            ValueError: если счетчик неизвестен
+        """
+        if name not in COUNTERS:
+            raise ValueError(f"Неизвестный счетчик: {name}")
+        self.counters[name] += delta
+    
+    async def log_event(
+        self,
+        event: str,
+        user_id: Optional[int] = None,
+        group_id: Optional[int] = None,
+        details: Optional[str] = None
+    ):
+        """
+        Добавить событие в журнал модерации.
+        
+        Raises:
+            ValueError: если тип события неизвестен
+        """
+        if event not in EVENT_TYPES:
+            raise ValueError(f"Неизвестный тип события: {event}")
+        self.events.append({
+            'created_at': utc_timestamp(),
+            'group_id': self.group_id if group_id is None else group_id,
+            'user_id': user_id,
+            'event': event,
+            'details': details,
+        })
+    
+    async def flush_events(self):
+        """Журнал в памяти не буферизуется."""
+    
+    async def get_events(
+        self,
+        user_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """Получить последние события журнала, начиная с самых новых."""
+        results = []
+        for event in reversed(self.events):
+            if len(results) >= limit:
+                break
+            if user_id is not None and event['user_id'] != user_id:
+                continue
+            if since is not None and event['created_at'] < since:
+                break
+            results.append(dict(event))
+        return results
+    
+    async def count_events(self, since: int) -> Dict[str, int]:
+        """Посчитать события каждого типа не раньше указанного времени."""
+        counts = {event: 0 for event in EVENT_TYPES}
+        for event in reversed(self.events):
+            if event['created_at'] < since:
+                break
+            counts[event['event']] += 1
+        return counts
+    
+    async def purge_events(self, older_than_days: int, batch_size: int = 1000) -> int:
+        """Удалить события старше срока хранения."""
+        cutoff_date = utc_timestamp() - older_than_days * SECONDS_PER_DAY
+        # События добавляются в порядке времени, поэтому устаревшие идут в начале списка
+        stale = 0
+        while stale < len(self.events) and self.events[stale]['created_at'] < cutoff_date:
+            stale += 1
+        del self.events[:stale]
+        return stale
+    
+    async def enqueue_actions(self, actions: List[OutboxAction]) -> int:
+        """
+        Записать действия в Telegram в очередь до их выполнения.
+        
+        Очередь попадает в снимок, но переживает сбой, только если
+        успела сохраниться в нем: в этом хранилище она best-effort.
+        
+        Returns:
+            Количество новых действий в очереди
+            
+        Raises:
+            ValueError: если тип действия неизвестен
+        """
+        added = 0
+        for action in actions:
+            if action.action not in OUTBOX_ACTIONS:
+                raise ValueError(f"Неизвестный тип действия: {action.action}")
+            key = (action.group_id, action.user_id, action.action)
+            if key not in self.outbox:
+                self.outbox[key] = action
+                added += 1
+        return added
+    
+    async def complete_actions(self, actions: List[OutboxAction]):
+        """Отметить, что вызовы API действий выполнены."""
+        for action in actions:
+            key = (action.group_id, action.user_id, action.action)
+            if key in self.outbox:
+                self.outbox[key] = self.outbox[key]._replace(done=True)
+    
+    async def finish_actions(self, actions: List[OutboxAction]):
+        """Убрать действия из очереди."""
+        for action in actions:
+            self.outbox.pop((action.group_id, action.user_id, action.action), None)
+    
+    async def get_pending_actions(self) -> List[OutboxAction]:
+        """Получить действия, оставшиеся в очереди, в порядке постановки."""
+        return sorted(self.outbox.values(), key=lambda action: (action.created_at, action.group_id, action.user_id))
+    
+    async def run_maintenance(self, vacuum_pages: int = 1000, quiet_seconds: int = 60) -> Dict:
+        """Обслуживание нужно только SQLite: хранилищу в памяти нечего уплотнять."""
+        return {}
+    
+    async def get_stats(self) -> Dict:
+        """Получить статистику по хранилищу."""
+        stats = dict(self.counters)
+        stats['restricted_users'] = len(self.restricted_users)
+        stats['banned_users'] = len(self.banned_users)
+        return stats
@@ -0,0 +1,96 @@
+"""
+Модуль замеров времени выполнения методов хранилища.
+Для каждого метода хранится общее число вызовов, максимум и скользящее окно
+последних длительностей, по которому считаются перцентили.
+"""
+import functools
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List
+
+# Число последних замеров, по которым считаются перцентили
+DEFAULT_WINDOW = 1024
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    Перцентиль по методу ближайшего ранга.
+    
+    Args:
+        samples: отсортированные по возрастанию значения
+        q: перцентиль от 0 до 100
+        
+    Returns:
+        Значение перцентиля (0.0 для пустой выборки)
+    """
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+class LatencyStats:
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        """
+        Создать пустую статистику длительностей.
+        
+        Args:
+            window: число последних замеров каждого метода для расчета перцентилей
+        """
+        self.window = window
+        self.samples: Dict[str, Deque[float]] = {}
+        self.counts: Dict[str, int] = {}
+        self.max: Dict[str, float] = {}
+    
+    def record(self, name: str, elapsed_ms: float):
+        """Учесть один вызов метода длительностью elapsed_ms миллисекунд."""
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(elapsed_ms)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.max[name] = max(self.max.get(name, 0.0), elapsed_ms)
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Сводка по методам.
+        
+        Returns:
+            {имя метода: {'count', 'p50', 'p95', 'p99', 'max'}}, длительности в миллисекундах
+        """
+        result = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            stats = {'count': self.counts[name]}
+            for q in PERCENTILES:
+                stats[f'p{q}'] = round(percentile(ordered, q), 3)
+            stats['max'] = round(self.max[name], 3)
+            result[name] = stats
+        return result
+    
+    def reset(self):
+        """Сбросить все замеры."""
+        self.samples.clear()
+        self.counts.clear()
+        self.max.clear()
+
+
+def timed(method):
+    """
+    Декоратор асинхронного метода: записывает длительность каждого вызова
+    в self.query_stats под именем метода, в том числе при исключении.
+    """
+    name = method.__name__
+    
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            self.query_stats.record(name, (time.perf_counter() - started) * 1000)
+    
+    return wrapper
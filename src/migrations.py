@@ -0,0 +1,436 @@
+"""
+Модуль версионных миграций схемы базы данных.
+Текущая версия схемы хранится в PRAGMA user_version. Каждый шаг применяется
+один раз в отдельной транзакции; долгие заполнения данных (backfill) выполняются
+в фоне небольшими пачками и продолжаются после перезапуска, если не успели завершиться.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from typing import AsyncContextManager, Awaitable, Callable, List, NamedTuple, Optional
+
+import aiosqlite
+
+from .storage import COUNTERS, LEGACY_GROUP_ID
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    # Версия схемы после применения шага
+    version: int
+    description: str
+    # Изменение схемы, выполняется при подключении в одной транзакции с обновлением user_version
+    apply: Optional[Callable[[aiosqlite.Connection], Awaitable[None]]] = None
+    # Обработка одной пачки данных в фоне; возвращает число измененных строк (0 - готово)
+    backfill: Optional[Callable[[aiosqlite.Connection, int], Awaitable[int]]] = None
+
+
+async def _create_base_tables(connection: aiosqlite.Connection):
+    """Создать таблицы ограниченных и забаненных пользователей."""
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS restricted_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            joined_at INTEGER NOT NULL,
+            restricted_at INTEGER NOT NULL
+        )
+    """)
+    
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS banned_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            banned_at INTEGER NOT NULL,
+            reason TEXT
+        )
+    """)
+
+
+async def _create_restricted_at_index(connection: aiosqlite.Connection):
+    """Создать индекс для выборки истекших ограничений без полного сканирования таблицы."""
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_restricted_users_restricted_at
+        ON restricted_users (restricted_at, user_id)
+    """)
+
+
+async def _backfill_epoch_timestamps(connection: aiosqlite.Connection, batch_size: int) -> int:
+    """
+    Перевести пачку дат, сохраненных строками ISO, в секунды эпохи Unix.
+    
+    Ранние версии бота сохраняли datetime через адаптер sqlite3 по умолчанию.
+    Нераспознанные строки заменяются текущим временем, чтобы не нарушить NOT NULL.
+    """
+    tables = [
+        ('restricted_users', ['joined_at', 'restricted_at']),
+        ('banned_users', ['banned_at']),
+    ]
+    
+    changed = 0
+    for table, columns in tables:
+        assignments = ", ".join(
+            f"{column} = CASE WHEN typeof({column}) = 'text' "
+            f"THEN CAST(COALESCE(strftime('%s', {column}), strftime('%s', 'now')) AS INTEGER) "
+            f"ELSE {column} END"
+            for column in columns
+        )
+        condition = " OR ".join(f"typeof({column}) = 'text'" for column in columns)
+        cursor = await connection.execute(f"""
+            UPDATE {table} SET {assignments}
+            WHERE user_id IN (
+                SELECT user_id FROM {table} WHERE {condition} LIMIT ?
+            )
+        """, (batch_size,))
+        changed += max(cursor.rowcount, 0)
+    return changed
+
+
+async def _create_banned_at_index(connection: aiosqlite.Connection):
+    """Создать индекс для догрузки фильтра Блума записями, добавленными после его сохранения."""
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_banned_users_banned_at
+        ON banned_users (banned_at)
+    """)
+
+
+async def _create_counter_triggers(connection: aiosqlite.Connection):
+    """Создать триггеры, поддерживающие размеры таблиц в счетчиках."""
+    await connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS restricted_users_count_insert
+        AFTER INSERT ON restricted_users
+        BEGIN
+            UPDATE counters SET value = value + 1
+            WHERE name IN ('restricted_users', 'total_restricted');
+        END
+    """)
+    await connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS restricted_users_count_delete
+        AFTER DELETE ON restricted_users
+        BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'restricted_users';
+        END
+    """)
+    await connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS banned_users_count_insert
+        AFTER INSERT ON banned_users
+        BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'banned_users';
+        END
+    """)
+    await connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS banned_users_count_delete
+        AFTER DELETE ON banned_users
+        BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'banned_users';
+        END
+    """)
+
+
+async def _create_counters(connection: aiosqlite.Connection):
+    """
+    Создать таблицу счетчиков статистики и триггеры, которые ее поддерживают.
+    
+    Текущие размеры таблиц считаются через COUNT(*) только здесь;
+    дальше их обновляют триггеры на вставку и удаление.
+    """
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    
+    await _create_counter_triggers(connection)
+    
+    await connection.executemany(
+        "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+        [(name,) for name in COUNTERS]
+    )
+    await connection.execute("""
+        UPDATE counters SET value = (SELECT COUNT(*) FROM restricted_users)
+        WHERE name = 'restricted_users'
+    """)
+    await connection.execute("""
+        UPDATE counters SET value = (SELECT COUNT(*) FROM banned_users)
+        WHERE name = 'banned_users'
+    """)
+
+
+async def _create_archive_counter(connection: aiosqlite.Connection):
+    """Добавить счетчик пользователей, перенесенных в холодный архив."""
+    await connection.execute(
+        "INSERT OR IGNORE INTO counters (name, value) VALUES ('archived_users', 0)"
+    )
+
+
+async def _add_group_id(connection: aiosqlite.Connection):
+    """
+    Перестроить таблицы пользователей с составным ключом (group_id, user_id).
+    
+    SQLite не умеет менять первичный ключ, поэтому таблицы пересоздаются.
+    Существующие строки получают LEGACY_GROUP_ID; Database при подключении
+    передает их группе по умолчанию. Триггеры счетчиков удаляются вместе
+    со старыми таблицами и создаются заново.
+    """
+    cursor = await connection.execute("PRAGMA table_info(restricted_users)")
+    if any(row[1] == 'group_id' for row in await cursor.fetchall()):
+        return
+    
+    await connection.execute("""
+        CREATE TABLE restricted_users_new (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            joined_at INTEGER NOT NULL,
+            restricted_at INTEGER NOT NULL,
+            PRIMARY KEY (group_id, user_id)
+        )
+    """)
+    await connection.execute("""
+        INSERT INTO restricted_users_new
+            (group_id, user_id, username, first_name, last_name, joined_at, restricted_at)
+        SELECT ?, user_id, username, first_name, last_name, joined_at, restricted_at
+        FROM restricted_users
+    """, (LEGACY_GROUP_ID,))
+    await connection.execute("DROP TABLE restricted_users")
+    await connection.execute("ALTER TABLE restricted_users_new RENAME TO restricted_users")
+    # Проверка истекших ограничений идет по каждой группе отдельно
+    await connection.execute("""
+        CREATE INDEX idx_restricted_users_restricted_at
+        ON restricted_users (group_id, restricted_at, user_id)
+    """)
+    
+    await connection.execute("""
+        CREATE TABLE banned_users_new (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            banned_at INTEGER NOT NULL,
+            reason TEXT,
+            PRIMARY KEY (group_id, user_id)
+        )
+    """)
+    await connection.execute("""
+        INSERT INTO banned_users_new
+            (group_id, user_id, username, first_name, last_name, banned_at, reason)
+        SELECT ?, user_id, username, first_name, last_name, banned_at, reason
+        FROM banned_users
+    """, (LEGACY_GROUP_ID,))
+    await connection.execute("DROP TABLE banned_users")
+    await connection.execute("ALTER TABLE banned_users_new RENAME TO banned_users")
+    await connection.execute("""
+        CREATE INDEX idx_banned_users_banned_at
+        ON banned_users (banned_at)
+    """)
+    
+    await _create_counter_triggers(connection)
+
+
+async def _create_events(connection: aiosqlite.Connection):
+    """Создать журнал событий модерации."""
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            created_at INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            user_id INTEGER,
+            event TEXT NOT NULL,
+            details TEXT
+        )
+    """)
+    # Выборки за период и очистка по сроку хранения
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_created_at
+        ON events (created_at)
+    """)
+    # История пользователя
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_user
+        ON events (user_id, created_at)
+    """)
+
+
+async def _create_outbox(connection: aiosqlite.Connection):
+    """Создать очередь действий модерации в Telegram (outbox)."""
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            username TEXT,
+            created_at INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_id, user_id, action)
+        )
+    """)
+
+
+async def _add_expires_at(connection: aiosqlite.Connection):
+    """
+    Добавить срок окончания ограничения, заданный при ограничении.
+    
+    Существующим строкам срок проставляет Database.connect по настроенному
+    периоду ограничения: миграции от конфигурации не зависят.
+    """
+    cursor = await connection.execute("PRAGMA table_info(restricted_users)")
+    if 'expires_at' not in {row[1] for row in await cursor.fetchall()}:
+        await connection.execute("ALTER TABLE restricted_users ADD COLUMN expires_at INTEGER")
+    # Проверка истекших ограничений - диапазон по expires_at внутри группы
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_restricted_users_expires_at
+        ON restricted_users (group_id, expires_at, user_id)
+    """)
+    # Частичный индекс пуст, когда у всех строк есть срок: поиск строк без срока при запуске мгновенный
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_restricted_users_expires_unset
+        ON restricted_users (user_id) WHERE expires_at IS NULL
+    """)
+    await connection.execute("DROP INDEX IF EXISTS idx_restricted_users_restricted_at")
+
+
+# Шаги миграций в порядке применения; версии идут подряд начиная с 1
+MIGRATIONS: List[Migration] = [
+    Migration(1, "таблицы restricted_users и banned_users", apply=_create_base_tables),
+    Migration(2, "индекс по restricted_at", apply=_create_restricted_at_index),
+    Migration(3, "даты в секундах эпохи Unix", backfill=_backfill_epoch_timestamps),
+    Migration(4, "индекс по banned_at", apply=_create_banned_at_index),
+    Migration(5, "таблица счетчиков статистики", apply=_create_counters),
+    Migration(6, "счетчик архивных банов", apply=_create_archive_counter),
+    Migration(7, "ключ (group_id, user_id) в таблицах пользователей", apply=_add_group_id),
+    Migration(8, "журнал событий", apply=_create_events),
+    Migration(9, "очередь действий в Telegram", apply=_create_outbox),
+    Migration(10, "срок окончания ограничения expires_at", apply=_add_expires_at),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+async def _create_pending_backfills(connection: aiosqlite.Connection):
+    """Создать таблицу незавершенных фоновых заполнений данных."""
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS pending_backfills (
+            version INTEGER PRIMARY KEY
+        )
+    """)
+
+
+async def get_schema_version(connection: aiosqlite.Connection) -> int:
+    """Получить текущую версию схемы из PRAGMA user_version."""
+    cursor = await connection.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def run_migrations(connection: aiosqlite.Connection, migrations: List[Migration] = MIGRATIONS):
+    """
+    Применить шаги миграций, версия которых выше текущей версии схемы.
+    
+    Каждый шаг вместе с новым значением user_version фиксируется одной транзакцией,
+    поэтому прерванная миграция при следующем запуске повторяется целиком.
+    Шаги с фоновым заполнением данных регистрируются в pending_backfills.
+    
+    Args:
+        connection: соединение с базой данных
+        migrations: шаги миграций
+    """
+    await _create_pending_backfills(connection)
+    await connection.commit()
+    
+    current_version = await get_schema_version(connection)
+    
+    for migration in migrations:
+        if migration.version <= current_version:
+            continue
+        
+        started = time.perf_counter()
+        await connection.execute("BEGIN")
+        try:
+            if migration.apply is not None:
+                await migration.apply(connection)
+            if migration.backfill is not None:
+                await connection.execute(
+                    "INSERT OR IGNORE INTO pending_backfills (version) VALUES (?)",
+                    (migration.version,)
+                )
+            await connection.execute(f"PRAGMA user_version = {int(migration.version)}")
+            await connection.commit()
+        except Exception:
+            await connection.rollback()
+            logger.error(f"Ошибка миграции схемы до версии {migration.version} ({migration.description})")
+            raise
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Миграция схемы до версии {migration.version} ({migration.description}): {elapsed_ms:.1f} мс")
+        current_version = migration.version
+    
+    logger.info(f"Версия схемы базы данных: {current_version}")
+
+
+@contextlib.asynccontextmanager
+async def _commit_on_exit(connection: aiosqlite.Connection):
+    """Зафиксировать изменения пачки после ее успешного выполнения."""
+    yield
+    await connection.commit()
+
+
+async def run_backfills(
+    connection: aiosqlite.Connection,
+    batch_size: int,
+    migrations: List[Migration] = MIGRATIONS,
+    transaction: Optional[Callable[[], AsyncContextManager]] = None
+):
+    """
+    Выполнить незавершенные фоновые заполнения данных.
+    
+    Каждая пачка фиксируется отдельно, а между пачками управление возвращается
+    событийному циклу, чтобы обработчики бота продолжали работать.
+    
+    Args:
+        connection: соединение с базой данных
+        batch_size: размер пачки строк
+        migrations: шаги миграций
+        transaction: контекст, в котором выполняется и фиксируется каждая пачка
+            (по умолчанию пачка фиксируется через connection.commit())
+    """
+    transaction = transaction or (lambda: _commit_on_exit(connection))
+    cursor = await connection.execute("SELECT version FROM pending_backfills ORDER BY version")
+    pending = {row[0] for row in await cursor.fetchall()}
+    
+    for migration in migrations:
+        if migration.version not in pending or migration.backfill is None:
+            continue
+        
+        started = time.perf_counter()
+        changed = 0
+        try:
+            while True:
+                async with transaction():
+                    batch_changed = await migration.backfill(connection, batch_size)
+                if not batch_changed:
+                    break
+                changed += batch_changed
+                await asyncio.sleep(0)
+            
+            async with transaction():
+                await connection.execute(
+                    "DELETE FROM pending_backfills WHERE version = ?",
+                    (migration.version,)
+                )
+        except Exception as e:
+            logger.error(f"Ошибка фонового заполнения данных версии {migration.version} ({migration.description}): {e}")
+            return
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"Фоновое заполнение данных версии {migration.version} ({migration.description}): "
+            f"{changed} строк за {elapsed_ms:.1f} мс"
+        )
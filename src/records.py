@@ -0,0 +1,64 @@
+"""
+Записи пользователей, которые возвращают хранилища.
+Записи - именованные кортежи: у экземпляра нет собственного словаря атрибутов
+(__slots__ = ()), поэтому они компактнее словарей и быстрее создаются из строк SQLite.
+"""
+from typing import Callable, NamedTuple, Optional, Type
+
+
+class RestrictedUser(NamedTuple):
+    """Пользователь с ограничениями (строка restricted_users)."""
+    group_id: int
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    joined_at: int
+    restricted_at: int
+    expires_at: int
+
+
+class BannedUser(NamedTuple):
+    """Забаненный пользователь (строка banned_users)."""
+    group_id: int
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    banned_at: int
+    reason: Optional[str]
+
+
+class OutboxAction(NamedTuple):
+    """Действие в Telegram из очереди outbox: записано до вызова API, done - API уже вызван."""
+    group_id: int
+    user_id: int
+    action: str
+    username: Optional[str]
+    created_at: int
+    done: bool
+
+
+# Тип записи для каждой таблицы пользователей; порядок полей совпадает с порядком столбцов в запросах
+TABLE_RECORDS = {
+    'restricted_users': RestrictedUser,
+    'banned_users': BannedUser,
+}
+
+
+def record_factory(record_type: Type[NamedTuple]) -> Callable:
+    """
+    Фабрика строк для cursor.row_factory, создающая записи record_type.
+    
+    Args:
+        record_type: RestrictedUser или BannedUser
+        
+    Returns:
+        Функция (cursor, row) -> запись; столбцы запроса должны идти в порядке полей записи
+    """
+    make = record_type._make
+    
+    def factory(cursor, row):
+        return make(row)
+    
+    return factory
@@ -0,0 +1,418 @@
+"""
+Хранилище SQLite, разделенное на несколько файлов по user_id.
+У SQLite один писатель на файл, поэтому при большом потоке ограничений и банов
+пользователи распределяются по N файлам-шардам: у каждого шарда свое соединение
+для записи. Запросы по одному пользователю идут в его шард, выборки по всем
+пользователям опрашивают шарды параллельно и сливают результаты.
+"""
+import asyncio
+import glob
+import heapq
+import logging
+import os
+import re
+from typing import Optional, List, Dict, Set, Tuple, AsyncIterator, Any, Iterable, Union
+
+from .database import Database
+from .metrics import LatencyStats
+from .records import BannedUser, OutboxAction, RestrictedUser
+from .storage import COUNTERS, EVENT_TYPES, FETCH_BATCH_SIZE, LEGACY_GROUP_ID
+
+logger = logging.getLogger(__name__)
+
+
+def shard_path(db_path: str, index: int, count: int) -> str:
+    """Путь к файлу шарда: data/bot.db -> data/bot.0-of-4.db."""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.{index}-of-{count}{ext}"
+
+
+def existing_shard_counts(db_path: str) -> List[int]:
+    """Количества шардов, с которыми уже создавались файлы рядом с db_path."""
+    root, ext = os.path.splitext(db_path)
+    pattern = re.compile(re.escape(root) + r'\.\d+-of-(\d+)' + re.escape(ext) + '$')
+    counts = set()
+    for path in glob.glob(f"{glob.escape(root)}.*-of-*{glob.escape(ext)}"):
+        match = pattern.match(path)
+        if match:
+            counts.add(int(match.group(1)))
+    return sorted(counts)
+
+
+async def _merge_async(
+    iterators: List[AsyncIterator],
+    key
+) -> AsyncIterator:
+    """Слить отсортированные по key асинхронные итераторы в один отсортированный поток."""
+    heap = []
+    for index, iterator in enumerate(iterators):
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            continue
+        heap.append((key(item), index, item))
+    heapq.heapify(heap)
+    
+    while heap:
+        _, index, item = heap[0]
+        yield item
+        try:
+            following = await iterators[index].__anext__()
+        except StopAsyncIteration:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(following), index, following))
+
+
+def _restriction_key(user: RestrictedUser) -> Tuple[int, int]:
+    """Ключ порядка выборки истекших ограничений."""
+    return user.expires_at, user.user_id
+
+
+class ShardedDatabase:
+    def __init__(
+        self,
+        db_path: str,
+        shards: int,
+        archive_path: Optional[str] = None,
+        group_id: int = LEGACY_GROUP_ID,
+        **options
+    ):
+        """
+        Инициализация разделенного хранилища.
+        
+        Args:
+            db_path: базовый путь к файлу БД; шарды лежат рядом (см. shard_path)
+            shards: количество шардов (не меняется после первого запуска)
+            archive_path: каталог холодного архива; у каждого шарда свой подкаталог
+            group_id: группа по умолчанию для методов, которым группа не передана явно
+            **options: остальные параметры Database, общие для всех шардов
+        """
+        if shards < 1:
+            raise ValueError("Количество шардов должно быть положительным")
+        
+        self.db_path = db_path
+        self.group_id = group_id
+        # Все шарды пишут замеры времени в общую статистику для /status
+        self.query_stats = LatencyStats()
+        self.last_maintenance: Optional[Dict[str, Any]] = None
+        self.shards: List[Database] = []
+        for index in range(shards):
+            path = shard_path(db_path, index, shards)
+            shard_archive = os.path.join(archive_path, f"shard-{index}") if archive_path else None
+            shard = Database(path, archive_path=shard_archive, group_id=group_id, **options)
+            shard.query_stats = self.query_stats
+            self.shards.append(shard)
+    
+    @property
+    def pragma_profile(self) -> Dict[str, Any]:
+        """Профиль SQLite одинаков у всех шардов."""
+        return self.shards[0].pragma_profile
+    
+    def _shard(self, user_id: Optional[int]) -> Database:
+        """Шард пользователя; события без пользователя пишутся в первый шард."""
+        if user_id is None:
+            return self.shards[0]
+        return self.shards[user_id % len(self.shards)]
+    
+    def _partition(self, user_ids: Iterable[int]) -> Dict[int, List[int]]:
+        """Разбить ID пользователей по номерам шардов."""
+        partitions: Dict[int, List[int]] = {}
+        for user_id in user_ids:
+            partitions.setdefault(user_id % len(self.shards), []).append(user_id)
+        return partitions
+    
+    async def _gather(self, method: str, *args, **kwargs) -> List[Any]:
+        """Вызвать метод на всех шардах параллельно."""
+        return await asyncio.gather(*(getattr(shard, method)(*args, **kwargs) for shard in self.shards))
+    
+    async def connect(self):
+        """
+        Подключить все шарды.
+        
+        Raises:
+            ValueError: если рядом уже есть шарды с другим количеством
+        """
+        count = len(self.shards)
+        other_counts = [value for value in existing_shard_counts(self.db_path) if value != count]
+        if other_counts:
+            raise ValueError(
+                f"Найдены шарды базы с другим количеством ({', '.join(map(str, other_counts))}), "
+                f"а задано {count}: перенесите данные через экспорт и импорт"
+            )
+        if os.path.exists(self.db_path):
+            logger.warning(
+                f"Файл {self.db_path} без шардирования не используется: "
+                f"перенесите данные через экспорт и импорт"
+            )
+        
+        await self._gather('connect')
+        logger.info(f"Подключено шардов базы данных: {count}")
+    
+    async def close(self):
+        """Закрыть все шарды."""
+        await self._gather('close')
+    
+    async def flush(self):
+        """Зафиксировать отложенные изменения во всех шардах."""
+        await self._gather('flush')
+    
+    async def add_restricted_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> bool:
+        """Добавить пользователя с ограничениями в его шард."""
+        return await self._shard(user_id).add_restricted_user(
+            user_id, username, first_name, last_name, group_id, period_days
+        )
+    
+    async def add_restricted_users(
+        self,
+        users: List[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> List[int]:
+        """Добавить пачку пользователей, разложив ее по шардам, и вернуть ID новых в исходном порядке."""
+        partitions: Dict[int, List[Tuple]] = {}
+        for user in users:
+            partitions.setdefault(user[0] % len(self.shards), []).append(user)
+        added = await asyncio.gather(*(
+            self.shards[index].add_restricted_users(chunk, group_id, period_days) for index, chunk in partitions.items()
+        ))
+        new_user_ids = {user_id for shard_user_ids in added for user_id in shard_user_ids}
+        return [user_id for user_id in dict.fromkeys(user[0] for user in users) if user_id in new_user_ids]
+    
+    async def is_user_restricted(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Проверить, находится ли пользователь в списке ограниченных."""
+        return await self._shard(user_id).is_user_restricted(user_id, group_id)
+    
+    async def add_banned_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> bool:
+        """Добавить пользователя в список забаненных его шарда."""
+        return await self._shard(user_id).add_banned_user(user_id, username, first_name, last_name, reason, group_id)
+    
+    async def is_user_banned(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Проверить, забанен ли пользователь."""
+        return await self._shard(user_id).is_user_banned(user_id, group_id)
+    
+    async def get_banned_user_ids(self, user_ids: List[int], group_id: Optional[int] = None) -> Set[int]:
+        """Проверить пачку пользователей, разложив ее по шардам: один запрос на шард."""
+        partitions: Dict[int, List[int]] = {}
+        for user_id in user_ids:
+            partitions.setdefault(user_id % len(self.shards), []).append(user_id)
+        banned = await asyncio.gather(*(
+            self.shards[index].get_banned_user_ids(chunk, group_id) for index, chunk in partitions.items()
+        ))
+        return set().union(*banned)
+    
+    async def remove_restricted_user(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Удалить пользователя из списка ограниченных."""
+        return await self._shard(user_id).remove_restricted_user(user_id, group_id)
+    
+    async def expire_restricted_users(
+        self,
+        user_ids: List[int],
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> int:
+        """
+        Перенести пачку пользователей из ограниченных в забаненные.
+        
+        Пачка разбивается по шардам, шарды обрабатывают свои части параллельно.
+        
+        Returns:
+            Количество перенесенных пользователей
+        """
+        moved = await asyncio.gather(*(
+            self.shards[index].expire_restricted_users(chunk, reason, group_id)
+            for index, chunk in self._partition(user_ids).items()
+        ))
+        return sum(moved)
+    
+    async def archive_old_bans(self, older_than_days: int) -> int:
+        """Перенести старые баны в холодный архив во всех шардах."""
+        return sum(await self._gather('archive_old_bans', older_than_days))
+    
+    async def backup(self, backup_dir: str, keep: int = 7, compress: bool = False) -> Optional[str]:
+        """
+        Создать резервные копии всех шардов в подкаталогах shard-<номер>.
+        
+        Returns:
+            Каталог резервных копий
+        """
+        await asyncio.gather(*(
+            shard.backup(os.path.join(backup_dir, f"shard-{index}"), keep, compress)
+            for index, shard in enumerate(self.shards)
+        ))
+        return backup_dir
+    
+    async def get_expired_restrictions(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        group_id: Optional[int] = None
+    ) -> List[RestrictedUser]:
+        """
+        Получить страницу пользователей с истекшим сроком ограничений.
+        
+        Каждый шард отдает не больше limit записей после ключа after, страницы
+        сливаются в порядке (expires_at, user_id). Пользователь живет ровно
+        в одном шарде, поэтому постраничный обход по after остается точным.
+        
+        Returns:
+            Список записей RestrictedUser
+        """
+        pages = await self._gather('get_expired_restrictions', limit, after, group_id)
+        merged = heapq.merge(*pages, key=_restriction_key)
+        if limit is not None:
+            return [user for _, user in zip(range(limit), merged)]
+        return list(merged)
+    
+    async def iter_expired_restrictions(
+        self,
+        batch_size: int = FETCH_BATCH_SIZE,
+        group_id: Optional[int] = None
+    ) -> AsyncIterator[RestrictedUser]:
+        """Перебрать пользователей с истекшим сроком ограничений всех шардов в порядке (expires_at, user_id)."""
+        iterators = [shard.iter_expired_restrictions(batch_size, group_id) for shard in self.shards]
+        async for user in _merge_async(iterators, _restriction_key):
+            yield user
+    
+    async def increment_counter(self, name: str, delta: int = 1):
+        """Увеличить накопительный счетчик (счетчики шардов суммируются в get_stats)."""
+        await self.shards[0].increment_counter(name, delta)
+    
+    async def log_event(
+        self,
+        event: str,
+        user_id: Optional[int] = None,
+        group_id: Optional[int] = None,
+        details: Optional[str] = None
+    ):
+        """Добавить событие в журнал шарда пользователя."""
+        await self._shard(user_id).log_event(event, user_id, group_id, details)
+    
+    async def flush_events(self):
+        """Записать буферы событий всех шардов."""
+        await self._gather('flush_events')
+    
+    async def get_events(
+        self,
+        user_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """Получить последние события журнала, начиная с самых новых."""
+        if user_id is not None:
+            return await self._shard(user_id).get_events(user_id, since, limit)
+        
+        pages = await self._gather('get_events', None, since, limit)
+        merged = heapq.merge(*pages, key=lambda event: event['created_at'], reverse=True)
+        return [event for _, event in zip(range(limit), merged)]
+    
+    async def count_events(self, since: int) -> Dict[str, int]:
+        """Посчитать события каждого типа во всех шардах."""
+        counts = {event: 0 for event in EVENT_TYPES}
+        for shard_counts in await self._gather('count_events', since):
+            for event, count in shard_counts.items():
+                counts[event] += count
+        return counts
+    
+    async def purge_events(self, older_than_days: int, batch_size: int = 1000) -> int:
+        """Удалить события старше срока хранения во всех шардах."""
+        return sum(await self._gather('purge_events', older_than_days, batch_size))
+    
+    def _partition_actions(self, actions: List[OutboxAction]) -> Dict[int, List[OutboxAction]]:
+        """Разбить действия очереди по шардам пользователей."""
+        partitions: Dict[int, List[OutboxAction]] = {}
+        for action in actions:
+            partitions.setdefault(action.user_id % len(self.shards), []).append(action)
+        return partitions
+    
+    async def enqueue_actions(self, actions: List[OutboxAction]) -> int:
+        """Записать действия в очереди шардов пользователей до их выполнения."""
+        added = await asyncio.gather(*(
+            self.shards[index].enqueue_actions(chunk) for index, chunk in self._partition_actions(actions).items()
+        ))
+        return sum(added)
+    
+    async def complete_actions(self, actions: List[OutboxAction]):
+        """Отметить выполнение действий в очередях шардов."""
+        await asyncio.gather(*(
+            self.shards[index].complete_actions(chunk) for index, chunk in self._partition_actions(actions).items()
+        ))
+    
+    async def finish_actions(self, actions: List[OutboxAction]):
+        """Убрать действия из очередей шардов."""
+        await asyncio.gather(*(
+            self.shards[index].finish_actions(chunk) for index, chunk in self._partition_actions(actions).items()
+        ))
+    
+    async def get_pending_actions(self) -> List[OutboxAction]:
+        """Получить действия, оставшиеся в очередях всех шардов, в порядке постановки."""
+        pages = await self._gather('get_pending_actions')
+        return list(heapq.merge(*pages, key=lambda action: (action.created_at, action.group_id, action.user_id)))
+    
+    async def run_maintenance(self, vacuum_pages: int = 1000, quiet_seconds: int = 60) -> Dict:
+        """
+        Выполнить обслуживание всех шардов.
+        
+        Returns:
+            Сводный отчет: суммы страниц и размеров файлов, общая доля свободных
+            страниц и отчеты отдельных шардов в 'shards'
+        """
+        reports = await self._gather('run_maintenance', vacuum_pages, quiet_seconds)
+        page_count = sum(report['page_count'] for report in reports)
+        freelist_count = sum(report['freelist_count'] for report in reports)
+        report = {
+            'page_size': reports[0]['page_size'],
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'fragmentation': round(100 * freelist_count / page_count, 1) if page_count else 0.0,
+            'freed_pages': sum(report['freed_pages'] for report in reports),
+            'file_size': sum(report['file_size'] for report in reports),
+            'wal_size': sum(report['wal_size'] for report in reports),
+            'shards': reports,
+        }
+        self.last_maintenance = report
+        return report
+    
+    async def get_stats(self) -> Dict:
+        """Получить статистику: суммы счетчиков всех шардов."""
+        stats = {name: 0 for name in COUNTERS}
+        for shard_stats in await self._gather('get_stats'):
+            for name, value in shard_stats.items():
+                stats[name] = stats.get(name, 0) + value
+        return stats
+    
+    async def upsert_rows(self, table: str, rows: List[Dict]) -> int:
+        """Вставить или заменить строки, разложив их по шардам пользователей."""
+        partitions: Dict[int, List[Dict]] = {}
+        for row in rows:
+            partitions.setdefault(row['user_id'] % len(self.shards), []).append(row)
+        counts = await asyncio.gather(*(
+            self.shards[index].upsert_rows(table, chunk) for index, chunk in partitions.items()
+        ))
+        return sum(counts)
+    
+    async def iter_rows(
+        self,
+        table: str,
+        batch_size: int = FETCH_BATCH_SIZE
+    ) -> AsyncIterator[Union[RestrictedUser, BannedUser]]:
+        """Перебрать строки таблицы всех шардов в порядке (group_id, user_id)."""
+        iterators = [shard.iter_rows(table, batch_size) for shard in self.shards]
+        async for row in _merge_async(iterators, lambda row: (row.group_id, row.user_id)):
+            yield row
@@ -0,0 +1,198 @@
+"""
+Протокол хранилища данных бота.
+Описывает набор методов, который SpamRestrictorBot ожидает от базы данных:
+SQLite (Database) и хранилище в памяти (MemoryStorage) реализуют его одинаково.
+Записи принадлежат группе; методы без явного group_id работают с группой по умолчанию.
+"""
+import time
+from typing import Optional, List, Dict, Set, Tuple, AsyncIterator, Any, Protocol
+
+from .records import OutboxAction, RestrictedUser
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Группа строк, созданных до появления group_id
+LEGACY_GROUP_ID = 0
+
+# Счетчики статистики: текущие размеры таблиц и накопительные счетчики методов хранилища
+COUNTERS = (
+    'restricted_users',
+    'banned_users',
+    'total_restricted',
+    'total_expired',
+    'total_rebanned',
+    'archived_users',
+)
+
+# Типы событий журнала модерации
+EVENT_TYPES = ('join', 'restrict', 'reban', 'expire', 'error')
+
+# Типы действий в Telegram, проходящих через очередь outbox
+OUTBOX_ACTIONS = ('expire',)
+
+# Размер пачки строк при последовательном чтении больших таблиц
+FETCH_BATCH_SIZE = 10000
+
+
+def utc_timestamp() -> int:
+    """Текущее время UTC в секундах эпохи Unix (формат хранения дат)."""
+    return int(time.time())
+
+
+class Storage(Protocol):
+    # Фактические параметры движка для вывода в /status
+    pragma_profile: Dict[str, Any]
+    
+    async def connect(self):
+        """Открыть хранилище."""
+        ...
+    
+    async def close(self):
+        """Закрыть хранилище, сохранив отложенные изменения."""
+        ...
+    
+    async def flush(self):
+        """Зафиксировать все отложенные изменения."""
+        ...
+    
+    async def add_restricted_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> bool:
+        """Добавить пользователя с ограничениями."""
+        ...
+    
+    async def add_restricted_users(
+        self,
+        users: List[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+        group_id: Optional[int] = None,
+        period_days: Optional[int] = None
+    ) -> List[int]:
+        """Добавить пачку пользователей (user_id, username, first_name, last_name) и вернуть ID новых."""
+        ...
+    
+    async def is_user_restricted(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Проверить, находится ли пользователь в списке ограниченных."""
+        ...
+    
+    async def add_banned_user(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None,
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> bool:
+        """Добавить пользователя в список забаненных."""
+        ...
+    
+    async def is_user_banned(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Проверить, находится ли пользователь в списке забаненных."""
+        ...
+    
+    async def get_banned_user_ids(self, user_ids: List[int], group_id: Optional[int] = None) -> Set[int]:
+        """Проверить пачку пользователей и вернуть ID забаненных."""
+        ...
+    
+    async def remove_restricted_user(self, user_id: int, group_id: Optional[int] = None) -> bool:
+        """Удалить пользователя из списка ограниченных."""
+        ...
+    
+    async def expire_restricted_users(
+        self,
+        user_ids: List[int],
+        reason: str = "Expired restriction period",
+        group_id: Optional[int] = None
+    ) -> int:
+        """Перенести пачку пользователей из ограниченных в забаненные."""
+        ...
+    
+    async def archive_old_bans(self, older_than_days: int) -> int:
+        """Перенести давние баны в холодный архив."""
+        ...
+    
+    async def backup(self, backup_dir: str, keep: int = 7, compress: bool = False) -> Optional[str]:
+        """Создать резервную копию хранилища."""
+        ...
+    
+    async def get_expired_restrictions(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        group_id: Optional[int] = None
+    ) -> List[RestrictedUser]:
+        """Получить страницу пользователей с истекшим сроком ограничений."""
+        ...
+    
+    def iter_expired_restrictions(
+        self,
+        batch_size: int = ...,
+        group_id: Optional[int] = None
+    ) -> AsyncIterator[RestrictedUser]:
+        """Перебрать пользователей с истекшим сроком ограничений."""
+        ...
+    
+    async def increment_counter(self, name: str, delta: int = 1):
+        """Увеличить накопительный счетчик статистики."""
+        ...
+    
+    async def log_event(
+        self,
+        event: str,
+        user_id: Optional[int] = None,
+        group_id: Optional[int] = None,
+        details: Optional[str] = None
+    ):
+        """Добавить событие в журнал модерации."""
+        ...
+    
+    async def flush_events(self):
+        """Записать буфер событий журнала."""
+        ...
+    
+    async def get_events(
+        self,
+        user_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """Получить последние события журнала."""
+        ...
+    
+    async def count_events(self, since: int) -> Dict[str, int]:
+        """Посчитать события каждого типа за период."""
+        ...
+    
+    async def purge_events(self, older_than_days: int, batch_size: int = 1000) -> int:
+        """Удалить события старше срока хранения."""
+        ...
+    
+    async def enqueue_actions(self, actions: List[OutboxAction]) -> int:
+        """Записать действия в Telegram в очередь до их выполнения (в MemoryStorage - до следующего снимка)."""
+        ...
+    
+    async def complete_actions(self, actions: List[OutboxAction]):
+        """Отметить, что вызовы API действий выполнены."""
+        ...
+    
+    async def finish_actions(self, actions: List[OutboxAction]):
+        """Убрать из очереди сохраненные или отмененные действия."""
+        ...
+    
+    async def get_pending_actions(self) -> List[OutboxAction]:
+        """Получить действия, оставшиеся в очереди после прерванной проверки."""
+        ...
+    
+    async def run_maintenance(self, vacuum_pages: int = 1000, quiet_seconds: int = 60) -> Dict:
+        """Выполнить обслуживание хранилища и вернуть отчет."""
+        ...
+    
+    async def get_stats(self) -> Dict:
+        """Получить статистику."""
+        ...
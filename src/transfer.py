@@ -0,0 +1,299 @@
+"""
+Импорт и экспорт списков ограниченных и забаненных пользователей.
+
+Запуск без бота:
+    python -m src.transfer export banned_users bans.csv
+    python -m src.transfer import banned_users bans.jsonl --db data/spam_restrictor.db
+
+Файлы читаются и пишутся потоково пачками фиксированного размера,
+поэтому расход памяти не зависит от размера списка.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterator, Optional, TextIO, Union
+
+from .database import Database, LEGACY_GROUP_ID, TABLE_COLUMNS, utc_timestamp
+from .sharding import ShardedDatabase
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 10000
+
+# Профиль SQLite для массовой загрузки
+TRANSFER_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+}
+
+TIMESTAMP_COLUMNS = ('joined_at', 'restricted_at', 'banned_at')
+
+# Даты, которые без значения в файле вычисляет хранилище (срок окончания - от даты ограничения)
+DERIVED_TIMESTAMP_COLUMNS = ('expires_at',)
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    """
+    Определить формат файла по явному значению или расширению.
+    
+    Raises:
+        ValueError: если формат не поддерживается
+    """
+    if fmt is None:
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f"Неподдерживаемый формат: {fmt}")
+    return fmt
+
+
+def _parse_timestamp(value) -> Optional[int]:
+    """Привести дату к секундам эпохи Unix (принимаются число и строка ISO 8601)."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+
+
+def normalize_row(table: str, row: Dict, now: int, group_id: int = LEGACY_GROUP_ID) -> Dict:
+    """
+    Привести строку файла к значениям столбцов таблицы.
+    
+    Пустые строки CSV становятся NULL, отсутствующие даты - текущим временем
+    (кроме expires_at: его вычисляет хранилище), отсутствующая группа - group_id.
+    
+    Raises:
+        ValueError: если в строке нет корректного user_id
+    """
+    result = {}
+    for column in TABLE_COLUMNS[table]:
+        value = row.get(column)
+        if value == '':
+            value = None
+        if column == 'group_id':
+            value = group_id if value is None else int(value)
+        elif column == 'user_id':
+            if value is None:
+                raise ValueError(f"В строке нет user_id: {row}")
+            value = int(value)
+        elif column in TIMESTAMP_COLUMNS:
+            value = _parse_timestamp(value)
+            if value is None:
+                value = now
+        elif column in DERIVED_TIMESTAMP_COLUMNS:
+            value = _parse_timestamp(value)
+        result[column] = value
+    return result
+
+
+def read_rows(file: TextIO, fmt: str) -> Iterator[Dict]:
+    """Потоково прочитать строки из файла CSV (с заголовком) или JSONL."""
+    if fmt == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+async def import_file(
+    db: Union[Database, ShardedDatabase],
+    table: str,
+    file: TextIO,
+    fmt: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    group_id: int = LEGACY_GROUP_ID
+) -> int:
+    """
+    Импортировать строки из файла в таблицу с заменой существующих записей.
+    
+    Args:
+        db: подключенная база данных
+        table: restricted_users или banned_users
+        file: открытый текстовый файл
+        fmt: csv или jsonl
+        chunk_size: количество строк в одной транзакции
+        group_id: группа для строк без group_id
+        
+    Returns:
+        Количество импортированных строк
+    """
+    now = utc_timestamp()
+    rows = (normalize_row(table, row, now, group_id) for row in read_rows(file, fmt))
+    started = time.perf_counter()
+    total = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        total += await db.upsert_rows(table, chunk)
+        elapsed = time.perf_counter() - started
+        logger.info(f"{table}: импортировано {total} строк ({total / max(elapsed, 1e-9):.0f} строк/с)")
+    return total
+
+
+async def export_file(
+    db: Union[Database, ShardedDatabase],
+    table: str,
+    file: TextIO,
+    fmt: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """
+    Экспортировать таблицу в файл в порядке user_id.
+    
+    Args:
+        db: подключенная база данных
+        table: restricted_users или banned_users
+        file: открытый текстовый файл
+        fmt: csv или jsonl
+        chunk_size: количество строк, читаемых из БД за раз
+        
+    Returns:
+        Количество экспортированных строк
+    """
+    writer = None
+    if fmt == 'csv':
+        # Поля записей идут в порядке столбцов, поэтому строки пишутся без преобразования в словарь
+        writer = csv.writer(file)
+        writer.writerow(TABLE_COLUMNS[table])
+    
+    started = time.perf_counter()
+    total = 0
+    async for row in db.iter_rows(table, batch_size=chunk_size):
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            file.write(json.dumps(row._asdict(), ensure_ascii=False) + '\n')
+        total += 1
+        if total % chunk_size == 0:
+            elapsed = time.perf_counter() - started
+            logger.info(f"{table}: экспортировано {total} строк ({total / max(elapsed, 1e-9):.0f} строк/с)")
+    logger.info(f"{table}: экспортировано {total} строк")
+    return total
+
+
+async def run(args: argparse.Namespace) -> int:
+    """Выполнить импорт или экспорт по аргументам командной строки."""
+    fmt = detect_format(args.path, args.format)
+    options = dict(
+        pragmas=TRANSFER_PRAGMAS,
+        group_id=args.group_id,
+        restriction_period_days=args.restriction_period_days
+    )
+    if args.shards > 1:
+        db = ShardedDatabase(args.db, args.shards, **options)
+    else:
+        db = Database(args.db, **options)
+    if args.table == 'banned_users' and args.command == 'import':
+        # Бот, запущенный во время импорта, должен построить фильтр из таблицы
+        remove_bloom_filters(db)
+    await db.connect()
+    try:
+        # Фоновые заполнения миграций завершаются до переноса, чтобы не делить с ним соединение
+        for shard in getattr(db, 'shards', [db]):
+            await shard.migration_task
+        
+        if args.command == 'export':
+            if args.path == '-':
+                return await export_file(db, args.table, sys.stdout, fmt, args.chunk_size)
+            with open(args.path, 'w', encoding='utf-8', newline='') as f:
+                return await export_file(db, args.table, f, fmt, args.chunk_size)
+        
+        if args.path == '-':
+            total = await import_file(db, args.table, sys.stdin, fmt, args.chunk_size, args.group_id)
+        else:
+            with open(args.path, encoding='utf-8', newline='') as f:
+                total = await import_file(db, args.table, f, fmt, args.chunk_size, args.group_id)
+    finally:
+        await db.close()
+    
+    # Импортированные баны могут быть датированы раньше отметки сохраненного
+    # фильтра Блума, поэтому фильтр перестраивается при следующем запуске бота.
+    # Работающий бот не сохранит свой фильтр поверх: он замечает чужие изменения
+    # по PRAGMA data_version
+    if args.table == 'banned_users':
+        remove_bloom_filters(db)
+    return total
+
+
+def remove_bloom_filters(db: Union[Database, ShardedDatabase]):
+    """Удалить сохраненные фильтры Блума БД и ее шардов."""
+    for shard in getattr(db, 'shards', [db]):
+        if os.path.exists(shard.bloom_path):
+            os.remove(shard.bloom_path)
+            logger.info(f"Фильтр Блума удален и будет перестроен: {shard.bloom_path}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Разобрать аргументы командной строки."""
+    parser = argparse.ArgumentParser(
+        prog='python -m src.transfer',
+        description="Импорт и экспорт списков ограниченных и забаненных пользователей"
+    )
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('table', choices=tuple(TABLE_COLUMNS))
+    parser.add_argument('path', help="путь к файлу CSV или JSONL ('-' - stdin/stdout)")
+    parser.add_argument('--format', choices=FORMATS, help="формат файла (по умолчанию по расширению)")
+    parser.add_argument(
+        '--db',
+        default=os.getenv('DATABASE_PATH', '/app/data/spam_restrictor.db'),
+        help="путь к базе данных (по умолчанию DATABASE_PATH)"
+    )
+    parser.add_argument(
+        '--group-id',
+        type=int,
+        default=int(os.getenv('GROUP_ID', str(LEGACY_GROUP_ID)).split(',')[0]),
+        help="группа для строк без group_id (по умолчанию первая из GROUP_ID)"
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=int(os.getenv('DB_SHARDS', '1')),
+        help="количество шардов базы (по умолчанию DB_SHARDS)"
+    )
+    parser.add_argument(
+        '--restriction-period-days',
+        type=int,
+        default=int(os.getenv('RESTRICTION_PERIOD_DAYS', '30')),
+        help="срок ограничения для строк без expires_at (по умолчанию RESTRICTION_PERIOD_DAYS)"
+    )
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="размер пачки строк")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    args = parse_args(argv)
+    # Прогресс пишется в stderr, чтобы не смешиваться с экспортом в stdout
+    logging.basicConfig(
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper()),
+        stream=sys.stderr
+    )
+    try:
+        asyncio.run(run(args))
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Тесты для модуля archive.py
+"""
+from array import array
+
+import pytest
+
+from src.archive import BanArchive, ArchiveSegment, BLOCK_SIZE
+
+
+def test_archive_segment_roundtrip(tmp_path):
+    """Тест записи и чтения сегмента из нескольких блоков."""
+    archive = BanArchive(str(tmp_path / "archive"))
+    user_ids = array('q', range(-5000, 3 * BLOCK_SIZE * 7, 7))
+    assert archive.add_segment(user_ids) == len(user_ids)
+    
+    segment = archive.segments[0]
+    assert len(segment.index) > 1
+    assert list(segment) == list(user_ids)
+    archive.close()
+
+
+def test_archive_contains(tmp_path):
+    """Тест проверки наличия ID в архиве."""
+    archive = BanArchive(str(tmp_path / "archive"))
+    archive.add_segment(array('q', range(0, 100000, 2)))
+    
+    assert 0 in archive
+    assert 99998 in archive
+    assert 50000 in archive
+    assert 50001 not in archive
+    assert -1 not in archive
+    assert 100000 not in archive
+    archive.close()
+
+
+def test_archive_reload_multiple_segments(tmp_path):
+    """Тест загрузки нескольких сегментов с диска."""
+    directory = str(tmp_path / "archive")
+    archive = BanArchive(directory)
+    archive.add_segment(array('q', [1, 5, 9]))
+    archive.add_segment(array('q', [2, 6, 10**12]))
+    archive.close()
+    
+    archive = BanArchive(directory)
+    archive.load()
+    assert archive.count == 6
+    assert sorted(archive) == [1, 2, 5, 6, 9, 10**12]
+    assert 10**12 in archive
+    assert 3 not in archive
+    archive.close()
+
+
+def test_archive_missing_directory(tmp_path):
+    """Тест пустого архива без каталога."""
+    archive = BanArchive(str(tmp_path / "missing"))
+    archive.load()
+    assert archive.count == 0
+    assert 1 not in archive
+
+
+def test_archive_rejects_corrupted_segment(tmp_path):
+    """Тест отказа открывать поврежденный сегмент."""
+    path = tmp_path / "segment-000001.bin"
+    path.write_bytes(b"garbage" * 4)
+    with pytest.raises(ValueError):
+        ArchiveSegment(path)
@@ -0,0 +1,93 @@
+"""
+Тесты для модуля backup.py
+"""
+import asyncio
+import gzip
+import sqlite3
+
+import pytest
+
+from src.backup import create_backup, list_backups, rotate_backups
+from src.database import Database
+
+
+@pytest.mark.asyncio
+async def test_database_backup(tmp_path):
+    """Тест резервной копии, включающей еще не зафиксированные изменения."""
+    db_path = str(tmp_path / "bot.db")
+    db = Database(db_path, commit_batch_size=100, commit_interval_ms=60000)
+    await db.connect()
+    await db.migration_task
+    await db.add_restricted_user(user_id=1, username="user1")
+    await db.add_banned_user(user_id=2)
+    
+    backup_path = await db.backup(str(tmp_path / "backups"))
+    await db.close()
+    
+    connection = sqlite3.connect(f"{backup_path}/bot.db")
+    assert connection.execute("SELECT user_id FROM restricted_users").fetchall() == [(1,)]
+    assert connection.execute("SELECT user_id FROM banned_users").fetchall() == [(2,)]
+    connection.close()
+
+
+@pytest.mark.asyncio
+async def test_backup_compressed(temp_db, tmp_path):
+    """Тест сжатой резервной копии."""
+    await temp_db.add_banned_user(user_id=1)
+    await temp_db.flush()
+    
+    backup_path = create_backup(temp_db.db_path, str(tmp_path), compress=True)
+    
+    files = list(backup_path.iterdir())
+    assert len(files) == 1
+    assert files[0].name.endswith('.gz')
+    with gzip.open(files[0], 'rb') as f:
+        assert f.read(16) == b"SQLite format 3\x00"
+
+
+def test_backup_rotation(tmp_path):
+    """Тест удаления старых резервных копий."""
+    db_path = str(tmp_path / "bot.db")
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE t (x INTEGER)")
+    connection.commit()
+    connection.close()
+    backup_dir = str(tmp_path / "backups")
+    
+    for _ in range(4):
+        create_backup(db_path, backup_dir, keep=0)
+    assert len(list_backups(backup_dir)) == 4
+    
+    assert rotate_backups(backup_dir, keep=2) == 2
+    assert len(list_backups(backup_dir)) == 2
+
+
+@pytest.mark.asyncio
+async def test_backup_during_writes(tmp_path):
+    """Тест резервной копии при постоянной записи в базу: копия завершается и согласована."""
+    db_path = str(tmp_path / "busy.db")
+    db = Database(db_path, pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+    await db.connect()
+    await db.migration_task
+    await db.upsert_rows('banned_users', [
+        {'group_id': 0, 'user_id': user_id, 'username': f"user{user_id:06d}" * 10, 'banned_at': 1}
+        for user_id in range(1, 200001)
+    ])
+    
+    backup_task = asyncio.create_task(db.backup(str(tmp_path / "backups")))
+    deadline = asyncio.get_running_loop().time() + 20
+    user_id = 100000
+    while not backup_task.done() and asyncio.get_running_loop().time() < deadline:
+        user_id += 1
+        await db.add_banned_user(user_id=user_id)
+        await asyncio.sleep(0.002)
+    assert backup_task.done()
+    backup_path = await backup_task
+    await db.close()
+    
+    assert user_id > 100000
+    connection = sqlite3.connect(f"{backup_path}/busy.db")
+    count = connection.execute("SELECT COUNT(*) FROM banned_users").fetchone()[0]
+    assert count >= 200000
+    assert connection.execute("PRAGMA integrity_check").fetchone() == ('ok',)
+    connection.close()
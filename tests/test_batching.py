@@ -0,0 +1,51 @@
+"""
+Тесты для модуля batching.py
+"""
+import asyncio
+import pytest
+
+from src.batching import MicroBatcher
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_collects_concurrent_requests():
+    """Тест объединения одновременных запросов в одну пачку."""
+    batches = []
+    
+    async def handler(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+    
+    batcher = MicroBatcher(handler, delay_ms=5, max_size=100)
+    results = await asyncio.gather(*(batcher.submit(item) for item in range(1, 6)))
+    
+    assert results == [10, 20, 30, 40, 50]
+    assert batches == [[1, 2, 3, 4, 5]]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_max_size():
+    """Тест выполнения полной пачки без ожидания таймера."""
+    batches = []
+    
+    async def handler(items):
+        batches.append(list(items))
+        return items
+    
+    batcher = MicroBatcher(handler, delay_ms=10000, max_size=2)
+    results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(item) for item in range(4))), timeout=1)
+    
+    assert results == [0, 1, 2, 3]
+    assert batches == [[0, 1], [2, 3]]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_handler_error():
+    """Тест передачи ошибки обработчика всем запросам пачки."""
+    async def handler(items):
+        raise RuntimeError("database is locked")
+    
+    batcher = MicroBatcher(handler, delay_ms=1)
+    results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+    
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,76 @@
+"""
+Тесты для модуля bloom.py
+"""
+import pytest
+
+from src.bloom import BloomFilter
+
+
+def test_bloom_filter_membership():
+    """Тест отсутствия ложноотрицательных ответов."""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for user_id in range(0, 2000, 2):
+        bloom.add(user_id)
+    
+    assert all(user_id in bloom for user_id in range(0, 2000, 2))
+    # ID, все биты которого уже были установлены другими, не меняет фильтр и не учитывается
+    assert 990 <= bloom.count <= 1000
+    assert bloom.is_overloaded() is False
+
+
+def test_bloom_filter_false_positive_rate():
+    """Тест доли ложноположительных ответов в пределах заданной."""
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for user_id in range(10000):
+        bloom.add(user_id)
+    
+    false_positives = sum(1 for user_id in range(10**9, 10**9 + 10000) if user_id in bloom)
+    assert false_positives < 200
+
+
+def test_bloom_filter_negative_ids():
+    """Тест работы с отрицательными ID."""
+    bloom = BloomFilter(capacity=10)
+    bloom.add(-1001234567890)
+    assert -1001234567890 in bloom
+
+
+def test_bloom_filter_save_load(tmp_path):
+    """Тест сохранения и загрузки фильтра."""
+    path = str(tmp_path / "filter.bloom")
+    bloom = BloomFilter(capacity=100, error_rate=0.001)
+    bloom.add(42)
+    bloom.save(path, watermark=1700000000)
+    
+    loaded, watermark = BloomFilter.load(path)
+    
+    assert watermark == 1700000000
+    assert 42 in loaded
+    assert loaded.count == 1
+    assert loaded.bits == bloom.bits
+
+
+def test_bloom_filter_load_missing_or_corrupted(tmp_path):
+    """Тест загрузки отсутствующего и поврежденного файла."""
+    path = tmp_path / "filter.bloom"
+    assert BloomFilter.load(str(path)) is None
+    
+    path.write_bytes(b"garbage")
+    assert BloomFilter.load(str(path)) is None
+
+
+def test_bloom_filter_invalid_parameters():
+    """Тест проверки параметров фильтра."""
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=0)
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=10, error_rate=1.5)
+
+
+def test_bloom_filter_readd_keeps_count():
+    """Тест повторного добавления ID: число элементов не растет."""
+    bloom = BloomFilter(capacity=10)
+    for _ in range(20):
+        bloom.add(42)
+    assert bloom.count == 1
+    assert bloom.is_overloaded() is False
@@ -1,10 +1,17 @@
 """
 Тесты для модуля bot.py (без реальной работы с Telegram API).
 """
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from telegram import ChatMember
+from telegram.error import TelegramError
+
 from src.bot import SpamRestrictorBot
+from src.database import utc_timestamp, SECONDS_PER_DAY
+from src.memory_storage import MemoryStorage
+from src.records import OutboxAction
 
 
 @pytest.mark.asyncio
@@ -83,3 +90,237 @@ async def test_stats_computation(temp_db):
     assert stats['restricted_users'] == 2
     assert stats['banned_users'] == 3
     # Не закрываем вручную - фикстура сама закроет
+
+
+@pytest.mark.asyncio
+async def test_check_expired_restrictions_pages(temp_config, temp_db, monkeypatch):
+    """Тест постраничного обхода просроченных ограничений."""
+    monkeypatch.setenv('EXPIRY_BATCH_SIZE', '2')
+    temp_db.group_id = temp_config.group_id
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    
+    for user_id in range(1, 6):
+        await temp_db.add_restricted_user(user_id=user_id, username=f"user{user_id}")
+    await temp_db.connection.execute(
+        "UPDATE restricted_users SET expires_at = ?",
+        (utc_timestamp() - 31 * SECONDS_PER_DAY,)
+    )
+    await temp_db.connection.commit()
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    
+    # Удаление пользователя 2 завершается ошибкой Telegram
+    async def ban_chat_member(chat_id, user_id):
+        if user_id == 2:
+            raise TelegramError("fail")
+    
+    mock_context.bot.ban_chat_member.side_effect = ban_chat_member
+    
+    await bot.check_expired_restrictions(mock_context)
+    
+    assert mock_context.bot.ban_chat_member.await_count == 5
+    assert await temp_db.is_user_restricted(2) is True
+    for user_id in [1, 3, 4, 5]:
+        assert await temp_db.is_user_banned(user_id) is True
+    
+    # Очередь outbox пуста после завершенной проверки
+    assert await temp_db.get_pending_actions() == []
+    
+    events = await temp_db.get_events()
+    assert sorted(event['user_id'] for event in events if event['event'] == 'expire') == [1, 3, 4, 5]
+    assert [event['user_id'] for event in events if event['event'] == 'error'] == [2]
+
+
+@pytest.mark.asyncio
+async def test_status_command_reports_sqlite_profile(temp_config, temp_db, monkeypatch):
+    """Тест вывода профиля SQLite в команде /status."""
+    monkeypatch.setenv('ADMIN_USER_ID', '42')
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    temp_db.pragma_profile = {'journal_mode': 'wal', 'synchronous': 1}
+    
+    update = MagicMock()
+    update.effective_user.id = 42
+    update.message.reply_text = AsyncMock()
+    
+    await bot.status_command(update, MagicMock())
+    
+    status_text = update.message.reply_text.await_args.args[0]
+    assert "journal_mode=wal, synchronous=1" in status_text
+    # get_stats, вызванный командой, попадает в сводку времени запросов
+    assert "Время запросов к БД" in status_text
+    assert "<code>get_stats</code>" in status_text
+
+
+@pytest.mark.asyncio
+async def test_check_expired_restrictions_memory_storage(temp_config):
+    """Тест проверки просроченных ограничений с хранилищем в памяти."""
+    storage = MemoryStorage(group_id=temp_config.group_id)
+    await storage.connect()
+    bot = SpamRestrictorBot(temp_config, storage)
+    
+    await storage.add_restricted_user(user_id=1, username="user1")
+    key = (temp_config.group_id, 1)
+    storage.restricted_users[key] = storage.restricted_users[key]._replace(
+        expires_at=utc_timestamp() - SECONDS_PER_DAY
+    )
+    storage._rebuild_expiry_heaps()
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    
+    await bot.check_expired_restrictions(mock_context)
+    
+    assert await storage.is_user_banned(1) is True
+    assert await storage.is_user_restricted(1) is False
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_check_expired_restrictions_multiple_groups(temp_config, temp_db, monkeypatch):
+    """Тест проверки просроченных ограничений в нескольких группах одним процессом."""
+    monkeypatch.setenv('GROUP_ID', '-1001,-1002')
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    
+    await temp_db.add_restricted_user(user_id=1, group_id=-1001)
+    await temp_db.add_restricted_user(user_id=1, group_id=-1002)
+    await temp_db.add_restricted_user(user_id=2, group_id=-1003)
+    await temp_db.connection.execute(
+        "UPDATE restricted_users SET expires_at = ?",
+        (utc_timestamp() - 31 * SECONDS_PER_DAY,)
+    )
+    await temp_db.connection.commit()
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    
+    await bot.check_expired_restrictions(mock_context)
+    
+    removed = [call.kwargs['chat_id'] for call in mock_context.bot.ban_chat_member.await_args_list]
+    assert removed == [-1001, -1002]
+    assert await temp_db.is_user_banned(1, group_id=-1001) is True
+    assert await temp_db.is_user_banned(1, group_id=-1002) is True
+    # Группа, которую бот не защищает, не затрагивается
+    assert await temp_db.is_user_restricted(2, group_id=-1003) is True
+
+
+@pytest.mark.asyncio
+async def test_resume_pending_actions(temp_config, temp_db):
+    """Тест доигрывания действий outbox после сбоя без повторных вызовов API."""
+    group_id = temp_config.group_id
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    for user_id in (1, 2):
+        await temp_db.add_restricted_user(user_id=user_id, group_id=group_id)
+    
+    # Сбой после вызовов API для пользователя 1 и до вызовов для пользователя 2
+    actions = [OutboxAction(group_id, user_id, 'expire', None, utc_timestamp(), False) for user_id in (1, 2)]
+    await temp_db.enqueue_actions(actions)
+    await temp_db.complete_actions(actions[:1])
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    
+    await bot.resume_pending_actions(mock_context)
+    
+    removed = [call.kwargs['user_id'] for call in mock_context.bot.ban_chat_member.await_args_list]
+    assert removed == [2]
+    for user_id in (1, 2):
+        assert await temp_db.is_user_banned(user_id, group_id=group_id) is True
+        assert await temp_db.is_user_restricted(user_id, group_id=group_id) is False
+    assert await temp_db.get_pending_actions() == []
+
+
+@pytest.mark.asyncio
+async def test_resume_and_sweep_do_not_repeat_actions(temp_config, temp_db):
+    """Тест одновременного доигрывания outbox и плановой проверки без повторных вызовов API."""
+    group_id = temp_config.group_id
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    for user_id in (1, 2):
+        await temp_db.add_restricted_user(user_id=user_id, group_id=group_id, period_days=0)
+    actions = [OutboxAction(group_id, user_id, 'expire', None, utc_timestamp(), False) for user_id in (1, 2)]
+    await temp_db.enqueue_actions(actions)
+    
+    async def slow_ban(**kwargs):
+        await asyncio.sleep(0.01)
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    mock_context.bot.ban_chat_member.side_effect = slow_ban
+    
+    await asyncio.gather(bot.resume_pending_actions(mock_context), bot.check_expired_restrictions(mock_context))
+    
+    removed = [call.kwargs['user_id'] for call in mock_context.bot.ban_chat_member.await_args_list]
+    assert sorted(removed) == [1, 2]
+    for user_id in (1, 2):
+        assert await temp_db.is_user_banned(user_id, group_id=group_id) is True
+    assert await temp_db.get_pending_actions() == []
+    assert bot.claimed_actions == set()
+
+
+def make_join_update(group_id, user_id):
+    """Создать обновление chat_member о вступлении пользователя."""
+    update = MagicMock()
+    result = update.chat_member
+    result.chat.id = group_id
+    result.new_chat_member.status = ChatMember.MEMBER
+    user = result.new_chat_member.user
+    user.is_bot = False
+    user.id = user_id
+    user.username = f"user{user_id}"
+    user.first_name = f"User {user_id}"
+    user.last_name = None
+    user.full_name = f"User {user_id}"
+    return update
+
+
+@pytest.mark.asyncio
+async def test_track_chat_member_batches_join_burst(temp_config, temp_db, monkeypatch):
+    """Тест волны вступлений с JOIN_BATCH_MS: одна пакетная проверка банов на всю волну."""
+    monkeypatch.setenv('JOIN_BATCH_MS', '5')
+    group_id = temp_config.group_id
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    await temp_db.add_banned_user(user_id=3, group_id=group_id)
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    
+    with patch.object(temp_db, 'get_banned_user_ids', wraps=temp_db.get_banned_user_ids) as lookups, \
+            patch.object(temp_db, 'is_user_banned', wraps=temp_db.is_user_banned) as single_lookups:
+        await asyncio.gather(*(
+            bot.track_chat_member(make_join_update(group_id, user_id), mock_context) for user_id in range(1, 6)
+        ))
+    
+    assert lookups.await_count == 1
+    assert single_lookups.await_count == 0
+    assert [call.kwargs['user_id'] for call in mock_context.bot.ban_chat_member.await_args_list] == [3]
+    restricted = {call.kwargs['user_id'] for call in mock_context.bot.restrict_chat_member.await_args_list}
+    assert restricted == {1, 2, 4, 5}
+    for user_id in (1, 2, 4, 5):
+        assert await temp_db.is_user_restricted(user_id, group_id=group_id) is True
+    assert await temp_db.is_user_restricted(3, group_id=group_id) is False
+
+
+@pytest.mark.asyncio
+async def test_join_batching_disabled_by_default(temp_config, temp_db):
+    """Тест настроек по умолчанию: проверки по одной, обновления обрабатываются последовательно."""
+    group_id = temp_config.group_id
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    assert temp_config.join_batch_ms == 0
+    assert bot.build_application().concurrent_updates == 1
+    
+    mock_context = MagicMock()
+    mock_context.bot = AsyncMock()
+    with patch.object(temp_db, 'get_banned_user_ids', wraps=temp_db.get_banned_user_ids) as lookups:
+        await bot.track_chat_member(make_join_update(group_id, 1), mock_context)
+    
+    assert lookups.await_count == 0
+    assert await temp_db.is_user_restricted(1, group_id=group_id) is True
+
+
+@pytest.mark.asyncio
+async def test_join_batching_enables_concurrent_updates(temp_config, temp_db, monkeypatch):
+    """Тест JOIN_BATCH_MS > 0: приложение обрабатывает до JOIN_BATCH_SIZE обновлений одновременно."""
+    monkeypatch.setenv('JOIN_BATCH_MS', '5')
+    monkeypatch.setenv('JOIN_BATCH_SIZE', '20')
+    bot = SpamRestrictorBot(temp_config, temp_db)
+    assert bot.build_application().concurrent_updates == 20
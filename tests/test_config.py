@@ -63,3 +63,5 @@ def test_config_default_values(monkeypatch):
     assert config.restriction_period_days == 30
     assert config.check_interval_seconds == 3600
     assert config.log_level == 'INFO'
+    assert config.sqlite_pragmas['journal_mode'] == 'WAL'
+    assert config.sqlite_pragmas['synchronous'] == 'NORMAL'
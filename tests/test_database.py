@@ -1,9 +1,19 @@
 """
 Тесты для модуля database.py
 """
+import logging
 import pytest
+import asyncio
+import aiosqlite
+import sqlite3
+from unittest.mock import patch
 from datetime import datetime, timedelta
 
+from src.archive import BanArchive
+from src.database import Database, utc_timestamp, SECONDS_PER_DAY
+from src.migrations import MIGRATIONS, SCHEMA_VERSION, Migration, run_backfills, run_migrations
+from src.records import OutboxAction, RestrictedUser
+
 
 @pytest.mark.asyncio
 async def test_add_restricted_user(temp_db):
@@ -40,6 +50,53 @@ async def test_add_duplicate_restricted_user(temp_db):
     assert result is False
 
 
+@pytest.mark.asyncio
+async def test_add_restricted_user_refreshes_names(temp_db):
+    """Тест обновления username и имени при повторном вступлении без сброса даты ограничения."""
+    await temp_db.add_restricted_user(user_id=1, username="old", first_name="Old")
+    await temp_db.connection.execute("UPDATE restricted_users SET restricted_at = 100")
+    await temp_db.connection.commit()
+    
+    assert await temp_db.add_restricted_user(user_id=1, username="new", first_name="New") is False
+    
+    cursor = await temp_db.connection.execute(
+        "SELECT username, first_name, restricted_at FROM restricted_users WHERE user_id = 1"
+    )
+    assert await cursor.fetchone() == ("new", "New", 100)
+    assert (await temp_db.get_stats())['total_restricted'] == 1
+
+
+@pytest.mark.asyncio
+async def test_add_restricted_user_concurrent(temp_db):
+    """Тест одновременных добавлений: фиксация одного не попадает между вставкой и чтением RETURNING другого."""
+    calls = []
+    for user_id in range(1, 21):
+        calls.append(temp_db.add_restricted_user(user_id=user_id))
+        calls.append(temp_db.increment_counter('total_rebanned'))
+    results = await asyncio.gather(*calls)
+    
+    assert results[::2] == [True] * 20
+    stats = await temp_db.get_stats()
+    assert (stats['restricted_users'], stats['total_rebanned']) == (20, 20)
+
+
+@pytest.mark.asyncio
+async def test_add_restricted_users_batch(temp_db):
+    """Тест пакетного добавления: возвращаются только новые пользователи."""
+    await temp_db.add_restricted_user(user_id=2, username="two")
+    
+    users = [(user_id, f"user{user_id}", None, None) for user_id in range(1, 201)]
+    new_user_ids = await temp_db.add_restricted_users(users)
+    
+    assert new_user_ids == [user_id for user_id in range(1, 201) if user_id != 2]
+    stats = await temp_db.get_stats()
+    assert (stats['restricted_users'], stats['total_restricted']) == (200, 200)
+    
+    cursor = await temp_db.connection.execute("SELECT username FROM restricted_users WHERE user_id = 2")
+    assert await cursor.fetchone() == ("user2",)
+    assert await temp_db.add_restricted_users(users[:3]) == []
+
+
 @pytest.mark.asyncio
 async def test_is_user_restricted_not_found(temp_db):
     """Тест проверки несуществующего пользователя."""
@@ -100,18 +157,20 @@ async def test_get_expired_restrictions(temp_db):
         last_name="User"
     )
     
-    # Изменяем дату ограничения на 31 день назад вручную
-    cutoff_date = datetime.utcnow() - timedelta(days=31)
+    # Изменяем срок окончания ограничения на вчера вручную
+    expires_at = utc_timestamp() - SECONDS_PER_DAY
     await temp_db.connection.execute(
-        "UPDATE restricted_users SET restricted_at = ? WHERE user_id = ?",
-        (cutoff_date, 12345)
+        "UPDATE restricted_users SET expires_at = ? WHERE user_id = ?",
+        (expires_at, 12345)
     )
     await temp_db.connection.commit()
     
     # Проверяем, что пользователь найден
-    expired = await temp_db.get_expired_restrictions(30)
+    expired = await temp_db.get_expired_restrictions()
     assert len(expired) == 1
-    assert expired[0]['user_id'] == 12345
+    assert isinstance(expired[0], RestrictedUser)
+    assert expired[0].user_id == 12345
+    assert (expired[0].username, expired[0].expires_at) == ("old_user", expires_at)
 
 
 @pytest.mark.asyncio
@@ -126,7 +185,7 @@ async def test_get_expired_restrictions_empty(temp_db):
     )
     
     # Проверяем, что список пуст
-    expired = await temp_db.get_expired_restrictions(30)
+    expired = await temp_db.get_expired_restrictions()
     assert len(expired) == 0
 
 
@@ -172,3 +231,937 @@ async def test_workflow_restricted_to_banned(temp_db):
     
     # 3. Проверяем, что пользователь остается в banned
     assert await temp_db.is_user_banned(user_id) is True
+
+
+@pytest.mark.asyncio
+async def test_get_expired_restrictions_keyset_pagination(temp_db):
+    """Тест постраничной выборки истекших ограничений по ключу (expires_at, user_id)."""
+    base_date = utc_timestamp() - 10 * SECONDS_PER_DAY
+    for user_id in [5, 3, 4, 1, 2]:
+        await temp_db.add_restricted_user(user_id=user_id, username=f"user{user_id}")
+    
+    # Ограничения пользователей 1 и 2 истекли одновременно, остальных - позже
+    for user_id, offset in [(1, 0), (2, 0), (3, 1), (4, 2), (5, 3)]:
+        await temp_db.connection.execute(
+            "UPDATE restricted_users SET expires_at = ? WHERE user_id = ?",
+            (base_date + offset * 3600, user_id)
+        )
+    await temp_db.connection.commit()
+    
+    first_page = await temp_db.get_expired_restrictions(limit=2)
+    assert [user.user_id for user in first_page] == [1, 2]
+    
+    last = first_page[-1]
+    second_page = await temp_db.get_expired_restrictions(limit=2, after=(last.expires_at, last.user_id))
+    assert [user.user_id for user in second_page] == [3, 4]
+    
+    last = second_page[-1]
+    third_page = await temp_db.get_expired_restrictions(limit=2, after=(last.expires_at, last.user_id))
+    assert [user.user_id for user in third_page] == [5]
+
+
+@pytest.mark.asyncio
+async def test_restriction_period_per_user(temp_db):
+    """Тест срока окончания, вычисляемого при ограничении с периодом пользователя."""
+    await temp_db.add_restricted_user(user_id=1)
+    await temp_db.add_restricted_user(user_id=2, period_days=0)
+    
+    cursor = await temp_db.connection.execute(
+        "SELECT user_id, expires_at - restricted_at FROM restricted_users ORDER BY user_id"
+    )
+    assert await cursor.fetchall() == [(1, 30 * SECONDS_PER_DAY), (2, 0)]
+    
+    expired = await temp_db.get_expired_restrictions()
+    assert [user.user_id for user in expired] == [2]
+
+
+@pytest.mark.asyncio
+async def test_fill_expires_at_keeps_existing_deadlines(tmp_path):
+    """Тест заполнения срока строкам без expires_at: смена периода не сдвигает уже заданные сроки."""
+    db_path = str(tmp_path / "period.db")
+    db = Database(db_path, restriction_period_days=30)
+    await db.connect()
+    await db.add_restricted_user(user_id=1)
+    await db.add_restricted_user(user_id=2)
+    # Строка, созданная до появления expires_at
+    await db.connection.execute("UPDATE restricted_users SET expires_at = NULL WHERE user_id = 2")
+    await db.connection.commit()
+    await db.close()
+    
+    db = Database(db_path, restriction_period_days=7)
+    await db.connect()
+    cursor = await db.connection.execute(
+        "SELECT user_id, expires_at - restricted_at FROM restricted_users ORDER BY user_id"
+    )
+    rows = await cursor.fetchall()
+    await db.close()
+    
+    assert rows == [(1, 30 * SECONDS_PER_DAY), (2, 7 * SECONDS_PER_DAY)]
+
+
+@pytest.mark.asyncio
+async def test_expired_restrictions_index_used(temp_db):
+    """Тест использования индекса группы при выборке истекших ограничений."""
+    cursor = await temp_db.connection.execute(
+        "EXPLAIN QUERY PLAN SELECT user_id FROM restricted_users "
+        "WHERE group_id = ? AND expires_at <= ? ORDER BY expires_at, user_id",
+        (-1001, utc_timestamp())
+    )
+    plan = " ".join(str(row[-1]) for row in await cursor.fetchall())
+    assert "idx_restricted_users_expires_at" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_timestamps_stored_as_integers(temp_db):
+    """Тест хранения дат в секундах эпохи Unix."""
+    await temp_db.add_restricted_user(user_id=1, username="user1")
+    await temp_db.add_banned_user(user_id=2, username="banned1")
+    
+    cursor = await temp_db.connection.execute(
+        "SELECT typeof(joined_at), typeof(restricted_at) FROM restricted_users"
+    )
+    assert await cursor.fetchone() == ('integer', 'integer')
+    
+    cursor = await temp_db.connection.execute("SELECT typeof(banned_at) FROM banned_users")
+    assert await cursor.fetchone() == ('integer',)
+
+
+@pytest.mark.asyncio
+async def test_migrate_iso_timestamps(tmp_path):
+    """Тест фоновой конвертации строковых дат старого формата."""
+    db_path = str(tmp_path / "legacy.db")
+    old_date = datetime.utcnow() - timedelta(days=31)
+    
+    # База в формате старых версий: даты сохранены строками ISO
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.execute("""
+            CREATE TABLE restricted_users (
+                user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+                joined_at TIMESTAMP NOT NULL, restricted_at TIMESTAMP NOT NULL
+            )
+        """)
+        await connection.execute("""
+            CREATE TABLE banned_users (
+                user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+                banned_at TIMESTAMP NOT NULL, reason TEXT
+            )
+        """)
+        await connection.executemany(
+            "INSERT INTO restricted_users VALUES (?, ?, NULL, NULL, ?, ?)",
+            [(user_id, f"user{user_id}", old_date.isoformat(" "), old_date.isoformat(" "))
+             for user_id in range(1, 6)]
+        )
+        await connection.execute(
+            "INSERT INTO banned_users VALUES (10, 'banned', NULL, NULL, ?, 'old')",
+            (old_date.isoformat(" "),)
+        )
+        await connection.commit()
+    
+    db = Database(db_path)
+    db.migration_batch_size = 2
+    await db.connect()
+    await db.migration_task
+    
+    cursor = await db.connection.execute(
+        "SELECT COUNT(*) FROM restricted_users WHERE typeof(restricted_at) = 'integer' "
+        "AND typeof(joined_at) = 'integer'"
+    )
+    assert (await cursor.fetchone())[0] == 5
+    
+    cursor = await db.connection.execute("SELECT banned_at FROM banned_users")
+    assert (await cursor.fetchone())[0] == int((old_date - datetime(1970, 1, 1)).total_seconds())
+    
+    expired = await db.get_expired_restrictions()
+    assert [user.user_id for user in expired] == [1, 2, 3, 4, 5]
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_pragma_profile_applied(tmp_path):
+    """Тест применения профиля производительности SQLite."""
+    db = Database(str(tmp_path / "pragmas.db"), pragmas={
+        'busy_timeout': 2500,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -8000,
+        'temp_store': 'MEMORY',
+    })
+    await db.connect()
+    
+    assert db.pragma_profile == {
+        'busy_timeout': 2500,
+        'journal_mode': 'wal',
+        'synchronous': 1,
+        'cache_size': -8000,
+        'temp_store': 2,
+    }
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_run_maintenance_reclaims_pages(tmp_path):
+    """Тест обслуживания БД: возврат свободных страниц и отчет."""
+    db = Database(str(tmp_path / "maintenance.db"), pragmas={
+        'auto_vacuum': 'INCREMENTAL',
+        'journal_mode': 'WAL',
+    })
+    await db.connect()
+    assert db.pragma_profile['auto_vacuum'] == 2
+    
+    await db.upsert_rows('banned_users', [
+        {'group_id': 0, 'user_id': user_id, 'username': 'x' * 200, 'first_name': None,
+         'last_name': None, 'banned_at': 0, 'reason': None}
+        for user_id in range(5000)
+    ])
+    await db.connection.execute("DELETE FROM banned_users")
+    await db.connection.commit()
+    assert await db._pragma_value("freelist_count") > 100
+    
+    report = await db.run_maintenance(vacuum_pages=100, quiet_seconds=0)
+    assert report['freed_pages'] == 100
+    assert report['freelist_count'] > 0
+    assert report['checkpoint']['mode'] == 'TRUNCATE'
+    assert report['wal_size'] == 0
+    assert report['file_size'] == report['page_count'] * report['page_size']
+    assert db.last_maintenance == report
+    
+    # Статистика планировщика собрана
+    cursor = await db.connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    assert (await cursor.fetchone())[0] == 1
+    
+    # После недавней записи WAL не усекается, чтобы не ждать читателей
+    await db.add_restricted_user(user_id=1)
+    report = await db.run_maintenance(vacuum_pages=0)
+    assert report['freed_pages'] == 0
+    assert report['checkpoint']['mode'] == 'PASSIVE'
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_run_maintenance_during_expire_batch(tmp_path):
+    """Тест обслуживания БД во время переноса пачки: пачка фиксируется целиком."""
+    db = Database(str(tmp_path / "maintenance.db"), pragmas={'auto_vacuum': 'INCREMENTAL'})
+    await db.connect()
+    user_ids = list(range(1, 3501))
+    await db.add_restricted_users([(user_id, None, None, None) for user_id in user_ids])
+    await db.flush()
+    
+    # Перенос начинается, когда обслуживание уже зафиксировало статистику планировщика
+    expire_task = None
+    pragma_value = db._pragma_value
+    
+    async def start_expire(name):
+        nonlocal expire_task
+        if expire_task is None:
+            expire_task = asyncio.create_task(db.expire_restricted_users(user_ids))
+            await asyncio.sleep(0.01)
+        return await pragma_value(name)
+    
+    try:
+        with patch.object(db, '_pragma_value', start_expire):
+            await db.run_maintenance(quiet_seconds=0)
+        
+        assert await expire_task == len(user_ids)
+        assert db.connection.in_transaction is False
+        stats = await db.get_stats()
+        assert (stats['restricted_users'], stats['banned_users'], stats['total_expired']) == (0, 3500, 3500)
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_backfill_batches_not_committed_by_bot_writes(tmp_path):
+    """Тест фонового заполнения: записи бота не фиксируют пачку на середине."""
+    db_path = str(tmp_path / "backfill.db")
+    db = Database(db_path)
+    await db.connect()
+    await db.migration_task
+    await db.connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, done INTEGER NOT NULL)")
+    await db.connection.executemany("INSERT INTO items VALUES (?, 0)", [(i,) for i in range(10)])
+    await db.connection.commit()
+    
+    visible = []
+    writers = []
+    
+    async def backfill(connection, batch_size):
+        cursor = await connection.execute(
+            "UPDATE items SET done = 1 WHERE id IN (SELECT id FROM items WHERE done = 0 LIMIT ?)",
+            (batch_size,)
+        )
+        # Обработчик бота пишет, пока пачка не зафиксирована
+        writers.append(asyncio.create_task(db.add_restricted_user(user_id=len(writers) + 1)))
+        await asyncio.sleep(0.01)
+        async with aiosqlite.connect(db_path) as other:
+            cursor_other = await other.execute("SELECT COUNT(*) FROM items WHERE done = 1")
+            visible.append((await cursor_other.fetchone())[0])
+        return cursor.rowcount
+    
+    migrations = MIGRATIONS + [Migration(SCHEMA_VERSION + 1, "заполнение items", backfill=backfill)]
+    await run_migrations(db.connection, migrations)
+    try:
+        await run_backfills(db.connection, 4, migrations, transaction=db._backfill_transaction)
+        await asyncio.gather(*writers)
+        
+        # Видны только зафиксированные целиком пачки
+        assert visible == [0, 4, 8, 10]
+        assert await db.is_user_restricted(len(writers)) is True
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_query_timing_and_slow_query_log(tmp_path, caplog):
+    """Тест замеров времени методов и журнала медленных запросов с планом выполнения."""
+    db = Database(str(tmp_path / "timing.db"), slow_query_ms=1e-6)
+    await db.connect()
+    
+    await db.add_restricted_user(user_id=1)
+    with caplog.at_level(logging.WARNING, logger='src.database'):
+        assert await db.is_user_restricted(1) is True
+    
+    assert "Медленный запрос" in caplog.text
+    assert "SEARCH restricted_users USING COVERING INDEX" in caplog.text
+    
+    summary = db.query_stats.summary()
+    assert summary['add_restricted_user']['count'] == 1
+    assert summary['is_user_restricted']['count'] == 1
+    assert summary['is_user_restricted']['p50'] <= summary['is_user_restricted']['max']
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_covers_batches_and_scans(tmp_path, caplog):
+    """Тест журнала медленных запросов для пакетных записей и постраничных переборов."""
+    db = Database(str(tmp_path / "timing.db"), slow_query_ms=1e-6)
+    await db.connect()
+    
+    with caplog.at_level(logging.WARNING, logger='src.database'):
+        await db.enqueue_actions([OutboxAction(-1001, 1, 'expire', None, 100, False)])
+        assert [row async for row in db.iter_rows('banned_users')] == []
+        await db.upsert_rows('banned_users', [{'group_id': 0, 'user_id': 1, 'banned_at': 100}])
+        assert [row.user_id async for row in db.iter_rows('banned_users')] == [1]
+    
+    assert "INSERT OR IGNORE INTO outbox" in caplog.text
+    assert "INSERT INTO banned_users" in caplog.text
+    # Страница перебора записывается в журнал отдельно от выполнения запроса
+    assert caplog.text.count("FROM banned_users ORDER BY group_id, user_id") == 3
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_query_plan_does_not_block_commits(tmp_path):
+    """Тест чтения плана медленного запроса, пока другая задача фиксирует транзакцию."""
+    db = Database(str(tmp_path / "timing.db"), slow_query_ms=1e-6)
+    await db.connect()
+    updating = True
+    
+    async def update_counters():
+        nonlocal updating
+        try:
+            for _ in range(50):
+                await db.increment_counter('total_expired')
+        finally:
+            updating = False
+    
+    async def commit_loop():
+        while updating:
+            await db._commit()
+    
+    try:
+        await asyncio.gather(update_counters(), commit_loop())
+        await db.flush()
+        assert (await db.get_stats())['total_expired'] == 50
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_pragma_profile_rejects_unknown(tmp_path):
+    """Тест отказа от неподдерживаемых PRAGMA и значений."""
+    db = Database(str(tmp_path / "pragmas.db"), pragmas={'writable_schema': 1})
+    with pytest.raises(ValueError):
+        await db.connect()
+    await db.close()
+    
+    db = Database(str(tmp_path / "pragmas.db"), pragmas={'journal_mode': 'WAL; DROP TABLE x'})
+    with pytest.raises(ValueError):
+        await db.connect()
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_on_batch_size(tmp_path):
+    """Тест групповой фиксации изменений по достижении размера пачки."""
+    db_path = str(tmp_path / "write_behind.db")
+    db = Database(db_path, commit_batch_size=3, commit_interval_ms=60000)
+    await db.connect()
+    await db.migration_task
+    
+    async def committed_count():
+        async with aiosqlite.connect(db_path) as reader:
+            cursor = await reader.execute("SELECT COUNT(*) FROM restricted_users")
+            return (await cursor.fetchone())[0]
+    
+    await db.add_restricted_user(user_id=1)
+    await db.add_restricted_user(user_id=2)
+    assert db.pending_writes == 2
+    assert await committed_count() == 0
+    # Свое соединение видит незафиксированные изменения
+    assert await db.is_user_restricted(1) is True
+    
+    await db.add_restricted_user(user_id=3)
+    assert db.pending_writes == 0
+    assert await committed_count() == 3
+    
+    await db.add_restricted_user(user_id=4)
+    await db.close()
+    assert await committed_count() == 4
+
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_on_interval(tmp_path):
+    """Тест групповой фиксации изменений по таймеру."""
+    db = Database(str(tmp_path / "write_behind.db"), commit_batch_size=100, commit_interval_ms=10)
+    await db.connect()
+    await db.migration_task
+    
+    await db.add_banned_user(user_id=1)
+    assert db.pending_writes == 1
+    
+    await asyncio.sleep(0.1)
+    assert db.pending_writes == 0
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_expire_restricted_users(temp_db):
+    """Тест пакетного переноса пользователей из ограниченных в забаненные."""
+    await temp_db.add_restricted_user(user_id=1, username="user1", first_name="One")
+    await temp_db.add_restricted_user(user_id=2, username="user2")
+    await temp_db.add_restricted_user(user_id=3, username="user3")
+    
+    moved = await temp_db.expire_restricted_users([1, 2, 99], reason="Expired")
+    
+    assert moved == 2
+    assert await temp_db.is_user_restricted(1) is False
+    assert await temp_db.is_user_restricted(2) is False
+    assert await temp_db.is_user_restricted(3) is True
+    assert await temp_db.is_user_banned(1) is True
+    assert await temp_db.is_user_banned(2) is True
+    assert await temp_db.is_user_banned(99) is False
+    
+    cursor = await temp_db.connection.execute(
+        "SELECT username, first_name, reason FROM banned_users WHERE user_id = 1"
+    )
+    assert await cursor.fetchone() == ("user1", "One", "Expired")
+
+
+@pytest.mark.asyncio
+async def test_expire_restricted_users_failure_keeps_pending_writes(tmp_path):
+    """Тест ошибки переноса: откатывается только пачка, отложенные групповой фиксацией изменения сохраняются."""
+    db_path = str(tmp_path / "expire.db")
+    db = Database(db_path, commit_batch_size=100, commit_interval_ms=60000)
+    await db.connect()
+    await db.add_restricted_user(user_id=1)
+    await db.add_restricted_user(user_id=111)
+    
+    # Первая часть пачки успевает выполниться, на второй - неверный параметр запроса
+    with pytest.raises(aiosqlite.Error):
+        await db.expire_restricted_users(list(range(1, 501)) + [object()])
+    assert db.pending_writes == 2
+    await db.close()
+    
+    db = Database(db_path)
+    await db.connect()
+    assert await db.is_user_restricted(1) is True
+    assert await db.is_user_restricted(111) is True
+    assert await db.is_user_banned(1) is False
+    stats = await db.get_stats()
+    assert (stats['total_restricted'], stats['total_expired']) == (2, 0)
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_expire_restricted_users_after_queued_write(temp_db):
+    """Тест переноса, начатого, пока запись другой задачи стоит в очереди соединения."""
+    for user_id in range(1, 21):
+        await temp_db.add_restricted_user(user_id=user_id)
+    
+    for user_id in range(1, 21):
+        # Запись уже передана потоку соединения и откроет транзакцию неявным BEGIN
+        write = asyncio.create_task(temp_db.increment_counter('total_rebanned'))
+        await asyncio.sleep(0)
+        assert await temp_db.expire_restricted_users([user_id]) == 1
+        await write
+    
+    await temp_db.flush()
+    stats = await temp_db.get_stats()
+    assert (stats['banned_users'], stats['total_expired'], stats['total_rebanned']) == (20, 20, 20)
+
+
+@pytest.mark.asyncio
+async def test_expire_restricted_users_empty(temp_db):
+    """Тест пакетного переноса пустого списка."""
+    assert await temp_db.expire_restricted_users([]) == 0
+
+
+@pytest.mark.asyncio
+async def test_banned_ids_cache(tmp_path):
+    """Тест проверки забаненных по индексу в памяти."""
+    db_path = str(tmp_path / "cache.db")
+    db = Database(db_path)
+    await db.connect()
+    await db.add_banned_user(user_id=1)
+    await db.close()
+    
+    db = Database(db_path, cache_banned_ids=True)
+    await db.connect()
+    assert db.banned_ids == {0: {1}}
+    
+    await db.add_banned_user(user_id=2)
+    await db.add_restricted_user(user_id=3)
+    await db.expire_restricted_users([3, 4])
+    
+    assert db.banned_ids == {0: {1, 2, 3}}
+    assert await db.is_user_banned(3) is True
+    assert await db.is_user_banned(4) is False
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_banned_filter_persisted(tmp_path):
+    """Тест фильтра Блума забаненных: сохранение рядом с БД и догрузка новых записей."""
+    db_path = str(tmp_path / "bloom.db")
+    db = Database(db_path, bloom_capacity=1000)
+    await db.connect()
+    
+    await db.add_banned_user(user_id=1)
+    assert await db.is_user_banned(1) is True
+    assert await db.is_user_banned(2) is False
+    await db.close()
+    assert (tmp_path / "bloom.db.bloom").exists()
+    
+    # Запись, добавленная в обход фильтра (например, другим процессом), догружается по banned_at
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.execute(
+            "INSERT INTO banned_users (group_id, user_id, banned_at) VALUES (0, ?, ?)",
+            (2, utc_timestamp() + 10)
+        )
+        await connection.commit()
+    
+    db = Database(db_path, bloom_capacity=1000)
+    await db.connect()
+    assert 1 in db.banned_filter
+    assert await db.is_user_banned(2) is True
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_banned_filter_not_saved_after_external_writes(tmp_path):
+    """Тест отказа от сохранения фильтра Блума, если БД меняли в обход бота."""
+    db_path = str(tmp_path / "bloom.db")
+    db = Database(db_path, bloom_capacity=1000)
+    await db.connect()
+    await db.add_banned_user(user_id=1)
+    
+    # Импорт давнего бана другим процессом, пока бот работает
+    async with aiosqlite.connect(db_path) as connection:
+        await connection.execute(
+            "INSERT INTO banned_users (group_id, user_id, banned_at) VALUES (0, 2, ?)",
+            (utc_timestamp() - 400 * SECONDS_PER_DAY,)
+        )
+        await connection.commit()
+    await db.close()
+    assert not (tmp_path / "bloom.db.bloom").exists()
+    
+    db = Database(db_path, bloom_capacity=1000)
+    await db.connect()
+    assert await db.is_user_banned(1) is True
+    assert await db.is_user_banned(2) is True
+    await db.close()
+    assert (tmp_path / "bloom.db.bloom").exists()
+
+
+@pytest.mark.asyncio
+async def test_get_banned_user_ids(tmp_path):
+    """Тест пакетной проверки забаненных: запросы по частям, архив и фильтр Блума."""
+    db_path = str(tmp_path / "lookup.db")
+    db = Database(db_path, bloom_capacity=1000)
+    await db.connect()
+    for user_id in [1, 2, 3, 700, 1100]:
+        await db.add_banned_user(user_id=user_id)
+    await db.add_banned_user(user_id=4, group_id=-1002)
+    await db.connection.execute(
+        "UPDATE banned_users SET banned_at = ? WHERE user_id <= 2",
+        (utc_timestamp() - 400 * SECONDS_PER_DAY,)
+    )
+    await db.connection.commit()
+    assert await db.archive_old_bans(365) == 2
+    
+    user_ids = list(range(1200)) + [3]
+    assert await db.get_banned_user_ids(user_ids) == {1, 2, 3, 700, 1100}
+    assert await db.get_banned_user_ids(user_ids, group_id=-1002) == {4}
+    assert await db.get_banned_user_ids([]) == set()
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_stats_counters_maintained(temp_db):
+    """Тест поддержки счетчиков статистики при изменениях таблиц."""
+    await temp_db.add_restricted_user(user_id=1)
+    await temp_db.add_restricted_user(user_id=2)
+    await temp_db.add_restricted_user(user_id=3)
+    await temp_db.add_restricted_user(user_id=3)
+    await temp_db.add_banned_user(user_id=10)
+    # Повторный бан того же пользователя не увеличивает количество забаненных
+    await temp_db.add_banned_user(user_id=10, reason="Again")
+    await temp_db.expire_restricted_users([1, 2])
+    await temp_db.remove_restricted_user(3)
+    await temp_db.increment_counter('total_rebanned')
+    
+    stats = await temp_db.get_stats()
+    
+    assert stats == {
+        'restricted_users': 0,
+        'banned_users': 3,
+        'total_restricted': 3,
+        'total_expired': 2,
+        'total_rebanned': 1,
+        'archived_users': 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_stats_counters_seeded_for_existing_database(tmp_path):
+    """Тест начального заполнения счетчиков для базы без таблицы счетчиков."""
+    db_path = str(tmp_path / "legacy.db")
+    db = Database(db_path)
+    await db.connect()
+    await db.add_restricted_user(user_id=1)
+    await db.add_banned_user(user_id=2)
+    await db.add_banned_user(user_id=3)
+    # База до появления таблицы счетчиков и версионных миграций
+    await db.connection.execute("DROP TABLE counters")
+    await db.connection.execute("PRAGMA user_version = 0")
+    await db.connection.commit()
+    await db.close()
+    
+    db = Database(db_path)
+    await db.connect()
+    stats = await db.get_stats()
+    assert stats['restricted_users'] == 1
+    assert stats['banned_users'] == 2
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_increment_unknown_counter(temp_db):
+    """Тест отказа увеличивать неизвестный счетчик."""
+    with pytest.raises(ValueError):
+        await temp_db.increment_counter('unknown')
+
+
+@pytest.mark.asyncio
+async def test_iter_expired_restrictions(temp_db):
+    """Тест потокового перебора истекших ограничений с переносом во время перебора."""
+    for user_id in range(1, 8):
+        await temp_db.add_restricted_user(user_id=user_id, username=f"user{user_id}")
+    await temp_db.add_restricted_user(user_id=100, username="fresh")
+    await temp_db.connection.execute(
+        "UPDATE restricted_users SET expires_at = ? - user_id WHERE user_id < 100",
+        (utc_timestamp() - SECONDS_PER_DAY,)
+    )
+    await temp_db.connection.commit()
+    
+    seen = []
+    async for user in temp_db.iter_expired_restrictions(batch_size=3):
+        seen.append(user.user_id)
+        await temp_db.expire_restricted_users([user.user_id])
+    
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+    assert (await temp_db.get_stats())['restricted_users'] == 1
+
+
+@pytest.mark.asyncio
+async def test_read_pool(tmp_path):
+    """Тест чтения через пул соединений только для чтения в режиме WAL."""
+    db = Database(str(tmp_path / "pool.db"), pragmas={'journal_mode': 'WAL'}, read_pool_size=2)
+    await db.connect()
+    assert len(db.read_connections) == 2
+    
+    await db.add_restricted_user(user_id=1)
+    await db.add_banned_user(user_id=2)
+    
+    async with db._read_connection() as connection:
+        assert connection in db.read_connections
+        with pytest.raises(aiosqlite.OperationalError):
+            await connection.execute("DELETE FROM banned_users")
+    
+    assert await db.is_user_restricted(1) is True
+    assert await db.is_user_banned(2) is True
+    assert (await db.get_stats())['banned_users'] == 1
+    
+    await db.close()
+    assert db.read_connections == []
+
+
+@pytest.mark.asyncio
+async def test_read_pool_sees_pending_writes(tmp_path):
+    """Тест чтения отложенных изменений через основное соединение."""
+    db = Database(
+        str(tmp_path / "pool.db"),
+        pragmas={'journal_mode': 'WAL'},
+        commit_batch_size=100,
+        commit_interval_ms=60000,
+        read_pool_size=1
+    )
+    await db.connect()
+    await db.migration_task
+    
+    await db.add_banned_user(user_id=1)
+    assert db.pending_writes == 1
+    assert await db.is_user_banned(1) is True
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_read_pool_used_while_writes_pending(tmp_path):
+    """Тест пула при отложенных изменениях: через основное соединение читаются только измененные пользователи."""
+    db = Database(
+        str(tmp_path / "pool.db"),
+        pragmas={'journal_mode': 'WAL'},
+        commit_batch_size=100,
+        commit_interval_ms=60000,
+        read_pool_size=1
+    )
+    await db.connect()
+    await db.migration_task
+    await db.add_banned_user(user_id=1)
+    await db.flush()
+    
+    await db.add_banned_user(user_id=2)
+    await db.add_restricted_user(user_id=3)
+    assert db.pending_writes == 2
+    
+    pool_connection = db.read_connections[0]
+    with patch.object(pool_connection, 'execute', wraps=pool_connection.execute) as pool_reads:
+        assert await db.is_user_banned(1) is True
+        assert await db.is_user_banned(4) is False
+        assert await db.get_banned_user_ids([1, 4]) == {1}
+        await db.get_stats()
+        assert pool_reads.call_count == 4
+        
+        assert await db.is_user_banned(2) is True
+        assert await db.is_user_restricted(3) is True
+        assert await db.get_banned_user_ids([1, 2]) == {1, 2}
+        assert pool_reads.call_count == 4
+    
+    # После фиксации и эти пользователи читаются через пул
+    await db.flush()
+    with patch.object(pool_connection, 'execute', wraps=pool_connection.execute) as pool_reads:
+        assert await db.is_user_banned(2) is True
+        assert pool_reads.call_count == 1
+    
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_read_pool_requires_wal(tmp_path):
+    """Тест отказа от пула соединений для чтения без режима WAL."""
+    db = Database(str(tmp_path / "pool.db"), read_pool_size=2)
+    await db.connect()
+    assert db.read_connections == []
+    assert await db.is_user_banned(1) is False
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_archive_old_bans_counts_deleted_rows(tmp_path):
+    """Тест подсчета архивированных банов без пользователей, забаненных повторно во время переноса."""
+    db_path = str(tmp_path / "archive.db")
+    db = Database(db_path)
+    await db.connect()
+    for user_id in range(1, 4):
+        await db.add_banned_user(user_id=user_id)
+    await db.connection.execute("UPDATE banned_users SET banned_at = ?", (utc_timestamp() - 400 * SECONDS_PER_DAY,))
+    await db.connection.commit()
+    
+    add_segment = BanArchive.add_segment
+    
+    def add_segment_and_reban(archive, user_ids):
+        # Пользователь 1 забанен повторно между чтением ID и удалением строк
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("UPDATE banned_users SET banned_at = ? WHERE user_id = 1", (utc_timestamp(),))
+        return add_segment(archive, user_ids)
+    
+    with patch.object(BanArchive, 'add_segment', add_segment_and_reban):
+        assert await db.archive_old_bans(365) == 2
+    
+    stats = await db.get_stats()
+    assert stats['banned_users'] == 1
+    assert stats['archived_users'] == 2
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_archive_old_bans(tmp_path):
+    """Тест переноса давних банов в холодный архив."""
+    db_path = str(tmp_path / "archive.db")
+    db = Database(db_path)
+    await db.connect()
+    for user_id in range(1, 6):
+        await db.add_banned_user(user_id=user_id)
+    await db.connection.execute(
+        "UPDATE banned_users SET banned_at = ? WHERE user_id <= 3",
+        (utc_timestamp() - 400 * SECONDS_PER_DAY,)
+    )
+    await db.connection.commit()
+    
+    assert await db.archive_old_bans(365) == 3
+    assert await db.archive_old_bans(365) == 0
+    
+    stats = await db.get_stats()
+    assert stats['banned_users'] == 2
+    assert stats['archived_users'] == 3
+    assert await db.is_user_banned(1) is True
+    assert await db.is_user_banned(5) is True
+    assert await db.is_user_banned(6) is False
+    await db.close()
+    
+    # Архив подхватывается при следующем запуске, в том числе кэшем ID
+    db = Database(db_path, cache_banned_ids=True)
+    await db.connect()
+    assert set(range(1, 6)) <= db.banned_ids[0]
+    assert await db.is_user_banned(2) is True
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_rows_scoped_by_group(temp_db):
+    """Тест разделения записей по группам."""
+    assert await temp_db.add_restricted_user(user_id=1, group_id=-1001) is True
+    assert await temp_db.add_restricted_user(user_id=1, group_id=-1002) is True
+    assert await temp_db.add_banned_user(user_id=2, group_id=-1001) is True
+    
+    assert await temp_db.is_user_restricted(1, group_id=-1001) is True
+    assert await temp_db.is_user_restricted(1) is False
+    assert await temp_db.is_user_banned(2, group_id=-1001) is True
+    assert await temp_db.is_user_banned(2, group_id=-1002) is False
+    
+    assert await temp_db.expire_restricted_users([1], group_id=-1001) == 1
+    assert await temp_db.is_user_restricted(1, group_id=-1002) is True
+    assert await temp_db.is_user_banned(1, group_id=-1001) is True
+    assert await temp_db.is_user_banned(1, group_id=-1002) is False
+
+
+@pytest.mark.asyncio
+async def test_legacy_rows_adopted_by_default_group(tmp_path):
+    """Тест передачи записей без группы группе по умолчанию при подключении."""
+    db_path = str(tmp_path / "legacy.db")
+    db = Database(db_path)
+    await db.connect()
+    await db.add_restricted_user(user_id=1)
+    await db.add_banned_user(user_id=2)
+    await db.add_banned_user(user_id=3)
+    await db.add_banned_user(user_id=3, group_id=-1001)
+    await db.close()
+    
+    db = Database(db_path, group_id=-1001)
+    await db.connect()
+    assert await db.is_user_restricted(1) is True
+    assert await db.is_user_banned(2) is True
+    assert await db.is_user_banned(3) is True
+    assert await db.is_user_banned(2, group_id=0) is False
+    assert (await db.get_stats())['banned_users'] == 2
+    await db.close()
+
+
+
+@pytest.mark.asyncio
+async def test_event_log_batched(temp_db):
+    """Тест буферизации журнала событий и выборки по пользователю."""
+    temp_db.event_batch_size = 3
+    await temp_db.log_event('join', user_id=1, details="user1")
+    await temp_db.log_event('restrict', user_id=1)
+    assert len(temp_db.event_buffer) == 2
+    
+    await temp_db.log_event('join', user_id=2)
+    assert temp_db.event_buffer == []
+    
+    await temp_db.log_event('error', user_id=1, details="fail")
+    events = await temp_db.get_events(user_id=1)
+    assert [event['event'] for event in events] == ['error', 'restrict', 'join']
+    assert events[-1]['details'] == "user1"
+    
+    counts = await temp_db.count_events(since=utc_timestamp() - 60)
+    assert counts['join'] == 2
+    assert counts['reban'] == 0
+    
+    with pytest.raises(ValueError):
+        await temp_db.log_event('unknown')
+
+
+@pytest.mark.asyncio
+async def test_event_log_flushed_on_close_and_purged(tmp_path):
+    """Тест записи буфера событий при закрытии и очистки по сроку хранения."""
+    db_path = str(tmp_path / "events.db")
+    db = Database(db_path)
+    await db.connect()
+    for user_id in range(5):
+        await db.log_event('join', user_id=user_id)
+    await db.close()
+    
+    db = Database(db_path)
+    await db.connect()
+    await db.connection.execute(
+        "UPDATE events SET created_at = ? WHERE user_id < 3",
+        (utc_timestamp() - 100 * SECONDS_PER_DAY,)
+    )
+    await db.connection.commit()
+    
+    assert await db.purge_events(90, batch_size=2) == 3
+    assert [event['user_id'] for event in await db.get_events()] == [4, 3]
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_outbox_actions(temp_db):
+    """Тест очереди outbox: постановка, отметка выполнения и удаление действий."""
+    actions = [OutboxAction(-1001, user_id, 'expire', f"user{user_id}", 100, False) for user_id in (1, 2)]
+    assert await temp_db.enqueue_actions(actions) == 2
+    # Повторная постановка не сбрасывает состояние действий, оставшихся после сбоя
+    await temp_db.complete_actions(actions[:1])
+    assert await temp_db.enqueue_actions(actions) == 0
+    
+    pending = await temp_db.get_pending_actions()
+    assert [(action.user_id, bool(action.done)) for action in pending] == [(1, True), (2, False)]
+    assert pending[0].username == "user1"
+    
+    await temp_db.finish_actions(actions)
+    assert await temp_db.get_pending_actions() == []
+    
+    with pytest.raises(ValueError):
+        await temp_db.enqueue_actions([OutboxAction(-1001, 3, 'kick', None, 100, False)])
+
+
+@pytest.mark.asyncio
+async def test_complete_actions_single_commit(temp_db):
+    """Тест отметки выполнения пачки действий одним коммитом."""
+    actions = [OutboxAction(-1001, user_id, 'expire', None, 100, False) for user_id in range(1, 51)]
+    await temp_db.enqueue_actions(actions)
+    
+    with patch.object(temp_db, '_commit_now', wraps=temp_db._commit_now) as commit_now:
+        await temp_db.complete_actions(actions)
+    
+    assert commit_now.await_count == 1
+    assert all(action.done for action in await temp_db.get_pending_actions())
+
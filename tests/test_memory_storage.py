@@ -0,0 +1,143 @@
+"""
+Тесты для модуля memory_storage.py
+"""
+import heapq
+import pytest
+
+from src.memory_storage import MemoryStorage
+from src.records import OutboxAction
+from src.storage import utc_timestamp, SECONDS_PER_DAY
+
+
+@pytest.fixture
+async def memory_storage():
+    """
+    Создать хранилище в памяти без снимков на диск.
+    """
+    storage = MemoryStorage()
+    await storage.connect()
+    
+    yield storage
+    
+    await storage.close()
+
+
+def age_restriction(storage, user_id, days):
+    """Сдвинуть срок окончания ограничения пользователя в прошлое."""
+    key = (storage.group_id, user_id)
+    user = storage.restricted_users[key] = storage.restricted_users[key]._replace(
+        expires_at=utc_timestamp() - days * SECONDS_PER_DAY
+    )
+    heapq.heappush(storage._expiry_heaps[storage.group_id], (user.expires_at, user_id))
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_restricted_and_banned(memory_storage):
+    """Тест добавления, проверки и удаления пользователей."""
+    assert await memory_storage.add_restricted_user(user_id=1, username="user1") is True
+    assert await memory_storage.add_restricted_user(user_id=1, username="user1") is False
+    assert await memory_storage.is_user_restricted(1) is True
+    
+    assert await memory_storage.add_banned_user(user_id=2, reason="Test") is True
+    assert await memory_storage.is_user_banned(2) is True
+    assert await memory_storage.is_user_banned(3) is False
+    
+    assert await memory_storage.remove_restricted_user(1) is True
+    assert await memory_storage.remove_restricted_user(1) is False
+    assert await memory_storage.is_user_restricted(1) is False
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_expired_restrictions(memory_storage):
+    """Тест выборки истекших ограничений по куче в порядке (expires_at, user_id)."""
+    for user_id in range(1, 6):
+        await memory_storage.add_restricted_user(user_id=user_id, username=f"user{user_id}")
+    for user_id in [4, 2, 5]:
+        age_restriction(memory_storage, user_id, days=user_id)
+    
+    expired = await memory_storage.get_expired_restrictions()
+    assert [user.user_id for user in expired] == [5, 4, 2]
+    
+    first_page = await memory_storage.get_expired_restrictions(limit=1)
+    last = first_page[-1]
+    second_page = await memory_storage.get_expired_restrictions(after=(last.expires_at, last.user_id))
+    assert [user.user_id for user in second_page] == [4, 2]
+    
+    seen = []
+    async for user in memory_storage.iter_expired_restrictions(batch_size=2):
+        seen.append(user.user_id)
+        await memory_storage.expire_restricted_users([user.user_id])
+    assert seen == [5, 4, 2]
+    assert await memory_storage.get_expired_restrictions() == []
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_stats(memory_storage):
+    """Тест статистики хранилища в памяти."""
+    await memory_storage.add_restricted_user(user_id=1)
+    await memory_storage.add_restricted_user(user_id=2)
+    await memory_storage.add_banned_user(user_id=3)
+    await memory_storage.expire_restricted_users([1])
+    await memory_storage.increment_counter('total_rebanned')
+    
+    assert await memory_storage.get_stats() == {
+        'restricted_users': 1,
+        'banned_users': 2,
+        'total_restricted': 2,
+        'total_expired': 1,
+        'total_rebanned': 1,
+        'archived_users': 0,
+    }
+    
+    with pytest.raises(ValueError):
+        await memory_storage.increment_counter('unknown')
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_snapshot(tmp_path):
+    """Тест сохранения и загрузки снимка хранилища."""
+    snapshot_path = str(tmp_path / "snapshot.json")
+    storage = MemoryStorage(snapshot_path=snapshot_path)
+    await storage.connect()
+    await storage.add_restricted_user(user_id=1, username="user1")
+    await storage.add_banned_user(user_id=2, username="banned")
+    await storage.log_event('restrict', user_id=1)
+    action = OutboxAction(0, 1, 'expire', "user1", 100, False)
+    await storage.enqueue_actions([action])
+    await storage.close()
+    
+    storage = MemoryStorage(snapshot_path=snapshot_path)
+    await storage.connect()
+    assert await storage.is_user_restricted(1) is True
+    assert await storage.is_user_banned(2) is True
+    assert (await storage.get_stats())['total_restricted'] == 1
+    assert [event['event'] for event in await storage.get_events(user_id=1)] == ['restrict']
+    assert await storage.get_pending_actions() == [action]
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_events(memory_storage):
+    """Тест журнала событий в памяти."""
+    await memory_storage.log_event('join', user_id=1)
+    await memory_storage.log_event('restrict', user_id=1)
+    await memory_storage.log_event('join', user_id=2)
+    memory_storage.events[0]['created_at'] -= 100 * SECONDS_PER_DAY
+    
+    assert [event['event'] for event in await memory_storage.get_events(user_id=1)] == ['restrict', 'join']
+    assert (await memory_storage.count_events(since=utc_timestamp() - 60))['join'] == 1
+    assert await memory_storage.purge_events(90) == 1
+    assert len(memory_storage.events) == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_storage_outbox(memory_storage):
+    """Тест очереди outbox в памяти."""
+    action = OutboxAction(0, 1, 'expire', None, 100, False)
+    assert await memory_storage.enqueue_actions([action]) == 1
+    assert await memory_storage.enqueue_actions([action]) == 0
+    await memory_storage.complete_actions([action])
+    assert [pending.done for pending in await memory_storage.get_pending_actions()] == [True]
+    await memory_storage.finish_actions([action])
+    assert await memory_storage.get_pending_actions() == []
+
@@ -0,0 +1,48 @@
+"""
+Тесты для модуля metrics.py
+"""
+import pytest
+
+from src.metrics import LatencyStats, percentile, timed
+
+
+def test_percentile_nearest_rank():
+    """Тест перцентиля по методу ближайшего ранга."""
+    samples = [float(value) for value in range(1, 101)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 95) == 95.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([], 50) == 0.0
+
+
+def test_latency_stats_window():
+    """Тест скользящего окна: перцентили по последним замерам, счетчик и максимум за все время."""
+    stats = LatencyStats(window=10)
+    stats.record('query', 1000.0)
+    for _ in range(10):
+        stats.record('query', 1.0)
+    
+    summary = stats.summary()['query']
+    assert summary['count'] == 11
+    assert summary['p99'] == 1.0
+    assert summary['max'] == 1000.0
+    
+    stats.reset()
+    assert stats.summary() == {}
+
+
+@pytest.mark.asyncio
+async def test_timed_records_exceptions():
+    """Тест декоратора timed: вызов учитывается и при исключении."""
+    class Storage:
+        def __init__(self):
+            self.query_stats = LatencyStats()
+        
+        @timed
+        async def fail(self):
+            raise RuntimeError("fail")
+    
+    storage = Storage()
+    with pytest.raises(RuntimeError):
+        await storage.fail()
+    assert storage.query_stats.summary()['fail']['count'] == 1
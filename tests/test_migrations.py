@@ -0,0 +1,103 @@
+"""
+Тесты для модуля migrations.py
+"""
+import pytest
+import aiosqlite
+
+from src.migrations import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    Migration,
+    get_schema_version,
+    run_migrations,
+    run_backfills,
+)
+
+
+@pytest.fixture
+async def connection(tmp_path):
+    """
+    Создать соединение с пустой временной базой данных.
+    """
+    connection = await aiosqlite.connect(str(tmp_path / "migrations.db"))
+    
+    yield connection
+    
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_run_migrations_sets_user_version(connection):
+    """Тест применения всех шагов и записи версии схемы."""
+    await run_migrations(connection)
+    
+    assert await get_schema_version(connection) == SCHEMA_VERSION
+    cursor = await connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {row[0] for row in await cursor.fetchall()}
+    assert {'restricted_users', 'banned_users', 'counters', 'pending_backfills'} <= tables
+
+
+@pytest.mark.asyncio
+async def test_run_migrations_idempotent(connection):
+    """Тест повторного запуска миграций без изменений."""
+    calls = []
+    
+    async def apply(conn):
+        calls.append(1)
+    
+    migrations = MIGRATIONS + [Migration(SCHEMA_VERSION + 1, "тестовый шаг", apply=apply)]
+    await run_migrations(connection, migrations)
+    await run_migrations(connection, migrations)
+    
+    assert calls == [1]
+    assert await get_schema_version(connection) == SCHEMA_VERSION + 1
+
+
+@pytest.mark.asyncio
+async def test_run_migrations_rolls_back_failed_step(connection):
+    """Тест отката шага миграции с ошибкой."""
+    async def apply(conn):
+        await conn.execute("CREATE TABLE broken (id INTEGER)")
+        raise RuntimeError("fail")
+    
+    migrations = MIGRATIONS + [Migration(SCHEMA_VERSION + 1, "шаг с ошибкой", apply=apply)]
+    with pytest.raises(RuntimeError):
+        await run_migrations(connection, migrations)
+    
+    assert await get_schema_version(connection) == SCHEMA_VERSION
+    cursor = await connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'broken'")
+    assert await cursor.fetchone() is None
+
+
+@pytest.mark.asyncio
+async def test_run_backfills_in_batches(connection):
+    """Тест фонового заполнения данных пачками."""
+    await run_migrations(connection)
+    await run_backfills(connection, batch_size=4)
+    await connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, done INTEGER NOT NULL)")
+    await connection.executemany("INSERT INTO items VALUES (?, 0)", [(i,) for i in range(10)])
+    await connection.commit()
+    
+    batches = []
+    
+    async def backfill(conn, batch_size):
+        cursor = await conn.execute(
+            "UPDATE items SET done = 1 WHERE id IN (SELECT id FROM items WHERE done = 0 LIMIT ?)",
+            (batch_size,)
+        )
+        batches.append(cursor.rowcount)
+        return cursor.rowcount
+    
+    migrations = MIGRATIONS + [Migration(SCHEMA_VERSION + 1, "заполнение items", backfill=backfill)]
+    await run_migrations(connection, migrations)
+    
+    cursor = await connection.execute("SELECT version FROM pending_backfills")
+    assert await cursor.fetchall() == [(SCHEMA_VERSION + 1,)]
+    
+    await run_backfills(connection, batch_size=4, migrations=migrations)
+    
+    assert batches == [4, 4, 2, 0]
+    cursor = await connection.execute("SELECT COUNT(*) FROM items WHERE done = 0")
+    assert (await cursor.fetchone())[0] == 0
+    cursor = await connection.execute("SELECT COUNT(*) FROM pending_backfills")
+    assert (await cursor.fetchone())[0] == 0
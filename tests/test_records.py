@@ -0,0 +1,25 @@
+"""
+Тесты для модуля records.py
+"""
+import sqlite3
+
+from src.records import BannedUser, RestrictedUser, TABLE_RECORDS, record_factory
+
+
+def test_record_factory_builds_records():
+    """Тест фабрики строк: столбцы запроса становятся полями записи."""
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = record_factory(BannedUser)
+    row = connection.execute("SELECT -1001, 1, 'user', NULL, NULL, 100, 'spam'").fetchone()
+    connection.close()
+    
+    assert isinstance(row, BannedUser)
+    assert (row.group_id, row.user_id, row.reason) == (-1001, 1, 'spam')
+    assert row._asdict()['banned_at'] == 100
+
+
+def test_records_have_no_instance_dict():
+    """Тест компактности записей: у экземпляров нет словаря атрибутов."""
+    user = RestrictedUser(0, 1, None, None, None, 100, 100, 200)
+    assert not hasattr(user, '__dict__')
+    assert TABLE_RECORDS['restricted_users'] is RestrictedUser
@@ -0,0 +1,120 @@
+"""
+Тесты для модуля sharding.py
+"""
+import os
+import pytest
+
+from src.database import utc_timestamp, SECONDS_PER_DAY
+from src.sharding import ShardedDatabase, existing_shard_counts, shard_path
+
+
+@pytest.fixture
+async def sharded_db(tmp_path):
+    """
+    Создать хранилище из трех шардов во временном каталоге.
+    """
+    db = ShardedDatabase(str(tmp_path / "bot.db"), 3)
+    await db.connect()
+    
+    yield db
+    
+    await db.close()
+
+
+async def age_restrictions(db, user_ids, days):
+    """Сдвинуть срок окончания ограничения пользователей в прошлое на days дней плюс user_id секунд."""
+    for user_id in user_ids:
+        shard = db._shard(user_id)
+        await shard.connection.execute(
+            "UPDATE restricted_users SET expires_at = ? WHERE user_id = ?",
+            (utc_timestamp() - days * SECONDS_PER_DAY - user_id, user_id)
+        )
+        await shard.connection.commit()
+
+
+def test_shard_path(tmp_path):
+    """Тест именования файлов шардов."""
+    assert shard_path("data/bot.db", 1, 4) == "data/bot.1-of-4.db"
+    
+    db_path = str(tmp_path / "bot.db")
+    open(shard_path(db_path, 0, 2), 'w').close()
+    open(str(tmp_path / "other.0-of-8.db"), 'w').close()
+    assert existing_shard_counts(db_path) == [2]
+
+
+@pytest.mark.asyncio
+async def test_sharded_routing(sharded_db, tmp_path):
+    """Тест распределения пользователей по шардам по user_id."""
+    for user_id in range(1, 7):
+        assert await sharded_db.add_restricted_user(user_id=user_id) is True
+    await sharded_db.add_banned_user(user_id=7)
+    
+    assert sorted(os.listdir(tmp_path)) == ["bot.0-of-3.db", "bot.1-of-3.db", "bot.2-of-3.db"]
+    for index, shard in enumerate(sharded_db.shards):
+        cursor = await shard.connection.execute("SELECT user_id FROM restricted_users ORDER BY user_id")
+        assert [row[0] for row in await cursor.fetchall()] == [user_id for user_id in range(1, 7) if user_id % 3 == index]
+    
+    assert await sharded_db.add_restricted_users([(8, None, None, None), (1, "one", None, None), (9, None, None, None)]) == [8, 9]
+    assert await sharded_db.remove_restricted_user(8) is True
+    assert await sharded_db.remove_restricted_user(9) is True
+    assert await sharded_db.is_user_restricted(5) is True
+    assert await sharded_db.is_user_banned(7) is True
+    assert await sharded_db.remove_restricted_user(5) is True
+    assert await sharded_db.is_user_restricted(5) is False
+    
+    stats = await sharded_db.get_stats()
+    assert stats['restricted_users'] == 5
+    assert stats['banned_users'] == 1
+    assert stats['total_restricted'] == 8
+
+
+@pytest.mark.asyncio
+async def test_sharded_expired_restrictions_merge(sharded_db):
+    """Тест слияния истекших ограничений шардов в общем порядке и постраничного обхода."""
+    for user_id in range(1, 8):
+        await sharded_db.add_restricted_user(user_id=user_id)
+    await age_restrictions(sharded_db, [1, 2, 3, 4, 5, 6], days=1)
+    
+    # Чем больше user_id, тем раньше ограничение
+    expired = await sharded_db.get_expired_restrictions()
+    assert [user.user_id for user in expired] == [6, 5, 4, 3, 2, 1]
+    
+    first_page = await sharded_db.get_expired_restrictions(limit=4)
+    assert [user.user_id for user in first_page] == [6, 5, 4, 3]
+    last = first_page[-1]
+    second_page = await sharded_db.get_expired_restrictions(limit=4, after=(last.expires_at, last.user_id))
+    assert [user.user_id for user in second_page] == [2, 1]
+    
+    seen = []
+    async for user in sharded_db.iter_expired_restrictions(batch_size=1):
+        seen.append(user.user_id)
+    assert seen == [6, 5, 4, 3, 2, 1]
+    
+    assert await sharded_db.expire_restricted_users(seen) == 6
+    assert await sharded_db.get_expired_restrictions() == []
+    stats = await sharded_db.get_stats()
+    assert (stats['banned_users'], stats['total_expired']) == (6, 6)
+
+
+@pytest.mark.asyncio
+async def test_sharded_events(sharded_db):
+    """Тест журнала событий в шардах пользователей."""
+    for user_id in (1, 2, 3):
+        await sharded_db.log_event('join', user_id=user_id)
+    await sharded_db.log_event('restrict', user_id=2)
+    
+    assert [event['event'] for event in await sharded_db.get_events(user_id=2)] == ['restrict', 'join']
+    assert len(await sharded_db.get_events(limit=3)) == 3
+    assert (await sharded_db.count_events(since=0))['join'] == 3
+
+
+@pytest.mark.asyncio
+async def test_sharded_rejects_other_shard_count(tmp_path):
+    """Тест отказа от запуска с другим количеством шардов."""
+    db = ShardedDatabase(str(tmp_path / "bot.db"), 2)
+    await db.connect()
+    await db.close()
+    
+    db = ShardedDatabase(str(tmp_path / "bot.db"), 3)
+    with pytest.raises(ValueError):
+        await db.connect()
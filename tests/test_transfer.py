@@ -0,0 +1,128 @@
+"""
+Тесты для модуля transfer.py
+"""
+import json
+from unittest.mock import patch
+
+import pytest
+
+from src.database import Database, SECONDS_PER_DAY
+from src import transfer
+from src.transfer import normalize_row, parse_args, run
+
+
+@pytest.mark.asyncio
+async def test_import_export_csv_roundtrip(tmp_path):
+    """Тест импорта и экспорта забаненных в CSV."""
+    source = tmp_path / "bans.csv"
+    source.write_text(
+        "user_id,username,first_name,last_name,banned_at,reason\n"
+        "1,spammer,Spam,,1700000000,Spam\n"
+        "2,,,,2023-11-14T22:13:20,\n",
+        encoding='utf-8'
+    )
+    db_path = str(tmp_path / "bot.db")
+    
+    assert await run(parse_args(['import', 'banned_users', str(source), '--db', db_path, '--chunk-size', '1'])) == 2
+    
+    target = tmp_path / "export.csv"
+    assert await run(parse_args(['export', 'banned_users', str(target), '--db', db_path])) == 2
+    lines = target.read_text(encoding='utf-8').splitlines()
+    assert lines[0] == "group_id,user_id,username,first_name,last_name,banned_at,reason"
+    assert lines[1] == "0,1,spammer,Spam,,1700000000,Spam"
+    assert lines[2] == "0,2,,,,1700000000,"
+
+
+@pytest.mark.asyncio
+async def test_import_export_sharded(tmp_path):
+    """Тест переноса данных из одной базы в базу с шардами."""
+    source = tmp_path / "bans.jsonl"
+    source.write_text("".join(f'{{"user_id": {user_id}}}\n' for user_id in (5, 1, 4, 2, 3)), encoding='utf-8')
+    db_path = str(tmp_path / "bot.db")
+    
+    assert await run(parse_args(['import', 'banned_users', str(source), '--db', db_path, '--shards', '2'])) == 5
+    assert sorted(path.name for path in tmp_path.glob("bot.*-of-2.db")) == ["bot.0-of-2.db", "bot.1-of-2.db"]
+    
+    target = tmp_path / "export.jsonl"
+    assert await run(parse_args(['export', 'banned_users', str(target), '--db', db_path, '--shards', '2'])) == 5
+    exported = [json.loads(line)['user_id'] for line in target.read_text(encoding='utf-8').splitlines()]
+    assert exported == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_import_jsonl_upsert(tmp_path):
+    """Тест обновления существующих записей при импорте JSONL."""
+    db_path = str(tmp_path / "bot.db")
+    db = Database(db_path)
+    await db.connect()
+    await db.add_restricted_user(user_id=1, username="old")
+    await db.close()
+    
+    source = tmp_path / "watch.jsonl"
+    source.write_text(
+        json.dumps({'user_id': 1, 'username': 'new', 'restricted_at': 100, 'joined_at': 100}) + "\n"
+        + json.dumps({'user_id': 2, 'username': 'second'}) + "\n",
+        encoding='utf-8'
+    )
+    assert await run(parse_args(['import', 'restricted_users', str(source), '--db', db_path])) == 2
+    
+    db = Database(db_path)
+    await db.connect()
+    rows = [row async for row in db.iter_rows('restricted_users')]
+    stats = await db.get_stats()
+    await db.close()
+    
+    assert [(row.user_id, row.username) for row in rows] == [(1, 'new'), (2, 'second')]
+    assert rows[0].restricted_at == 100
+    # Срок окончания без значения в файле считается от даты ограничения
+    assert rows[0].expires_at == 100 + 30 * SECONDS_PER_DAY
+    assert stats['restricted_users'] == 2
+
+
+@pytest.mark.asyncio
+async def test_import_waits_for_backfills(tmp_path):
+    """Тест переноса только после завершения фоновых заполнений миграций во всех шардах."""
+    source = tmp_path / "bans.jsonl"
+    source.write_text(json.dumps({'user_id': 1, 'banned_at': 1}) + "\n", encoding='utf-8')
+    import_file = transfer.import_file
+    
+    async def checked_import(db, *args):
+        assert all(shard.migration_task.done() for shard in db.shards)
+        return await import_file(db, *args)
+    
+    with patch.object(transfer, 'import_file', checked_import):
+        args = parse_args(['import', 'banned_users', str(source), '--db', str(tmp_path / "bot.db"), '--shards', '2'])
+        assert await run(args) == 1
+
+
+@pytest.mark.asyncio
+async def test_import_bans_invalidates_bloom(tmp_path):
+    """Тест удаления сохраненного фильтра Блума после импорта банов."""
+    db_path = str(tmp_path / "bot.db")
+    db = Database(db_path, bloom_capacity=100)
+    await db.connect()
+    await db.close()
+    bloom_path = tmp_path / "bot.db.bloom"
+    assert bloom_path.exists()
+    
+    source = tmp_path / "bans.jsonl"
+    source.write_text(json.dumps({'user_id': 5, 'banned_at': 1}) + "\n", encoding='utf-8')
+    await run(parse_args(['import', 'banned_users', str(source), '--db', db_path]))
+    assert not bloom_path.exists()
+    
+    db = Database(db_path, bloom_capacity=100)
+    await db.connect()
+    assert await db.is_user_banned(5) is True
+    await db.close()
+
+
+def test_normalize_row_group_id():
+    """Тест группы по умолчанию для строк без group_id."""
+    assert normalize_row('banned_users', {'user_id': '1'}, 0, -1001)['group_id'] == -1001
+    assert normalize_row('banned_users', {'user_id': '1', 'group_id': '-1002'}, 0, -1001)['group_id'] == -1002
+
+
+def test_normalize_row_requires_user_id():
+    """Тест отказа импортировать строку без user_id."""
+    with pytest.raises(ValueError):
+        normalize_row('banned_users', {'username': 'x'}, 0)